@@ -0,0 +1,203 @@
+# backtest.py
+# Rolling-origin backtests of the city-wide Prophet forecasts. Every fold
+# fits on the history up to its origin (expanding, or a fixed rolling
+# window) and forecasts the next `horizon` steps. Folds are split into
+# contiguous chains that run in parallel; inside a chain each fit starts
+# from the previous fold's parameters. MAPE/MAE/RMSE per horizon step go to
+# prophet_models/forecast_metrics.csv, which the Streamlit app displays.
+# --engine holt_winters / snaive backtests the fast_forecast.py engines instead.
+import os
+import time
+import logging
+import argparse
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from count_cube import load_cube, series
+from forecast_prophet import FREQ_MAP, _init_worker, completed, warm_init
+
+BASE_DIR = r"D:\crime_project2"
+PROPHET_DIR = os.path.join(BASE_DIR, "prophet_models")
+METRICS_FILE = os.path.join(PROPHET_DIR, "forecast_metrics.csv")
+FOLDS_FILE = os.path.join(PROPHET_DIR, "backtest_folds.csv")
+
+# period -> (horizon, folds, step between origins)
+DEFAULTS = {"M": (12, 24, 1), "Q": (8, 12, 1), "A": (3, 6, 1)}
+
+
+# ---------------------------
+# FOLDS
+# ---------------------------
+def origins(n_points, horizon, folds, step=1, min_train=None):
+    """Index of the first forecast point of each fold, oldest first; every fold has a full horizon."""
+    min_train = min_train or max(2 * horizon, 3)
+    last = n_points - horizon
+    return sorted(o for o in (last - i * step for i in range(folds)) if o >= min_train)
+
+
+def run_chain(ts, fold_origins, horizon, window=None, warm=True):
+    """Fit/forecast the folds in order, each warm-started from the one before; one row per (fold, step)."""
+    from prophet import Prophet
+    logging.getLogger("cmdstanpy").setLevel(logging.WARNING)
+
+    rows, prev = [], None
+    for origin in fold_origins:
+        train = ts.iloc[max(0, origin - window) if window else 0:origin]
+        test = ts.iloc[origin:origin + horizon]
+
+        start = time.time()
+        m = Prophet()
+        if warm and prev is not None:
+            m.fit(train, init=warm_init(prev))
+        else:
+            m.fit(train)
+        fit_seconds = time.time() - start
+
+        fc = m.predict(test[["ds"]])
+        for step, (ds, y, yhat) in enumerate(zip(test["ds"], test["y"], fc["yhat"]), 1):
+            rows.append({"origin": ts["ds"].iloc[origin - 1], "train_points": len(train), "horizon": step,
+                         "ds": ds, "y": float(y), "yhat": float(yhat),
+                         "warm": prev is not None and warm, "fit_seconds": round(fit_seconds, 3)})
+        prev = m
+    return rows
+
+
+def run_fast_folds(ts, fold_origins, horizon, period, engine, window=None):
+    """Same rows as run_chain, from a fast_forecast engine (no fitting cost to amortise, so no chains)."""
+    from fast_forecast import run_engine
+
+    rows = []
+    for origin in fold_origins:
+        train = ts.iloc[max(0, origin - window) if window else 0:origin]
+        test = ts.iloc[origin:origin + horizon]
+        start = time.time()
+        res = run_engine(engine, train["y"].to_numpy()[None, :], horizon, period)
+        fit_seconds = time.time() - start
+        for step, (ds, y, yhat) in enumerate(zip(test["ds"], test["y"], res["yhat"][0]), 1):
+            rows.append({"origin": ts["ds"].iloc[origin - 1], "train_points": len(train), "horizon": step,
+                         "ds": ds, "y": float(y), "yhat": float(yhat),
+                         "warm": False, "fit_seconds": round(fit_seconds, 4)})
+    return rows
+
+
+# ---------------------------
+# METRICS
+# ---------------------------
+def horizon_metrics(folds):
+    """MAPE (%), MAE and RMSE for every horizon step of a backtest."""
+    err = folds["y"] - folds["yhat"]
+    ape = (err.abs() / folds["y"].where(folds["y"] != 0)) * 100
+    grouped = pd.DataFrame({"horizon": folds["horizon"], "ae": err.abs(), "se": err ** 2, "ape": ape}).groupby("horizon")
+    out = pd.DataFrame({
+        "mape": grouped["ape"].mean(),
+        "mae": grouped["ae"].mean(),
+        "rmse": np.sqrt(grouped["se"].mean()),
+        "folds": grouped.size(),
+    }).reset_index()
+    return out.round({"mape": 3, "mae": 3, "rmse": 3})
+
+
+def backtest(period="M", horizon=None, folds=None, step=None, mode="expanding", window=None,
+             workers=None, warm=True, base_dir=None, engine="prophet"):
+    """Rolling-origin backtest of the city series for one period; returns (fold rows, horizon metrics)."""
+    d_horizon, d_folds, d_step = DEFAULTS[period]
+    horizon, folds, step = horizon or d_horizon, folds or d_folds, step or d_step
+    cube = load_cube(base_dir or BASE_DIR)
+    # The unfinished trailing period would be scored as a real (too low) count
+    ts = completed(series(FREQ_MAP[period], cube=cube), cube["day"].max())
+    if mode == "rolling":
+        window = window or max(3 * horizon, len(ts) // 2)
+    else:
+        window = None
+
+    fold_origins = origins(len(ts), horizon, folds, step, min_train=window)
+    if not fold_origins:
+        print(f"⚠ {period}: {len(ts)} points is too short for a {horizon}-step backtest")
+        return pd.DataFrame(), pd.DataFrame()
+
+    if engine != "prophet":
+        start = time.time()
+        rows = run_fast_folds(ts, fold_origins, horizon, period, engine, window)
+        return _summarise(rows, period, mode, engine, len(fold_origins), start)
+
+    cores = os.cpu_count() or 1
+    workers = max(1, min(workers or cores, len(fold_origins)))
+    # Contiguous chains, so consecutive folds (similar histories) share a warm start
+    chains = [[int(o) for o in c] for c in np.array_split(fold_origins, workers) if len(c)]
+    print(f"Backtest {period}: {len(fold_origins)} {mode} folds × {horizon} steps, {len(chains)} chain(s)")
+
+    start = time.time()
+    if len(chains) == 1:
+        rows = run_chain(ts, chains[0], horizon, window, warm)
+    else:
+        threads = max(1, cores // len(chains))
+        ctx = mp.get_context("spawn")
+        with ProcessPoolExecutor(len(chains), mp_context=ctx, initializer=_init_worker, initargs=(threads,)) as pool:
+            futures = [pool.submit(run_chain, ts, chain, horizon, window, warm) for chain in chains]
+            rows = [row for fut in futures for row in fut.result()]
+    return _summarise(rows, period, mode, engine, len(fold_origins), start)
+
+
+def _summarise(rows, period, mode, engine, n_folds, start):
+    fold_rows = pd.DataFrame(rows)
+    fold_rows.insert(0, "period", period)
+    fold_rows.insert(1, "engine", engine)
+    metrics = horizon_metrics(fold_rows)
+    metrics.insert(0, "period", period)
+    metrics.insert(1, "freq", FREQ_MAP[period])
+    metrics["mode"] = mode
+    metrics["engine"] = engine
+    print(f"✔ {period} ({engine}): MAPE {metrics['mape'].mean():.2f}% over {n_folds} folds "
+          f"in {time.time() - start:.1f}s")
+    return fold_rows, metrics
+
+
+def _replace_engine(path, new, engine):
+    # Results of other engines already in the file are kept
+    if os.path.exists(path):
+        old = pd.read_csv(path)
+        if "engine" not in old.columns:
+            old["engine"] = "prophet"
+        new = pd.concat([old[old["engine"] != engine], new], ignore_index=True)
+    new.to_csv(path, index=False)
+    return new
+
+
+def run_backtests(periods=("M", "Q", "A"), mode="expanding", workers=None, warm=True, base_dir=None,
+                  engine="prophet"):
+    """Backtest every period with `engine` and update its rows in the metrics and fold tables."""
+    all_folds, all_metrics = [], []
+    for period in periods:
+        folds, metrics = backtest(period, mode=mode, workers=workers, warm=warm, base_dir=base_dir, engine=engine)
+        all_folds.append(folds)
+        all_metrics.append(metrics)
+
+    metrics = pd.concat(all_metrics, ignore_index=True)
+    metrics["generated_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+    os.makedirs(os.path.dirname(METRICS_FILE), exist_ok=True)
+    _replace_engine(METRICS_FILE, metrics, engine)
+    _replace_engine(FOLDS_FILE, pd.concat(all_folds, ignore_index=True), engine)
+    print(f"✔ Metrics → {METRICS_FILE}")
+    return metrics
+
+
+def accuracy(metrics, period, engine="prophet"):
+    """Headline accuracy for a period: 100 - mean MAPE over its horizon steps (None if not backtested)."""
+    rows = metrics[(metrics["period"] == period) & (metrics.get("engine", "prophet") == engine)]
+    if rows.empty or rows["mape"].isna().all():
+        return None
+    return 100 - rows["mape"].mean()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--periods", nargs="*", default=["M", "Q", "A"], choices=list(FREQ_MAP))
+    parser.add_argument("--mode", choices=["expanding", "rolling"], default="expanding")
+    parser.add_argument("--workers", type=int, help="parallel fold chains (default: cores)")
+    parser.add_argument("--cold", action="store_true", help="fit every fold from scratch (no warm start)")
+    parser.add_argument("--engine", default="prophet", choices=["prophet", "holt_winters", "snaive"])
+    args = parser.parse_args()
+    print(run_backtests(args.periods, args.mode, args.workers, warm=not args.cold,
+                        engine=args.engine).to_string(index=False))
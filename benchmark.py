@@ -0,0 +1,267 @@
+# benchmark.py
+# End-to-end benchmark: generates a synthetic dataset of the requested size,
+# runs every stage on it in a fresh process (so peak memory is per stage),
+# and saves timings/memory as JSON that later runs can be compared against.
+import os
+import sys
+import json
+import time
+import glob
+import argparse
+import platform
+import subprocess
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from profiling import peak_rss_mb, reset_peak_rss
+from synthetic_data import SIZES, parse_size, write_raw_csv
+
+BASE_DIR = r"D:\crime_project2"
+BENCH_DIR = os.path.join(BASE_DIR, "benchmarks")
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+STAGES = [
+    "preprocess", "location_mapping", "clustering", "train_lgbm", "risk_grid", "location_model",
+    "prophet", "prophet_all", "hotspots", "grid_hotspots", "map", "predict_single", "predict_batch"
+]
+SINGLE_CALLS = 200
+BATCH_ROWS = 100_000
+
+
+# ---------------------------
+# REDIRECT MODULE PATHS
+# ---------------------------
+def point_modules_at(work_dir, modules):
+    """Re-root every BASE_DIR-derived path constant of `modules` under work_dir."""
+    for mod in modules:
+        old = mod.BASE_DIR
+        for name, value in list(vars(mod).items()):
+            if name.isupper() and isinstance(value, str) and value.startswith(old):
+                setattr(mod, name, work_dir + value[len(old):])
+                if name.endswith("_DIR"):
+                    os.makedirs(getattr(mod, name), exist_ok=True)
+
+
+# ---------------------------
+# STAGES: setup (untimed) returns the timed callable and its row count
+# ---------------------------
+def _setup(name, work_dir, raw_csv):
+    import dataset
+
+    if name == "preprocess":
+        import preprocess
+        point_modules_at(work_dir, [preprocess])
+        return lambda: preprocess.preprocess_streaming(raw_csv, preprocess.CLEAN_DIR), None
+
+    if name == "location_mapping":
+        from category_map import map_location_group
+        col = dataset.load_crimes(["location_description"], base_dir=work_dir)["location_description"].astype(str)
+        return lambda: map_location_group(col), len(col)
+
+    if name == "clustering":
+        from spatial_clusters import fit_spatial_kmeans, nearest_center
+        coords = dataset.load_crimes(["latitude", "longitude"], base_dir=work_dir).to_numpy(dtype=np.float64)
+
+        def run():
+            kmeans = fit_spatial_kmeans(coords, n_clusters=30, mode="minibatch")
+            nearest_center(coords, kmeans.cluster_centers_)
+        return run, len(coords)
+
+    if name == "train_lgbm":
+        import train_models
+        point_modules_at(work_dir, [train_models])
+        return train_models.train, None
+
+    if name == "risk_grid":
+        import risk_grid
+        point_modules_at(work_dir, [risk_grid])
+        return risk_grid.build_risk_grid, None
+
+    if name == "location_model":
+        import train_location
+        point_modules_at(work_dir, [train_location])
+        return train_location.build_resolver, None
+
+    if name in ("prophet", "prophet_all"):
+        import forecast_prophet
+        point_modules_at(work_dir, [forecast_prophet])
+        if name == "prophet_all":
+            return lambda: forecast_prophet.train_all(["M"]), None
+        return lambda: forecast_prophet.train_prophet("M"), None
+
+    if name == "hotspots":
+        import hotspot_cluster
+        return lambda: hotspot_cluster.find_hotspots(30, base_dir=work_dir), None
+
+    if name == "grid_hotspots":
+        import grid_hotspots
+        return lambda: grid_hotspots.build_pyramid(work_dir), None
+
+    if name == "map":
+        import map_generate
+        return lambda: map_generate.create_heatmap(base_dir=work_dir), None
+
+    if name in ("predict_single", "predict_batch"):
+        import predict
+        point_modules_at(work_dir, [predict])
+        predict.registry().get("crime_model")          # load outside the timed part
+
+        if name == "predict_single":
+            def run():
+                # Every (day, hour) pair is distinct, so each call misses the cache
+                for i in range(SINGLE_CALLS):
+                    predict.predict_crime(2024, 6, 1 + i // 24, i % 24, 1113, 11, 29, 35)
+            return run, SINGLE_CALLS
+
+        df = dataset.sample_crimes(BATCH_ROWS, base_dir=work_dir, random_state=0)
+        return lambda: predict.predict_batch(df), len(df)
+
+    raise ValueError(f"unknown stage {name}")
+
+
+def run_stage(name, work_dir, raw_csv):
+    func, rows = _setup(name, work_dir, raw_csv)
+    setup_peak = peak_rss_mb()
+    # From here the peak covers only the timed call (where the OS can reset it)
+    reset_peak_rss()
+
+    start = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start
+
+    result = {
+        "seconds": round(seconds, 3),
+        "peak_rss_mb": round(peak_rss_mb() or 0, 1),
+        "setup_peak_rss_mb": round(setup_peak or 0, 1),
+    }
+    if rows:
+        result["rows"] = rows
+        result["rows_per_s"] = round(rows / seconds, 1)
+    if name == "predict_single":
+        result["latency_ms"] = round(seconds / SINGLE_CALLS * 1000, 3)
+    return result
+
+
+# ---------------------------
+# HARNESS
+# ---------------------------
+def run_meta(rows):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=CODE_DIR,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    versions = {}
+    for pkg in ["numpy", "pandas", "pyarrow", "sklearn", "lightgbm", "prophet"]:
+        try:
+            versions[pkg] = __import__(pkg).__version__
+        except Exception:
+            versions[pkg] = None
+
+    return {
+        "rows": rows,
+        "commit": commit,
+        "started_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "versions": versions,
+    }
+
+
+def run_benchmark(rows, stages=None, work_dir=None, isolate=True, keep_data=True):
+    """Generate (or reuse) the synthetic raw CSV and run each stage, one process per stage."""
+    work_dir = work_dir or os.path.join(BENCH_DIR, f"work_{rows}")
+    raw_csv = os.path.join(work_dir, "raw.csv")
+    os.makedirs(os.path.join(work_dir, "models"), exist_ok=True)
+
+    results = {"meta": run_meta(rows), "stages": {}}
+
+    if not (keep_data and os.path.exists(raw_csv)):
+        start = time.perf_counter()
+        write_raw_csv(rows, raw_csv)
+        results["stages"]["generate"] = {"seconds": round(time.perf_counter() - start, 3)}
+
+    for name in stages or STAGES:
+        print(f"▶ {name} ({rows:,} rows)...")
+        try:
+            if isolate:
+                with ProcessPoolExecutor(1, mp_context=mp.get_context("spawn")) as pool:
+                    res = pool.submit(run_stage, name, work_dir, raw_csv).result()
+            else:
+                res = run_stage(name, work_dir, raw_csv)
+        except Exception as e:
+            res = {"error": f"{type(e).__name__}: {e}"}
+            print(f"  ⚠ {name} failed: {res['error']}")
+        else:
+            print(f"  ✔ {res['seconds']:.2f}s, peak {res['peak_rss_mb']:.0f} MB")
+        results["stages"][name] = res
+
+    return results
+
+
+def save_results(results, out_dir=BENCH_DIR):
+    os.makedirs(out_dir, exist_ok=True)
+    stamp = time.strftime("%Y%m%d_%H%M%S")
+    path = os.path.join(out_dir, f"bench_{results['meta']['rows']}_{stamp}.json")
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"✔ Results → {path}")
+    return path
+
+
+def latest_results(rows, out_dir=BENCH_DIR, exclude=None):
+    files = sorted(p for p in glob.glob(os.path.join(out_dir, f"bench_{rows}_*.json")) if p != exclude)
+    return files[-1] if files else None
+
+
+# ---------------------------
+# REGRESSION CHECK
+# ---------------------------
+def compare(current, baseline, tolerance=0.2, min_seconds=0.5):
+    """Stages that got slower or hungrier than `baseline` by more than `tolerance` (fraction)."""
+    regressions = []
+    print(f"{'stage':<18}{'base s':>10}{'now s':>10}{'ratio':>8}{'base MB':>10}{'now MB':>10}")
+    for name, now in current["stages"].items():
+        base = baseline["stages"].get(name)
+        if not base or "error" in now or "error" in base:
+            continue
+        ratio = now["seconds"] / base["seconds"] if base["seconds"] else float("inf")
+        flag = ""
+        if ratio > 1 + tolerance and now["seconds"] - base["seconds"] > min_seconds:
+            regressions.append((name, "seconds", base["seconds"], now["seconds"]))
+            flag = " ⚠ slower"
+        if base.get("peak_rss_mb") and now.get("peak_rss_mb", 0) > base["peak_rss_mb"] * (1 + tolerance):
+            regressions.append((name, "peak_rss_mb", base["peak_rss_mb"], now["peak_rss_mb"]))
+            flag += " ⚠ memory"
+        print(f"{name:<18}{base['seconds']:>10.2f}{now['seconds']:>10.2f}{ratio:>8.2f}"
+              f"{base.get('peak_rss_mb', 0):>10.0f}{now.get('peak_rss_mb', 0):>10.0f}{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", nargs="*", default=["100k"], help=f"{', '.join(SIZES)} or numbers")
+    parser.add_argument("--stages", nargs="*", choices=STAGES, help="default: all")
+    parser.add_argument("--work-dir", help="where synthetic data and stage outputs go")
+    parser.add_argument("--baseline", help="results JSON to compare with (default: previous run of the same size)")
+    parser.add_argument("--tolerance", default=0.2, type=float)
+    parser.add_argument("--no-isolate", action="store_true", help="run stages in this process")
+    args = parser.parse_args()
+
+    failed = False
+    for size in args.rows:
+        rows = parse_size(size)
+        work_dir = os.path.join(args.work_dir, str(rows)) if args.work_dir else None
+        results = run_benchmark(rows, args.stages, work_dir, isolate=not args.no_isolate)
+        path = save_results(results)
+
+        baseline_path = args.baseline or latest_results(rows, exclude=path)
+        if baseline_path:
+            with open(baseline_path) as f:
+                print(f"Compared with {baseline_path}:")
+                failed |= bool(compare(results, json.load(f), args.tolerance))
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,135 @@
+# category_map.py
+# Keyword rules for location_group / crime_group, evaluated once per distinct
+# raw value and applied to whole columns as categorical codes.
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+
+BASE_DIR = r"D:\crime_project2"
+MODEL_DIR = os.path.join(BASE_DIR, "models")
+LOOKUP_FILE = os.path.join(MODEL_DIR, "category_lookups.json")
+
+# ---------------------------
+# RULES (first match wins)
+# ---------------------------
+LOCATION_RULES = [
+    ("STREET", ["STREET", "SIDEWALK", "PARKING", "DRIVE"]),
+    ("RESIDENCE", ["RESIDENCE", "APARTMENT", "HOME", "HOUSE"]),
+    ("BUSINESS", ["BUSINESS", "STORE", "SHOP", "RESTAURANT", "COMMERCIAL"]),
+    ("PUBLIC", ["PUBLIC", "SCHOOL", "GOVERNMENT", "HOSPITAL"]),
+]
+LOCATION_GROUPS = ["BUSINESS", "OTHER", "PUBLIC", "RESIDENCE", "STREET", "UNKNOWN"]
+
+CRIME_RULES = [
+    ("VIOLENT_CRIME", [
+        "ASSAULT", "BATTERY", "HOMICIDE", "KIDNAPPING",
+        "CRIMINAL SEXUAL ASSAULT", "SEX OFFENSE",
+        "OFFENSE INVOLVING CHILDREN", "WEAPONS VIOLATION",
+        "DOMESTIC", "PUBLIC PEACE"
+    ]),
+    ("PROPERTY_CRIME", [
+        "THEFT", "BURGLARY", "MOTOR VEHICLE THEFT",
+        "CRIMINAL DAMAGE", "CRIMINAL TRESPASS",
+        "ARSON", "DECEPTIVE PRACTICE", "ROBBERY",
+        "SHOPLIFTING", "VANDALISM"
+    ]),
+]
+# Sorted, so codes line up with LabelEncoder().fit(CRIME_GROUPS)
+CRIME_GROUPS = ["OTHER_CRIME", "PROPERTY_CRIME", "VIOLENT_CRIME"]
+
+
+def apply_rules(value, rules, default):
+    value = str(value).upper()
+    for group, keywords in rules:
+        if any(k in value for k in keywords):
+            return group
+    return default
+
+
+# ---------------------------
+# MAPPING ENGINE
+# ---------------------------
+class CategoryMapper:
+    """Memoized rule mapping: raw value -> group, applied per distinct value."""
+
+    def __init__(self, rules, default, categories, missing=None):
+        self.rules = rules
+        self.default = default
+        self.missing = missing if missing is not None else default
+        self.categories = list(categories)
+        self.lookup = {}
+
+    def fingerprint(self):
+        """Hash of the rules, defaults and categories; a saved lookup is only valid for the same one."""
+        spec = json.dumps([self.rules, self.default, self.missing, self.categories])
+        return hashlib.sha1(spec.encode()).hexdigest()
+
+    def map_value(self, value):
+        if pd.isna(value):
+            return self.missing
+        key = str(value)
+        group = self.lookup.get(key)
+        if group is None:
+            group = apply_rules(key, self.rules, self.default)
+            self.lookup[key] = group
+        return group
+
+    def map_series(self, series):
+        # Rules run once per distinct value; rows only see an integer gather
+        codes, uniques = pd.factorize(series, use_na_sentinel=True)
+        unique_codes = pd.Categorical(
+            [self.map_value(u) for u in uniques], categories=self.categories
+        ).codes
+        missing_code = self.categories.index(self.missing)
+
+        group_codes = np.full(len(codes), missing_code, dtype=np.int8)
+        valid = codes >= 0
+        group_codes[valid] = unique_codes[codes[valid]]
+
+        return pd.Series(
+            pd.Categorical.from_codes(group_codes, categories=self.categories),
+            index=series.index,
+            name=series.name
+        )
+
+
+LOCATION_MAPPER = CategoryMapper(LOCATION_RULES, "OTHER", LOCATION_GROUPS, missing="UNKNOWN")
+CRIME_MAPPER = CategoryMapper(CRIME_RULES, "OTHER_CRIME", CRIME_GROUPS)
+
+MAPPERS = {"location_group": LOCATION_MAPPER, "crime_group": CRIME_MAPPER}
+
+
+def map_location_group(series):
+    return LOCATION_MAPPER.map_series(series)
+
+
+def map_crime_group(series):
+    return CRIME_MAPPER.map_series(series)
+
+
+# ---------------------------
+# PERSISTED LOOKUP TABLES
+# ---------------------------
+def save_lookups(path=LOOKUP_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tables = {name: {"rules_hash": m.fingerprint(), "lookup": m.lookup} for name, m in MAPPERS.items()}
+    with open(path + ".tmp", "w") as f:
+        json.dump(tables, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def load_lookups(path=LOOKUP_FILE):
+    if not os.path.exists(path):
+        return False
+    with open(path) as f:
+        tables = json.load(f)
+    for name, table in tables.items():
+        # Tables built under other rules (or saved without a hash) are dropped, not merged
+        if name in MAPPERS and table.get("rules_hash") == MAPPERS[name].fingerprint():
+            MAPPERS[name].lookup.update(table["lookup"])
+    return True
+
+
+load_lookups()
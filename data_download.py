@@ -1,9 +1,21 @@
-import requests, argparse, os, sys
+import requests, argparse, os, sys, io, json, time
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
 BASE_DIR = r"D:\crime_project2"
 os.makedirs(BASE_DIR, exist_ok=True)
 
+DATA_URL = "https://data.cityofchicago.org/resource/ijzp-q8t2.csv"
+STORE_DIR = os.path.join(BASE_DIR, "raw_store")
+STATE_FILE = "_ingest_state.json"
+INDEX_FILE = "_index.npz"
+
+
 def download_csv(output, limit):
-    url = f"https://data.cityofchicago.org/resource/ijzp-q8t2.csv?$limit={limit}"
+    url = f"{DATA_URL}?$limit={limit}"
     with requests.get(url, stream=True) as r:
         r.raise_for_status()
         with open(output, "wb") as f:
@@ -11,15 +23,288 @@ def download_csv(output, limit):
                 if chunk:
                     f.write(chunk)
 
+
+# ---------------------------
+# HTTP (pooled session + paging)
+# ---------------------------
+def make_session(pool_size=8, retries=5):
+    session = requests.Session()
+    retry = Retry(
+        total=retries,
+        backoff_factor=1,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"]
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def keyset_where(cursor):
+    """Rows strictly after `cursor` = (updated_on, id) in (updated_on, id) order."""
+    if cursor is None:
+        return None
+    updated, rid = cursor
+    return f"updated_on > '{updated}' OR (updated_on = '{updated}' AND id > {int(rid)})"
+
+
+def page_cursor(df, current):
+    # Last (updated_on, id) of a page; pages come sorted by both
+    if df.empty:
+        return current
+    last = df.iloc[-1]
+    return [last["updated_on"], int(last["id"])]
+
+
+def fetch_page(session, url, cursor, limit):
+    # Keyset paging on (updated_on, id): a record updated mid-pass moves past
+    # the cursor and is read again later, instead of shifting $offset pages
+    # and making the pass skip a row. id is the dataset's unique key.
+    params = {"$limit": limit, "$order": "updated_on, id"}
+    where = keyset_where(cursor)
+    if where:
+        params["$where"] = where
+
+    r = session.get(url, params=params, timeout=300)
+    r.raise_for_status()
+
+    if not r.content.strip():
+        return pd.DataFrame()
+
+    # Keep the raw store as text so merges never fight over dtypes
+    df = pd.read_csv(io.BytesIO(r.content), dtype=str, keep_default_na=False, na_values=[""])
+    df.columns = [c.lower() for c in df.columns]
+    return df
+
+
+# ---------------------------
+# PARTITIONED LOCAL STORE
+# ---------------------------
+def partition_path(store_dir, year):
+    return os.path.join(store_dir, f"year={year}.csv")
+
+
+def row_hashes(df):
+    return pd.util.hash_pandas_object(df, index=False).values
+
+
+def load_index(store_dir):
+    path = os.path.join(store_dir, INDEX_FILE)
+    if not os.path.exists(path):
+        return pd.Series(np.array([], dtype=np.uint64), index=pd.Index([], dtype=object), dtype=np.uint64)
+
+    data = np.load(path, allow_pickle=False)
+    return pd.Series(data["hashes"], index=pd.Index(data["ids"].astype(str)))
+
+
+def save_index(store_dir, index):
+    tmp = os.path.join(store_dir, "_index.tmp.npz")
+    np.savez(tmp, ids=index.index.to_numpy(dtype=str), hashes=index.values)
+    os.replace(tmp, os.path.join(store_dir, INDEX_FILE))
+
+
+def read_partition(path):
+    return pd.read_csv(path, dtype=str, keep_default_na=False, na_values=[""])
+
+
+def rewrite_partition(path, changed):
+    # Replace old versions of changed records, then swap the file in atomically
+    old = read_partition(path)
+    old = old[~old["id"].isin(changed["id"])]
+    merged = pd.concat([old, changed], ignore_index=True)
+
+    tmp = path + ".tmp"
+    merged.to_csv(tmp, index=False)
+    os.replace(tmp, path)
+
+
+def recover_partitions(store_dir, years, index):
+    """
+    Undo a crash between appending rows and saving the index: de-duplicate
+    the partitions that round touched on id (last copy wins) and index their
+    rows, so re-fetching the same page finds them already stored.
+    """
+    for year in years:
+        path = partition_path(store_dir, year)
+        if not os.path.exists(path):
+            continue
+        part = read_partition(path)
+        deduped = part.drop_duplicates(subset="id", keep="last")
+        if len(deduped) < len(part):
+            tmp = path + ".tmp"
+            deduped.to_csv(tmp, index=False)
+            os.replace(tmp, path)
+        hashes = pd.Series(row_hashes(deduped), index=pd.Index(deduped["id"].values))
+        index = pd.concat([index.drop(hashes.index, errors="ignore"), hashes])
+    return index
+
+
+def partition_years(df):
+    return df["date"].str[:4].fillna("unknown")
+
+
+def merge_into_store(df, store_dir, index):
+    """Append new records and rewrite only partitions holding changed records."""
+    if df.empty:
+        return index, 0, 0
+
+    df = df.drop_duplicates(subset="id", keep="last")
+    hashes = pd.Series(row_hashes(df), index=pd.Index(df["id"].values))
+    known = hashes.index.isin(index.index)
+
+    is_new = ~known
+    is_changed = np.zeros(len(df), dtype=bool)
+    if known.any():
+        old_hash = index.reindex(hashes.index[known]).values
+        is_changed[known] = old_hash != hashes.values[known]
+
+    years = partition_years(df)
+
+    for year, part in df[is_new].groupby(years[is_new]):
+        path = partition_path(store_dir, year)
+        part.to_csv(path, mode="a", index=False, header=not os.path.exists(path))
+
+    for year, part in df[is_changed].groupby(years[is_changed]):
+        path = partition_path(store_dir, year)
+        if os.path.exists(path):
+            rewrite_partition(path, part)
+        else:
+            part.to_csv(path, index=False)
+
+    touched = hashes[is_new | is_changed]
+    index = pd.concat([index.drop(touched.index, errors="ignore"), touched])
+    return index, int(is_new.sum()), int(is_changed.sum())
+
+
+# ---------------------------
+# INGEST STATE (resume + watermark)
+# ---------------------------
+def load_state(store_dir):
+    # watermark: (updated_on, id) reached by the last finished pass
+    # cursor: position of an unfinished pass; pending: partitions being written
+    path = os.path.join(store_dir, STATE_FILE)
+    state = {"watermark": None, "cursor": None, "pending": []}
+    if os.path.exists(path):
+        with open(path) as f:
+            state.update(json.load(f))
+    if isinstance(state["watermark"], str):
+        # Older state files kept only the updated_on watermark
+        state["watermark"] = [state["watermark"], 0]
+    return state
+
+
+def save_state(store_dir, state):
+    path = os.path.join(store_dir, STATE_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+# ---------------------------
+# INCREMENTAL PARALLEL INGEST
+# ---------------------------
+def ingest(url=DATA_URL, store_dir=STORE_DIR, page_size=50000, workers=4, use_watermark=True, session=None):
+    """
+    Page through the endpoint into a partitioned store (one CSV per year).
+
+    Pages are read in (updated_on, id) order, each starting after the last
+    row of the one before, while the previous page is merged. The cursor is
+    checkpointed after every page, so an interrupted run resumes where it
+    stopped; the partitions a page was being written to are recorded first
+    and de-duplicated on resume. A finished pass's cursor is the watermark
+    the next run starts from. `workers` sizes the HTTP connection pool.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    session = session or make_session(pool_size=workers)
+
+    state = load_state(store_dir)
+    index = load_index(store_dir)
+
+    if state["pending"]:
+        print(f"⚠ Previous run stopped while writing {state['pending']}, de-duplicating")
+        index = recover_partitions(store_dir, state["pending"], index)
+        save_index(store_dir, index)
+        state["pending"] = []
+        save_state(store_dir, state)
+
+    if state["cursor"] is not None:
+        cursor = state["cursor"]                     # resume an unfinished pass
+    else:
+        cursor = state["watermark"] if use_watermark else None
+
+    total_new, total_changed = 0, 0
+    start = time.time()
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        ahead = pool.submit(fetch_page, session, url, cursor, page_size)
+        while True:
+            page = ahead.result()
+            next_cursor = page_cursor(page, cursor)
+            done = len(page) < page_size
+            if not done:
+                # Fetch the next page while this one is merged
+                ahead = pool.submit(fetch_page, session, url, next_cursor, page_size)
+
+            state["pending"] = sorted(set(partition_years(page))) if not page.empty else []
+            save_state(store_dir, state)
+
+            index, n_new, n_changed = merge_into_store(page, store_dir, index)
+            total_new += n_new
+            total_changed += n_changed
+            save_index(store_dir, index)
+
+            cursor = next_cursor
+            state["pending"] = []
+            if done:
+                state.update({"watermark": cursor, "cursor": None})
+                save_state(store_dir, state)
+                break
+
+            state["cursor"] = cursor
+            save_state(store_dir, state)
+            print(f"  cursor {cursor}: +{total_new:,} new, {total_changed:,} changed")
+
+    print(f"✔ Ingest finished in {time.time() - start:.1f}s "
+          f"({total_new:,} new, {total_changed:,} changed rows)")
+    return total_new, total_changed
+
+
+def tail(url=DATA_URL, store_dir=STORE_DIR, batch_size=1000, interval=60, max_polls=None):
+    """Poll for records updated since the watermark in small batches."""
+    session = make_session(pool_size=1)
+    polls = 0
+    while max_polls is None or polls < max_polls:
+        ingest(url, store_dir, page_size=batch_size, workers=1, use_watermark=True, session=session)
+        polls += 1
+        if max_polls is None or polls < max_polls:
+            time.sleep(interval)
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=["full", "ingest", "tail"], default="full")
     parser.add_argument("--output", default=os.path.join(BASE_DIR, "chicago_crimes.csv"))
     parser.add_argument("--limit", default=500000, type=int)
+    parser.add_argument("--url", default=DATA_URL)
+    parser.add_argument("--store", default=STORE_DIR)
+    parser.add_argument("--page-size", default=50000, type=int)
+    parser.add_argument("--workers", default=4, type=int)
+    parser.add_argument("--no-watermark", action="store_true")
+    parser.add_argument("--interval", default=60, type=int)
     args = parser.parse_args()
-    print("Downloading to:", args.output)
+
     try:
-        download_csv(args.output, args.limit)
-        print("Downloaded:", args.output)
+        if args.mode == "ingest":
+            print("Ingesting into:", args.store)
+            ingest(args.url, args.store, args.page_size, args.workers, use_watermark=not args.no_watermark)
+        elif args.mode == "tail":
+            print("Tailing into:", args.store)
+            tail(args.url, args.store, batch_size=args.page_size, interval=args.interval)
+        else:
+            print("Downloading to:", args.output)
+            download_csv(args.output, args.limit)
+            print("Downloaded:", args.output)
     except Exception as e:
         print("Download failed:", e, file=sys.stderr)
         raise
@@ -0,0 +1,266 @@
+# dataset.py
+# Single access point for the cleaned crime table. The table lives as Parquet
+# partitioned by year (year=YYYY/part-N.parquet), read through memory-mapped
+# files with column projection and row filters pushed down into the scan.
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow import fs
+
+BASE_DIR = r"D:\crime_project2"
+STORE_NAME = "cleaned_crimes"          # Parquet directory, partitioned by year
+CSV_NAME = "cleaned_crimes.csv"        # legacy single-file output
+
+PARTITIONING = ds.partitioning(pa.schema([("year", pa.int32())]), flavor="hive")
+
+# ---------------------------
+# COMPACT SCHEMA
+# ---------------------------
+# Nullable ints where the source has gaps (ward/community_area are blank on
+# older records); float32 keeps coordinates to well under a metre.
+SCHEMA = {
+    "id": "int32",
+    "year": "int16",
+    "month": "int8",
+    "day": "int8",
+    "hour": "int8",
+    "day_of_week": "int8",
+    "is_weekend": "int8",
+    "season": "int8",
+    "hour_group": "int8",
+    "hotspot_area": "int8",
+    "beat": "Int16",
+    "district": "Int8",
+    "ward": "Int8",
+    "community_area": "Int8",
+    "spatial_cluster": "int16",
+    "latitude": "float32",
+    "longitude": "float32",
+    "x_coordinate": "float32",
+    "y_coordinate": "float32",
+    "arrest": "bool",
+    "domestic": "bool",
+}
+# Low-cardinality text: categorical in memory, dictionary-encoded on disk
+TEXT_COLUMNS = [
+    "primary_type", "description", "location_description", "location_group",
+    "iucr", "fbi_code", "block", "case_number"
+]
+
+
+def apply_schema(df, text_as_category=True):
+    """Cast known columns to the compact schema (in place where possible)."""
+    if "date" in df.columns and df["date"].dtype.kind != "M":
+        df["date"] = pd.to_datetime(df["date"], errors="coerce")
+
+    for col, dtype in SCHEMA.items():
+        if col not in df.columns or str(df[col].dtype) == dtype:
+            continue
+        if dtype[0] in "iI" and df[col].dtype.kind not in "iu":
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+        if dtype in ("bool",) or dtype[0] == "i":
+            df[col] = df[col].fillna(0)
+        df[col] = df[col].astype(dtype)
+
+    for col in TEXT_COLUMNS:
+        if col not in df.columns:
+            continue
+        if text_as_category and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+        elif not text_as_category:
+            # Parquet files must agree on a schema; dictionaries differ per file
+            df[col] = df[col].astype("string")
+    return df
+
+
+def memory_report(before, after=None):
+    """Bytes per column before/after the compact schema (deep, so strings count)."""
+    if after is None:
+        after = apply_schema(before.copy())
+    rep = pd.DataFrame({
+        "dtype_before": before.dtypes.astype(str),
+        "bytes_before": before.memory_usage(deep=True, index=False),
+        "dtype_after": after.dtypes.astype(str).reindex(before.columns),
+        "bytes_after": after.memory_usage(deep=True, index=False).reindex(before.columns),
+    })
+    rep["ratio"] = (rep["bytes_after"] / rep["bytes_before"]).round(3)
+    rep.loc["TOTAL"] = ["", rep["bytes_before"].sum(), "", rep["bytes_after"].sum(),
+                        round(rep["bytes_after"].sum() / rep["bytes_before"].sum(), 3)]
+    return rep
+
+
+def store_path(base_dir=BASE_DIR):
+    return os.path.join(base_dir, STORE_NAME)
+
+
+def csv_path(base_dir=BASE_DIR):
+    return os.path.join(base_dir, CSV_NAME)
+
+
+def has_store(base_dir=BASE_DIR):
+    return os.path.isdir(store_path(base_dir))
+
+
+def exists(base_dir=BASE_DIR):
+    return has_store(base_dir) or os.path.exists(csv_path(base_dir))
+
+
+# ---------------------------
+# WRITE
+# ---------------------------
+def write_year_partitions(df, out_dir, part_id):
+    df = apply_schema(df, text_as_category=False)
+    for year, part in df.groupby("year"):
+        year_dir = os.path.join(out_dir, f"year={int(year)}")
+        os.makedirs(year_dir, exist_ok=True)
+        part.drop(columns=["year"]).to_parquet(
+            os.path.join(year_dir, f"part-{part_id:05d}.parquet"), index=False
+        )
+
+
+def save_crimes(df, base_dir=BASE_DIR):
+    """Replace the store with `df` (must contain a year column)."""
+    out_dir = store_path(base_dir)
+    if os.path.exists(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir)
+    write_year_partitions(df, out_dir, 0)
+    return out_dir
+
+
+def convert_csv(base_dir=BASE_DIR, chunksize=1_000_000):
+    """One-off migration of an existing cleaned_crimes.csv into the Parquet store."""
+    out_dir = store_path(base_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    for i, chunk in enumerate(pd.read_csv(csv_path(base_dir), chunksize=chunksize, low_memory=False)):
+        chunk.columns = [c.lower() for c in chunk.columns]
+        chunk["date"] = pd.to_datetime(chunk["date"], errors="coerce")
+        write_year_partitions(chunk.dropna(subset=["year"]), out_dir, i)
+        print(f"  converted chunk {i}")
+    return out_dir
+
+
+# ---------------------------
+# READ
+# ---------------------------
+def open_dataset(base_dir=BASE_DIR):
+    # Text columns come back dictionary-encoded, so pandas gets categoricals
+    # without materializing one Python string per row
+    parquet = ds.ParquetFileFormat(read_options={"dictionary_columns": TEXT_COLUMNS})
+    return ds.dataset(
+        store_path(base_dir),
+        format=parquet,
+        partitioning=PARTITIONING,
+        filesystem=fs.LocalFileSystem(use_mmap=True)
+    )
+
+
+def columns(base_dir=BASE_DIR):
+    if has_store(base_dir):
+        return open_dataset(base_dir).schema.names
+    return list(pd.read_csv(csv_path(base_dir), nrows=0).columns.str.lower())
+
+
+def _filter_expression(filters):
+    if filters is None or isinstance(filters, ds.Expression):
+        return filters
+    return pq.filters_to_expression(filters)
+
+
+def _filter_frame(df, filters):
+    # CSV fallback: same [(column, op, value), ...] form as pyarrow
+    ops = {
+        "==": lambda s, v: s == v, "=": lambda s, v: s == v, "!=": lambda s, v: s != v,
+        "<": lambda s, v: s < v, "<=": lambda s, v: s <= v,
+        ">": lambda s, v: s > v, ">=": lambda s, v: s >= v,
+        "in": lambda s, v: s.isin(v), "not in": lambda s, v: ~s.isin(v),
+    }
+    mask = np.ones(len(df), dtype=bool)
+    for col, op, value in filters:
+        mask &= ops[op](df[col], value).values
+    return df[mask]
+
+
+def load_crimes(columns=None, filters=None, base_dir=BASE_DIR):
+    """
+    Load only `columns` (None = all) of the cleaned table, keeping rows that
+    match `filters` ([("year", ">=", 2020), ...] or a pyarrow expression).
+    Falls back to cleaned_crimes.csv when the Parquet store does not exist.
+    """
+    if has_store(base_dir):
+        table = open_dataset(base_dir).to_table(columns=columns, filter=_filter_expression(filters))
+        return apply_schema(table.to_pandas())
+
+    path = csv_path(base_dir)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No cleaned dataset in {base_dir}. Run preprocess.py")
+
+    need = None
+    if columns is not None:
+        need = set(columns) | {f[0] for f in (filters or [])}
+    df = pd.read_csv(path, usecols=lambda c: need is None or c.lower() in need, low_memory=False)
+    df.columns = [c.lower() for c in df.columns]
+    if "date" in df.columns:
+        df["date"] = pd.to_datetime(df["date"], errors="coerce")
+    if filters:
+        df = _filter_frame(df, filters)
+    df = apply_schema(df)
+    return df[columns] if columns is not None else df
+
+
+def iter_batches(columns=None, batch_size=1_000_000, base_dir=BASE_DIR):
+    """Yield the table as DataFrames of at most batch_size rows (bounded memory)."""
+    if has_store(base_dir):
+        for batch in open_dataset(base_dir).to_batches(columns=columns, batch_size=batch_size):
+            if batch.num_rows:
+                yield apply_schema(batch.to_pandas())
+        return
+
+    need = set(columns) if columns is not None else None
+    for chunk in pd.read_csv(csv_path(base_dir), usecols=lambda c: need is None or c.lower() in need,
+                             chunksize=batch_size, low_memory=False):
+        chunk.columns = [c.lower() for c in chunk.columns]
+        yield apply_schema(chunk)[columns] if columns is not None else apply_schema(chunk)
+
+
+def count_rows(base_dir=BASE_DIR):
+    if has_store(base_dir):
+        return open_dataset(base_dir).count_rows()
+    return sum(len(c) for c in pd.read_csv(csv_path(base_dir), usecols=[0], chunksize=1_000_000))
+
+
+def sample_crimes(n=1000, columns=None, base_dir=BASE_DIR, random_state=None):
+    """Random rows without materializing the table (Parquet store only)."""
+    if not has_store(base_dir):
+        df = load_crimes(columns, base_dir=base_dir)
+        return df.sample(min(n, len(df)), random_state=random_state)
+
+    dataset = open_dataset(base_dir)
+    total = dataset.count_rows()
+    rng = np.random.default_rng(random_state)
+    idx = np.sort(rng.choice(total, size=min(n, total), replace=False))
+    return apply_schema(dataset.take(idx, columns=columns).to_pandas())
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--convert-csv", action="store_true", help="migrate cleaned_crimes.csv into the Parquet store")
+    parser.add_argument("--report", action="store_true", help="memory per column, raw CSV dtypes vs compact schema")
+    parser.add_argument("--nrows", default=1_000_000, type=int)
+    args = parser.parse_args()
+
+    if args.convert_csv:
+        print("Converted ->", convert_csv())
+    if args.report:
+        if os.path.exists(csv_path()):
+            raw = pd.read_csv(csv_path(), nrows=args.nrows, low_memory=False)
+        else:
+            raw = sample_crimes(args.nrows).astype({c: object for c in TEXT_COLUMNS if c in columns()})
+        raw.columns = [c.lower() for c in raw.columns]
+        with pd.option_context("display.width", 200):
+            print(memory_report(raw))
@@ -1,9 +1,9 @@
 # evaluate_prophet_accuracy.py
-import os, joblib, pandas as pd, numpy as np, math
+import argparse, numpy as np, math
 from prophet import Prophet
+from count_cube import load_cube, series
 
 BASE_DIR = r"D:\crime_project2"
-INFILE = os.path.join(BASE_DIR, "cleaned_crimes.csv")
 
 # ---------- Metrics ----------
 def mape(y_true, y_pred):
@@ -24,13 +24,8 @@ def rmse(y_true, y_pred):
 def evaluate(freq, horizon, label):
     print(f"\n===== {label} ({freq}) =====")
 
-    df = pd.read_csv(INFILE, low_memory=False)
-    df["date"] = pd.to_datetime(df["date"], errors="coerce")
-    df = df.dropna(subset=["date"]).sort_values("date")
-
-    # Aggregate
-    ts = df.set_index("date").resample(freq).size().rename("y").reset_index()
-    ts.columns = ["ds", "y"]
+    # Aggregate (sum of the daily count cube, no pass over the records)
+    ts = series(freq, cube=load_cube(BASE_DIR))
 
     print("Total time points:", len(ts))
 
@@ -67,6 +62,17 @@ def evaluate(freq, horizon, label):
 
 # ---------- Run All ----------
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backtest", action="store_true",
+                        help="rolling-origin backtest instead of one holdout (writes forecast_metrics.csv)")
+    parser.add_argument("--engine", default="prophet", choices=["prophet", "holt_winters", "snaive"],
+                        help="forecasting engine for --backtest")
+    args = parser.parse_args()
+
+    if args.backtest:
+        from backtest import run_backtests
+        print(run_backtests(engine=args.engine).to_string(index=False))
+        raise SystemExit(0)
 
     # Monthly (ME) — Month End
     evaluate("ME", 12, "Monthly Forecast Accuracy")
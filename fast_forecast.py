@@ -0,0 +1,239 @@
+# fast_forecast.py
+# Lightweight forecasting engines for many small series at once: seasonal
+# naive and damped additive Holt-Winters (ETS(A,Ad,A)), both run on a stacked
+# (n_series, T) NumPy array. Holt-Winters picks its smoothing parameters per
+# series from a small grid in one vectorized pass over time, so thousands of
+# beat x crime-group series take seconds. Outputs follow the Prophet path
+# (ds, yhat, yhat_lower, yhat_upper, trend), so callers can switch engines.
+import os
+import time
+import argparse
+from statistics import NormalDist
+import numpy as np
+import pandas as pd
+
+from count_cube import load_cube, daily
+from dataset import iter_batches
+from category_map import map_crime_group
+
+BASE_DIR = r"D:\crime_project2"
+PROPHET_DIR = os.path.join(BASE_DIR, "prophet_models")
+FAST_FILE = os.path.join(PROPHET_DIR, "fast_forecasts.parquet")
+
+ENGINES = ["prophet", "holt_winters", "snaive"]
+FREQ = {"M": "ME", "Q": "QE", "A": "YE"}
+SEASON = {"M": 12, "Q": 4, "A": 1}
+HORIZON = {"M": 12, "Q": 8, "A": 3}
+INTERVAL_WIDTH = 0.8          # same as Prophet's default
+
+# alpha, beta (trend, as a fraction of alpha), gamma, phi (damping)
+GRID = np.array(np.meshgrid([0.1, 0.3, 0.5, 0.8], [0.01, 0.1], [0.05, 0.2], [0.9, 0.98])).reshape(4, -1)
+
+
+# ---------------------------
+# ENGINES on Y (n_series, T)
+# ---------------------------
+def _z(width):
+    return NormalDist().inv_cdf(0.5 + width / 2)
+
+
+def seasonal_naive(Y, horizon, m, width=INTERVAL_WIDTH):
+    """Last season repeated; sd grows with the number of seasons ahead."""
+    Y = np.asarray(Y, dtype=np.float64)
+    n, T = Y.shape
+    m = m if T > m else 1
+    yhat = Y[:, T - m + np.arange(horizon) % m]
+    fitted = np.full_like(Y, np.nan)
+    fitted[:, m:] = Y[:, :-m]
+    resid = Y[:, m:] - Y[:, :-m]
+    sigma = np.sqrt(np.mean(resid ** 2, axis=1)) if resid.shape[1] else np.zeros(n)
+    sd = sigma[:, None] * np.sqrt(np.arange(horizon) // m + 1)[None, :]
+    z = _z(width)
+    return {"yhat": yhat, "lower": np.maximum(yhat - z * sd, 0), "upper": yhat + z * sd,
+            "fitted": fitted, "sigma": sigma}
+
+
+def _hw_filter(Y, alpha, beta, gamma, phi, m, keep_fitted=False):
+    """
+    Error-correction recursions for every series x parameter set at once.
+    Parameter arrays are (n, G); returns SSE (n, G), final states and fitted values.
+    """
+    n, T = Y.shape
+    first = Y[:, :m].mean(axis=1)
+    if m > 1:
+        trend0 = (Y[:, m:2 * m].mean(axis=1) - first) / m
+        season0 = Y[:, :m] - first[:, None]
+    else:
+        trend0 = Y[:, 1] - Y[:, 0]
+        season0 = np.zeros((n, 1))
+
+    G = alpha.shape[1]
+    level = np.repeat(first[:, None], G, axis=1)
+    trend = np.repeat(trend0[:, None], G, axis=1)
+    season = np.repeat(season0[:, None, :], G, axis=1)       # (n, G, m) ring buffer
+    sse = np.zeros((n, G))
+    fitted = np.empty((n, G, T)) if keep_fitted else None
+    bstar = alpha * beta
+
+    for t in range(T):
+        s = season[:, :, t % m]
+        pred = level + phi * trend + s
+        err = Y[:, t:t + 1] - pred
+        if t >= m:
+            sse += err ** 2
+        if keep_fitted:
+            fitted[:, :, t] = pred
+        level = level + phi * trend + alpha * err
+        trend = phi * trend + bstar * err
+        season[:, :, t % m] = s + gamma * err
+    return sse, level, trend, season, fitted
+
+
+def holt_winters(Y, horizon, m, width=INTERVAL_WIDTH, grid=GRID):
+    """Damped additive Holt-Winters with per-series grid-searched smoothing; seasonal naive if too short."""
+    Y = np.asarray(Y, dtype=np.float64)
+    n, T = Y.shape
+    if T < max(2 * m, 4) + 2:
+        return seasonal_naive(Y, horizon, m, width)
+
+    # Grid search: all parameter sets for all series in one pass
+    params = [np.broadcast_to(p[None, :], (n, grid.shape[1])) for p in grid]
+    sse = _hw_filter(Y, *params, m)[0]
+    best = np.argmin(sse, axis=1)
+    a, b, g, phi = (grid[i][best][:, None] for i in range(4))
+
+    sse, level, trend, season, fitted = _hw_filter(Y, a, b, g, phi, m, keep_fitted=True)
+    level, trend, season, fitted = level[:, 0], trend[:, 0], season[:, 0, :], fitted[:, 0, :]
+    a, b, g, phi = a[:, 0], b[:, 0], g[:, 0], phi[:, 0]
+
+    h = np.arange(1, horizon + 1)
+    phi_h = np.cumsum(phi[:, None] ** h[None, :], axis=1)       # phi + ... + phi^h
+    yhat = level[:, None] + phi_h * trend[:, None] + season[:, (T + h - 1) % m]
+
+    # h-step variance of ETS(A,Ad,A): sigma^2 (1 + sum_{j<h} c_j^2), c_j = a + a*b*phi_j + g*[j % m == 0]
+    sigma2 = sse[:, 0] / max(T - m, 1)
+    c = a[:, None] + (a * b)[:, None] * phi_h + g[:, None] * (h[None, :] % m == 0)
+    csum = np.concatenate([np.zeros((n, 1)), np.cumsum(c[:, :-1] ** 2, axis=1)], axis=1)
+    sd = np.sqrt(sigma2[:, None] * (1 + csum))
+    z = _z(width)
+    return {"yhat": yhat, "lower": np.maximum(yhat - z * sd, 0), "upper": yhat + z * sd,
+            "fitted": fitted, "sigma": np.sqrt(sigma2),
+            "params": np.stack([a, b, g, phi], axis=1)}
+
+
+def run_engine(engine, Y, horizon, period, width=INTERVAL_WIDTH):
+    if engine == "snaive":
+        return seasonal_naive(Y, horizon, SEASON[period], width)
+    if engine == "holt_winters":
+        return holt_winters(Y, horizon, SEASON[period], width)
+    raise ValueError(f"unknown fast engine {engine!r} (use one of {ENGINES[1:]})")
+
+
+# ---------------------------
+# SINGLE SERIES (same columns as a Prophet forecast)
+# ---------------------------
+def forecast_series(ts, horizon, period, engine="holt_winters", width=INTERVAL_WIDTH):
+    """History (fitted) + `horizon` future rows for one (ds, y) series; returns (forecast, seconds)."""
+    start = time.perf_counter()
+    res = run_engine(engine, ts["y"].to_numpy()[None, :], horizon, period, width)
+    future = pd.date_range(ts["ds"].iloc[-1], periods=horizon + 1, freq=FREQ[period])[1:]
+    fc = pd.DataFrame({
+        "ds": np.concatenate([ts["ds"].to_numpy(), future.to_numpy()]),
+        "yhat": np.concatenate([res["fitted"][0], res["yhat"][0]]),
+        "yhat_lower": np.concatenate([np.full(len(ts), np.nan), res["lower"][0]]),
+        "yhat_upper": np.concatenate([np.full(len(ts), np.nan), res["upper"][0]]),
+    })
+    # Deseasonalised level for the trend chart/insights
+    fc["trend"] = fc["yhat"].rolling(SEASON[period], min_periods=1).mean()
+    return fc, time.perf_counter() - start
+
+
+# ---------------------------
+# STACKED SERIES
+# ---------------------------
+def level_matrix(level, period, cube=None, base_dir=None):
+    """keys, period-end index and Y (n, T) for a count-cube level (city, district, cluster)."""
+    cube = load_cube(base_dir or BASE_DIR) if cube is None else cube
+    counts = daily(level, cube).resample(FREQ[period]).sum()
+    # Completed periods only, like forecast_prophet.completed (same origin as Prophet)
+    counts = counts[counts.index <= cube["day"].max()]
+    keys = [f"{level}/{period}" if level == "city" else f"{level}/{v}/{period}" for v in counts.columns]
+    return keys, counts.index, counts.to_numpy(dtype=np.float64).T
+
+
+def beat_group_matrix(period, base_dir=None):
+    """Counts per beat x crime group (one streamed pass over the store): keys, index, Y."""
+    alias = {"M": "M", "Q": "Q", "A": "Y"}[period]
+    parts, last_day = [], None
+    for batch in iter_batches(["date", "beat", "primary_type"], base_dir=base_dir or BASE_DIR):
+        batch = batch.dropna(subset=["date", "beat"])
+        if len(batch):
+            day = batch["date"].max().normalize()
+            last_day = day if last_day is None else max(last_day, day)
+        parts.append(pd.DataFrame({
+            "p": batch["date"].dt.to_period(alias),
+            "beat": batch["beat"].astype(np.int64),
+            "group": np.asarray(map_crime_group(batch["primary_type"]), dtype=object),
+        }).groupby(["p", "beat", "group"]).size())
+    counts = pd.concat(parts).groupby(level=[0, 1, 2]).sum().unstack(["beat", "group"], fill_value=0)
+    full = pd.period_range(counts.index.min(), counts.index.max(), freq=alias)
+    counts = counts.reindex(full, fill_value=0).sort_index(axis=1)
+    index = counts.index.to_timestamp(how="end").normalize()
+    # Drop the unfinished trailing period (its end is after the last day of data)
+    done = index <= last_day
+    counts, index = counts[done], index[done]
+    keys = [f"beat/{b}/{g}/{period}" for b, g in counts.columns]
+    return keys, index, counts.to_numpy(dtype=np.float64).T
+
+
+def forecast_many(levels=("beat_group",), periods=("M", "Q", "A"), engine="holt_winters", horizons=None,
+                  base_dir=None, out=None):
+    """Fast-engine forecasts for every series of `levels` x `periods`, written as one long table."""
+    horizons = dict(HORIZON, **(horizons or {}))
+    cube = None
+    tables = []
+    for period in periods:
+        for level in levels:
+            start = time.time()
+            if level == "beat_group":
+                keys, index, Y = beat_group_matrix(period, base_dir)
+            else:
+                cube = load_cube(base_dir or BASE_DIR) if cube is None else cube
+                keys, index, Y = level_matrix(level, period, cube)
+            read_s = time.time() - start
+
+            start = time.time()
+            H = horizons[period]
+            res = run_engine(engine, Y, H, period)
+            fit_s = time.time() - start
+
+            future = pd.date_range(index[-1], periods=H + 1, freq=FREQ[period])[1:]
+            tables.append(pd.DataFrame({
+                "key": np.repeat(keys, H),
+                "step": np.tile(np.arange(1, H + 1, dtype=np.int16), len(keys)),
+                "ds": np.tile(future.to_numpy(), len(keys)),
+                "yhat": res["yhat"].ravel().astype(np.float32),
+                "yhat_lower": res["lower"].ravel().astype(np.float32),
+                "yhat_upper": res["upper"].ravel().astype(np.float32),
+            }))
+            print(f"  {level}/{period}: {len(keys):,} series × {Y.shape[1]} points, "
+                  f"read {read_s:.1f}s, {engine} {fit_s:.2f}s")
+
+    table = pd.concat(tables, ignore_index=True)
+    table.insert(0, "engine", engine)
+    out = out or FAST_FILE
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    table.to_parquet(out + ".tmp", index=False)
+    os.replace(out + ".tmp", out)
+    print(f"✔ {table['key'].nunique():,} series forecast → {out}")
+    return table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--levels", nargs="*", default=["beat_group"],
+                        choices=["city", "district", "cluster", "beat_group"])
+    parser.add_argument("--periods", nargs="*", default=["M", "Q", "A"], choices=list(FREQ))
+    parser.add_argument("--engine", default="holt_winters", choices=ENGINES[1:])
+    args = parser.parse_args()
+    forecast_many(args.levels, args.periods, args.engine)
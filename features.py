@@ -0,0 +1,90 @@
+# features.py
+# Derived model features, computed column-wise for N rows at once.
+# Used by preprocess, training, predict.py and the Streamlit app so the
+# definitions cannot drift apart.
+import datetime
+import numpy as np
+import pandas as pd
+
+FEATURES = [
+    "year", "month", "day", "hour",
+    "day_of_week", "is_weekend", "season", "hour_group",
+    "beat", "district", "ward", "community_area",
+    "hotspot_area"
+]
+DERIVED = ["day_of_week", "is_weekend", "season", "hour_group", "hotspot_area"]
+
+# Highest-volume beats
+TOP_BEATS = np.array([332, 2523, 1933, 224, 1022, 1113, 414, 2023, 1221, 925])
+
+# Lookup tables indexed by month (1-12) and hour (0-23)
+# season: 1 spring (Mar-May), 2 summer, 3 autumn, 4 winter (Dec-Feb)
+SEASON_BY_MONTH = np.array([4, 4, 4, 1, 1, 1, 2, 2, 2, 3, 3, 3, 4], dtype=np.int8)
+# hour_group: 0 night (0-5), 1 morning (6-11), 2 afternoon (12-17), 3 evening (18-23)
+HOUR_GROUP_BY_HOUR = np.repeat(np.arange(4, dtype=np.int8), 6)
+
+
+def _int_array(values, fill=0):
+    return pd.to_numeric(pd.Series(values), errors="coerce").fillna(fill).to_numpy(dtype=np.int64)
+
+
+def add_derived_features(df):
+    """Add day_of_week, is_weekend, season, hour_group and hotspot_area in one vectorized pass."""
+    if "date" in df.columns and df["date"].dtype.kind == "M":
+        dow = df["date"].dt.dayofweek
+    else:
+        # Invalid dates (e.g. Feb 31) get day_of_week -1
+        dates = pd.to_datetime(
+            pd.DataFrame({"year": df["year"], "month": df["month"], "day": df["day"]}), errors="coerce"
+        )
+        dow = dates.dt.dayofweek
+    dow = dow.fillna(-1).to_numpy(dtype=np.int8)
+
+    month = np.clip(_int_array(df["month"].values), 0, 12)
+    hour = np.clip(_int_array(df["hour"].values), 0, 23)
+
+    df["day_of_week"] = dow
+    df["is_weekend"] = (dow >= 5).astype(np.int8)
+    df["season"] = SEASON_BY_MONTH[month]
+    df["hour_group"] = HOUR_GROUP_BY_HOUR[hour]
+    df["hotspot_area"] = np.isin(_int_array(df["beat"].values, fill=-1), TOP_BEATS).astype(np.int8)
+    return df
+
+
+def build_feature_frame(year, month, day, hour, beat, district, ward, community_area):
+    """Model input for scalars or equal-length arrays (scalars broadcast)."""
+    cols = np.broadcast_arrays(
+        np.atleast_1d(year), np.atleast_1d(month), np.atleast_1d(day), np.atleast_1d(hour),
+        np.atleast_1d(beat), np.atleast_1d(district), np.atleast_1d(ward), np.atleast_1d(community_area)
+    )
+    names = ["year", "month", "day", "hour", "beat", "district", "ward", "community_area"]
+    df = pd.DataFrame(dict(zip(names, cols)))
+    return add_derived_features(df)[FEATURES]
+
+
+def feature_vector(year, month, day, hour, beat, district, ward, community_area):
+    """FEATURES for one scalar row as a tuple, without building a DataFrame (same tables as above)."""
+    try:
+        dow = datetime.date(int(year), int(month), int(day)).weekday()
+    except ValueError:
+        dow = -1
+    values = {
+        "year": year, "month": month, "day": day, "hour": hour,
+        "day_of_week": dow,
+        "is_weekend": int(dow >= 5),
+        "season": SEASON_BY_MONTH[min(max(int(month), 0), 12)],
+        "hour_group": HOUR_GROUP_BY_HOUR[min(max(int(hour), 0), 23)],
+        "beat": beat, "district": district, "ward": ward, "community_area": community_area,
+        "hotspot_area": int(int(beat) in TOP_BEATS),
+    }
+    return tuple(float(np.float32(values[c])) for c in FEATURES)
+
+
+def feature_matrix(df):
+    """FEATURES as a float32 matrix (missing -> 0), deriving columns if needed."""
+    if any(c not in df.columns for c in DERIVED):
+        df = add_derived_features(df.copy())
+    out = np.empty((len(df), len(FEATURES)), dtype=np.float32)
+    for j, col in enumerate(FEATURES):
+        out[:, j] = pd.to_numeric(df[col], errors="coerce").fillna(0).to_numpy(dtype=np.float32)
+    return out
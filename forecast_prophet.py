@@ -1,10 +1,27 @@
+# forecast_prophet.py
+# Prophet models for the city-wide series and, optionally, one per district
+# and per spatial cluster. All series are summed from the daily count cube
+# (count_cube.py) per frequency and fitted in a process pool;
+# every fit is logged to prophet_models/fit_log.csv and a failed series does
+# not stop the others. prophet_models/watermarks.json keeps the last completed
+# period each series was trained on; --refresh refits only the series that
+# have completed a new period since, warm-started from their saved model.
 import os
-import joblib
+import json
+import time
+import logging
+import argparse
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
+from count_cube import LEVELS, load_cube, daily as cube_daily
+from model_registry import save_prophet, load_prophet
 
 BASE_DIR = r"D:\crime_project2"
 PROPHET_DIR = os.path.join(BASE_DIR, "prophet_models")
 os.makedirs(PROPHET_DIR, exist_ok=True)
+FIT_LOG = os.path.join(PROPHET_DIR, "fit_log.csv")
+WATERMARKS = "watermarks.json"
 
 # Updated frequencies (pandans v2+)
 FREQ_MAP = {
@@ -12,51 +29,279 @@ FREQ_MAP = {
     "Q": "QE",   # Quarter-End
     "A": "YE"    # Year-End
 }
+MIN_POINTS = 3
+THREAD_VARS = ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "STAN_NUM_THREADS"]
 
-def train_prophet(period="M"):
-    df = pd.read_csv(os.path.join(BASE_DIR, "cleaned_crimes.csv"))
-    df.columns = [c.lower() for c in df.columns]
 
-    if "date" not in df.columns:
-        raise ValueError("date column required")
+# ---------------------------
+# SERIES KEYS
+# ---------------------------
+def series_key(level, value, period):
+    """'city/M', 'district/11/M', 'cluster/4/Q'."""
+    return f"{level}/{period}" if level == "city" else f"{level}/{value}/{period}"
 
-    df["date"] = pd.to_datetime(df["date"], errors="coerce")
-    df = df.dropna(subset=["date"])
 
-    freq = FREQ_MAP[period]
+def model_dir_for(key, prophet_dir=None):
+    # City models keep their old location (prophet_M.json); areas get a folder each
+    prophet_dir = prophet_dir or PROPHET_DIR
+    parts = key.split("/")[:-1]
+    return prophet_dir if parts == ["city"] else os.path.join(prophet_dir, *parts)
 
-    print(f"Training Prophet for {period} ({freq})...")
 
-    # Resample time series
-    df2 = (
-        df.set_index("date")
-          .resample(freq)
-          .size()
-          .rename("y")
-          .reset_index()
-    )
+# ---------------------------
+# SERIES FROM THE DAILY COUNT CUBE
+# ---------------------------
+def aggregate_series(periods=("M", "Q", "A"), levels=("city",), base_dir=None, cube=None):
+    """{key: DataFrame(ds, y)} for every level/value/period, summed from the daily count cube."""
+    cube = load_cube(base_dir or BASE_DIR) if cube is None else cube
+    series = {}
+    for lv in levels:
+        daily = cube_daily(lv, cube)
+        if daily.empty:
+            continue
+        for period in periods:
+            resampled = daily.resample(FREQ_MAP[period]).sum()
+            for value in resampled.columns:
+                ts = resampled[value].rename("y").rename_axis("ds").reset_index()
+                series[series_key(lv, value, period)] = ts
+    return series
 
-    df2.columns = ["ds", "y"]
 
-    if len(df2) < 3:
-        print(f"⚠ Skipping {period} (Not enough time points: {len(df2)})")
-        return None
+def model_file(key, prophet_dir=None):
+    """Saved model of a series (JSON, or an old joblib), or None."""
+    folder = model_dir_for(key, prophet_dir)
+    period = key.rsplit("/", 1)[1]
+    for name in (f"prophet_{period}.json", f"prophet_{period}.joblib"):
+        if os.path.exists(os.path.join(folder, name)):
+            return os.path.join(folder, name)
+    return None
+
+
+def completed(ts, last_day):
+    """Drop a trailing period that has not ended yet (its ds, the period end, is after the last day of data)."""
+    return ts[ts["ds"] <= last_day].reset_index(drop=True)
+
+
+# ---------------------------
+# WATERMARKS (last completed period trained on, per series)
+# ---------------------------
+def load_watermarks(prophet_dir=None):
+    path = os.path.join(prophet_dir or PROPHET_DIR, WATERMARKS)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_watermarks(marks, prophet_dir=None):
+    path = os.path.join(prophet_dir or PROPHET_DIR, WATERMARKS)
+    with open(path + ".tmp", "w") as f:
+        json.dump(marks, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def _update_watermarks(marks, rows, series, last_day):
+    for row in rows:
+        if row["status"] == "ok":
+            ts = completed(series[row["key"]], last_day)
+            marks[row["key"]] = {"last_ds": str(ts["ds"].max().date()) if len(ts) else None,
+                                 "points": len(ts), "trained_at": time.strftime("%Y-%m-%d %H:%M:%S")}
+    return marks
+
 
-    # Load Prophet
+# ---------------------------
+# FITTING
+# ---------------------------
+def warm_init(m):
+    """Fitted parameters of `m` as a Stan init for the next fit (Prophet's documented warm start)."""
+    init = {name: m.params[name][0][0] for name in ["k", "m", "sigma_obs"]}
+    for name in ["delta", "beta"]:
+        init[name] = m.params[name][0]
+    return init
+
+
+def fit_prophet(ts, init=None):
     try:
         from prophet import Prophet
     except Exception as e:
         raise ImportError("Install prophet package: conda install -c conda-forge prophet") from e
-
     m = Prophet()
-    m.fit(df2)
+    if init is not None:
+        m.fit(ts, init=init)
+    else:
+        m.fit(ts)
+    return m
+
+
+def fit_series(key, ts, prophet_dir=None, warm=False):
+    """Fit + save one series (warm-started from its saved model if `warm`); returns a log row instead of raising."""
+    start = time.time()
+    row = {"key": key, "points": len(ts), "status": "ok", "seconds": None, "path": None, "error": None,
+           "warm": False}
+    try:
+        if len(ts) < MIN_POINTS:
+            row["status"] = "skipped"
+            row["error"] = f"only {len(ts)} time points"
+        else:
+            init = None
+            prev = model_file(key, prophet_dir) if warm else None
+            if prev is not None:
+                init = warm_init(load_prophet(prev))
+                row["warm"] = True
+            m = fit_prophet(ts, init)
+            row["path"] = save_prophet(m, key.rsplit("/", 1)[1], model_dir_for(key, prophet_dir))
+    except Exception as e:
+        row["status"] = "failed"
+        row["error"] = f"{type(e).__name__}: {e}"
+    row["seconds"] = round(time.time() - start, 2)
+    return row
+
+
+def _init_worker(threads):
+    # numpy/BLAS and Stan get `threads` each, so workers x threads <= cores
+    for var in THREAD_VARS:
+        os.environ[var] = str(threads)
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(threads)
+    except ImportError:
+        pass
+    logging.getLogger("cmdstanpy").setLevel(logging.WARNING)
+
+
+def _fit_many(series, workers, prophet_dir, warm=False):
+    """Fit `series` ({key: ts}) in a process pool; one log row per series."""
+    if not series:
+        return []
+    cores = os.cpu_count() or 1
+    workers = min(workers or max(1, min(8, cores)), len(series))
+    threads = max(1, cores // workers)
+    print(f"Fitting with {workers} workers x {threads} threads...")
+
+    rows = []
+    if workers == 1:
+        _init_worker(threads)
+        for key, ts in series.items():
+            rows.append(fit_series(key, ts, prophet_dir, warm))
+            _report(rows[-1], len(rows), len(series))
+    else:
+        ctx = mp.get_context("spawn")
+        with ProcessPoolExecutor(workers, mp_context=ctx, initializer=_init_worker, initargs=(threads,)) as pool:
+            # Longest series first so a big fit does not start last
+            order = sorted(series, key=lambda k: -len(series[k]))
+            futures = {pool.submit(fit_series, k, series[k], prophet_dir, warm): k for k in order}
+            for fut in as_completed(futures):
+                try:
+                    rows.append(fut.result())
+                except Exception as e:        # worker died
+                    rows.append({"key": futures[fut], "status": "failed", "error": f"{type(e).__name__}: {e}"})
+                _report(rows[-1], len(rows), len(series))
+    return rows
+
+
+def _write_log(rows, prophet_dir, keep=None):
+    # `keep`: previous log rows of series not refitted this run
+    log = pd.DataFrame(rows)
+    log.insert(0, "run_at", time.strftime("%Y-%m-%d %H:%M:%S"))
+    if keep is not None and not keep.empty:
+        log = pd.concat([keep, log], ignore_index=True)
+    log = log.sort_values("key").reset_index(drop=True) if not log.empty else log
+    log.to_csv(os.path.join(prophet_dir, os.path.basename(FIT_LOG)), index=False)
+    return log
+
+
+def train_all(periods=("M", "Q", "A"), levels=("city", "district", "cluster"), workers=None,
+              prophet_dir=None, base_dir=None):
+    """Build every series from the count cube, fit them in a process pool, write the fit log and watermarks."""
+    prophet_dir = prophet_dir or PROPHET_DIR
+    start = time.time()
+    cube = load_cube(base_dir or BASE_DIR)
+    series = aggregate_series(periods, levels, base_dir, cube)
+    print(f"Aggregated {len(series)} series in {time.time() - start:.1f}s")
+
+    # Fit on completed periods only, the same points the watermarks record
+    last_day = cube["day"].max()
+    rows = _fit_many({k: completed(ts, last_day) for k, ts in series.items()}, workers, prophet_dir)
+    log = _write_log(rows, prophet_dir)
+    save_watermarks(_update_watermarks({}, rows, series, last_day), prophet_dir)
+
+    status = log["status"].value_counts().to_dict()
+    print(f"✔ {status.get('ok', 0)} fitted, {status.get('skipped', 0)} skipped, {status.get('failed', 0)} failed "
+          f"in {time.time() - start:.1f}s (log → {os.path.join(prophet_dir, os.path.basename(FIT_LOG))})")
+    return log
+
+
+def stale_series(series, marks, last_day, prophet_dir=None):
+    """Keys whose completed periods go past their watermark, or that have no watermark / saved model."""
+    stale = []
+    for key, ts in series.items():
+        mark = marks.get(key)
+        done = completed(ts, last_day)
+        if mark is None or mark.get("last_ds") is None or model_file(key, prophet_dir) is None:
+            stale.append(key)
+        elif len(done) and done["ds"].max() > pd.Timestamp(mark["last_ds"]):
+            stale.append(key)
+    return stale
+
+
+def refresh(periods=("M", "Q", "A"), levels=("city", "district", "cluster"), workers=None,
+            prophet_dir=None, base_dir=None):
+    """Refit (warm-started) only the series with a newly completed period; the rest stay as they are."""
+    prophet_dir = prophet_dir or PROPHET_DIR
+    start = time.time()
+    cube = load_cube(base_dir or BASE_DIR)
+    last_day = cube["day"].max()
+    series = aggregate_series(periods, levels, base_dir, cube)
+    marks = load_watermarks(prophet_dir)
+    stale = stale_series(series, marks, last_day, prophet_dir)
+    print(f"Refresh: {len(stale)} of {len(series)} series have new completed periods (data up to {last_day.date()})")
+
+    rows = _fit_many({k: completed(series[k], last_day) for k in stale}, workers, prophet_dir, warm=True)
+    log_path = os.path.join(prophet_dir, os.path.basename(FIT_LOG))
+    keep = pd.read_csv(log_path) if os.path.exists(log_path) else None
+    if keep is not None:
+        keep = keep[~keep["key"].isin(stale)]
+    log = _write_log(rows, prophet_dir, keep)
+    save_watermarks(_update_watermarks(marks, rows, series, last_day), prophet_dir)
+
+    fitted = sum(r["status"] == "ok" for r in rows)
+    print(f"✔ {fitted} refitted ({sum(bool(r.get('warm')) for r in rows)} warm), "
+          f"{len(series) - len(stale)} unchanged in {time.time() - start:.1f}s")
+    return log
+
+
+def _report(row, done, total):
+    if row["status"] != "ok":
+        print(f"  ⚠ [{done}/{total}] {row['key']}: {row['status']} ({row.get('error')})")
+    elif done % 25 == 0 or done == total:
+        print(f"  [{done}/{total}] {row['key']} {row['seconds']}s")
+
+
+def train_prophet(period="M"):
+    """City-wide model for one period (saved as prophet_<period>.json)."""
+    print(f"Training Prophet for {period} ({FREQ_MAP[period]})...")
+    ts = aggregate_series([period], ["city"])[series_key("city", "city", period)]
+
+    if len(ts) < MIN_POINTS:
+        print(f"⚠ Skipping {period} (Not enough time points: {len(ts)})")
+        return None
 
-    joblib.dump(m, os.path.join(PROPHET_DIR, f"prophet_{period}.joblib"))
+    m = fit_prophet(ts)
+    save_prophet(m, period, PROPHET_DIR)
     print(f"✔ Saved Prophet model for period {period}")
 
     return m
 
 
 if __name__ == "__main__":
-    for p in ["M", "Q", "A"]:
-        train_prophet(period=p)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--periods", nargs="*", default=["M", "Q", "A"], choices=list(FREQ_MAP))
+    parser.add_argument("--levels", nargs="*", default=list(LEVELS), choices=list(LEVELS))
+    parser.add_argument("--workers", type=int, help="fitting processes (default: cores, at most 8)")
+    parser.add_argument("--refresh", action="store_true",
+                        help="refit only series with a newly completed period (warm start)")
+    args = parser.parse_args()
+    if args.refresh:
+        refresh(args.periods, args.levels, args.workers)
+    else:
+        train_all(args.periods, args.levels, args.workers)
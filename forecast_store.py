@@ -0,0 +1,157 @@
+# forecast_store.py
+# City forecasts computed once after training (full 1000-sample intervals,
+# up to MAX_HORIZON steps per frequency) and kept in one Parquet table keyed
+# by the hash of the model file, so the app slices a stored forecast instead
+# of running Prophet. Horizons beyond the stored range, or a model that has
+# changed since, go through fast_predict, which lets the caller pick how the
+# intervals are computed (fewer posterior samples, a closed-form band, or none).
+import os
+import copy
+import time
+import hashlib
+import argparse
+from statistics import NormalDist
+import numpy as np
+import pandas as pd
+
+from model_registry import PERIODS, load_prophet
+
+BASE_DIR = r"D:\crime_project2"
+PROPHET_DIR = os.path.join(BASE_DIR, "prophet_models")
+STORE_FILE = "forecast_store.parquet"
+
+FREQ = {"M": "ME", "Q": "QE", "A": "YE"}
+MAX_HORIZON = {"M": 60, "Q": 20, "A": 10}
+COLUMNS = ["ds", "yhat", "yhat_lower", "yhat_upper", "trend", "yearly", "weekly"]
+
+_HASHES = {}          # (path, size, mtime) -> hash
+_TABLE = {}           # store path -> (mtime, DataFrame)
+
+
+def model_hash(path):
+    """sha256 of the model file (first 16 hex digits), memoised on size + mtime."""
+    st = os.stat(path)
+    key = (path, st.st_size, st.st_mtime_ns)
+    if key not in _HASHES:
+        with open(path, "rb") as f:
+            _HASHES[key] = hashlib.sha256(f.read()).hexdigest()[:16]
+    return _HASHES[key]
+
+
+def model_path(period, prophet_dir=None):
+    prophet_dir = prophet_dir or PROPHET_DIR
+    for name in (f"prophet_{period}.json", f"prophet_{period}.joblib"):
+        path = os.path.join(prophet_dir, name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+# ---------------------------
+# FAST PREDICT (ad-hoc horizons)
+# ---------------------------
+def fast_predict(model, horizon, freq, uncertainty="samples", samples=200):
+    """
+    Prophet forecast for history + `horizon` steps; returns (forecast, seconds).
+
+    uncertainty="samples"  posterior simulation with `samples` draws (Prophet uses 1000)
+    uncertainty="analytic" yhat ± z·sigma_obs: observation noise only, no trend
+                           uncertainty, so narrower far out; no sampling at all
+    uncertainty="none"     point forecast, lower = upper = yhat
+    """
+    start = time.perf_counter()
+    # Shallow copy: the registry's model is shared between sessions, don't mutate it
+    m = copy.copy(model)
+    m.uncertainty_samples = samples if uncertainty == "samples" else 0
+
+    future = m.make_future_dataframe(periods=horizon, freq=freq)
+    fc = m.predict(future)
+    if uncertainty == "analytic":
+        z = NormalDist().inv_cdf(0.5 + m.interval_width / 2)
+        band = z * float(np.asarray(m.params["sigma_obs"]).ravel()[0]) * m.y_scale
+        fc["yhat_lower"], fc["yhat_upper"] = fc["yhat"] - band, fc["yhat"] + band
+    elif uncertainty == "none":
+        fc["yhat_lower"], fc["yhat_upper"] = fc["yhat"], fc["yhat"]
+    return fc, time.perf_counter() - start
+
+
+# ---------------------------
+# PRECOMPUTED STORE
+# ---------------------------
+def store_path(prophet_dir=None):
+    return os.path.join(prophet_dir or PROPHET_DIR, STORE_FILE)
+
+
+def precompute(periods=PERIODS, prophet_dir=None, horizons=None):
+    """Forecast every saved city model out to its max horizon and write the store."""
+    prophet_dir = prophet_dir or PROPHET_DIR
+    horizons = dict(MAX_HORIZON, **(horizons or {}))
+    parts = []
+    for period in periods:
+        path = model_path(period, prophet_dir)
+        if path is None:
+            print(f"⚠ No Prophet model for {period}, skipped")
+            continue
+        model = load_prophet(path)
+        fc, seconds = fast_predict(model, horizons[period], FREQ[period], samples=model.uncertainty_samples)
+        part = fc[[c for c in COLUMNS if c in fc.columns]].copy()
+        # step 0 = history (fitted values), 1..H = forecast
+        n_hist = len(fc) - horizons[period]
+        part.insert(1, "step", np.concatenate([np.zeros(n_hist, dtype=np.int16),
+                                               np.arange(1, horizons[period] + 1, dtype=np.int16)]))
+        part.insert(0, "period", period)
+        part.insert(1, "model_hash", model_hash(path))
+        parts.append(part)
+        print(f"  {period}: {horizons[period]} steps in {seconds:.2f}s")
+
+    if not parts:
+        return None
+    table = pd.concat(parts, ignore_index=True)
+    floats = table.columns.difference(["period", "model_hash", "ds", "step"])
+    table[floats] = table[floats].astype(np.float32)
+
+    out = store_path(prophet_dir)
+    table.to_parquet(out + ".tmp", index=False)
+    os.replace(out + ".tmp", out)
+    print(f"✔ Forecast store: {len(table):,} rows → {out}")
+    return table
+
+
+def _table(prophet_dir=None):
+    path = store_path(prophet_dir)
+    if not os.path.exists(path):
+        return None
+    mtime = os.path.getmtime(path)
+    cached = _TABLE.get(path)
+    if cached is None or cached[0] != mtime:
+        _TABLE[path] = (mtime, pd.read_parquet(path))
+    return _TABLE[path][1]
+
+
+def stored_forecast(period, horizon, prophet_dir=None):
+    """History + `horizon` steps from the store, or None if the model changed or the horizon is too long."""
+    table = _table(prophet_dir)
+    path = model_path(period, prophet_dir)
+    if table is None or path is None:
+        return None
+    rows = table[(table["period"] == period) & (table["model_hash"] == model_hash(path))]
+    if rows.empty or rows["step"].max() < horizon:
+        return None
+    return rows[rows["step"] <= horizon].drop(columns=["period", "model_hash"]).reset_index(drop=True)
+
+
+def get_forecast(load_model, period, horizon, uncertainty="samples", samples=200, prophet_dir=None):
+    """(forecast, source, seconds): the stored forecast when valid, otherwise fast_predict on load_model()."""
+    start = time.perf_counter()
+    fc = stored_forecast(period, horizon, prophet_dir)
+    if fc is not None:
+        return fc, "store", time.perf_counter() - start
+    fc, seconds = fast_predict(load_model(), horizon, FREQ[period], uncertainty, samples)
+    return fc, f"predict ({uncertainty})", seconds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--periods", nargs="*", default=PERIODS, choices=PERIODS)
+    args = parser.parse_args()
+    precompute(args.periods)
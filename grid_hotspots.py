@@ -0,0 +1,188 @@
+# grid_hotspots.py
+# Incident counts on a square lat/lon grid at several resolutions, kept as a
+# small pyramid in hotspots/grid_pyramid.npz. The finest level (~110 m cells)
+# is counted in one streamed pass over the store with integer cell ids and
+# np.bincount; every coarser level sums 2 x 2 blocks of the one below, so a
+# query at any resolution is an array slice over the full history. Cells are
+# ranked by count or by a z-score against their 8 neighbours.
+import os
+import glob
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+from dataset import iter_batches, store_path
+from spatial_clusters import CHICAGO_BBOX
+
+BASE_DIR = r"D:\crime_project2"
+PYRAMID_FILE = "grid_pyramid.npz"
+
+N_LEVELS = 7                    # level 0 = finest, level k cells are 2^k finest cells wide
+FINE_LAT = 0.001                # ~111 m
+LAT0 = (CHICAGO_BBOX[0] + CHICAGO_BBOX[1]) / 2
+FINE_LON = FINE_LAT / np.cos(np.radians(LAT0))     # same ground width as FINE_LAT
+MIN_COUNT = 5                   # cells below this are not ranked
+
+_CACHE = {}                     # path -> (mtime, GridPyramid)
+
+
+def pyramid_path(base_dir=None):
+    return os.path.join(base_dir or BASE_DIR, "hotspots", PYRAMID_FILE)
+
+
+def _fine_shape(levels):
+    # Rows/cols rounded up so every level halves exactly
+    block = 2 ** (levels - 1)
+    rows = int(np.ceil((CHICAGO_BBOX[1] - CHICAGO_BBOX[0]) / FINE_LAT / block)) * block
+    cols = int(np.ceil((CHICAGO_BBOX[3] - CHICAGO_BBOX[2]) / FINE_LON / block)) * block
+    return rows, cols
+
+
+def cell_ids(lat, lon, shape):
+    """Finest-level cell id (row * cols + col) per point, -1 outside the grid or without coordinates."""
+    rows, cols = shape
+    r = np.floor((np.asarray(lat, dtype=np.float64) - CHICAGO_BBOX[0]) / FINE_LAT)
+    c = np.floor((np.asarray(lon, dtype=np.float64) - CHICAGO_BBOX[2]) / FINE_LON)
+    ok = (r >= 0) & (r < rows) & (c >= 0) & (c < cols)     # False for NaN
+    ids = np.full(len(r), -1, dtype=np.int64)
+    ids[ok] = r[ok].astype(np.int64) * cols + c[ok].astype(np.int64)
+    return ids
+
+
+# ---------------------------
+# BUILD
+# ---------------------------
+def coarsen(counts):
+    """Sum 2 x 2 blocks."""
+    rows, cols = counts.shape
+    return counts.reshape(rows // 2, 2, cols // 2, 2).sum(axis=(1, 3))
+
+
+def build_pyramid(base_dir=None, levels=N_LEVELS, df=None):
+    """Count every incident into the finest grid, derive the coarser levels and save the pyramid."""
+    base_dir = base_dir or BASE_DIR
+    start = time.time()
+    shape = _fine_shape(levels)
+    fine = np.zeros(shape[0] * shape[1], dtype=np.int64)
+    outside = total = 0
+    batches = [df] if df is not None else iter_batches(["latitude", "longitude"], base_dir=base_dir)
+    for batch in batches:
+        ids = cell_ids(batch["latitude"].to_numpy(), batch["longitude"].to_numpy(), shape)
+        inside = ids[ids >= 0]
+        fine += np.bincount(inside, minlength=fine.size)
+        outside += len(ids) - len(inside)
+        total += len(ids)
+
+    pyramid = [fine.reshape(shape).astype(np.int32)]
+    for _ in range(1, levels):
+        pyramid.append(coarsen(pyramid[-1]))
+
+    path = pyramid_path(base_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "wb") as f:
+        np.savez(f, origin=np.array(CHICAGO_BBOX[::2]), step=np.array([FINE_LAT, FINE_LON]),
+                 **{f"level_{k}": counts for k, counts in enumerate(pyramid)})
+    os.replace(path + ".tmp", path)
+    print(f"✔ Grid pyramid: {total - outside:,} of {total:,} incidents in {shape[0]}x{shape[1]} cells, "
+          f"{levels} levels → {path} ({time.time() - start:.1f}s)")
+    return GridPyramid(pyramid, CHICAGO_BBOX[::2], (FINE_LAT, FINE_LON))
+
+
+# ---------------------------
+# QUERY
+# ---------------------------
+class GridPyramid:
+    def __init__(self, levels, origin, step):
+        self.levels = list(levels)
+        self.origin = tuple(float(v) for v in origin)        # (lat, lon) of the grid's south-west corner
+        self.step = tuple(float(v) for v in step)            # finest cell (lat, lon) size in degrees
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as z:
+            n = sum(1 for k in z.files if k.startswith("level_"))
+            return cls([z[f"level_{k}"] for k in range(n)], z["origin"], z["step"])
+
+    def cell_size(self, level):
+        """Approximate cell width in metres."""
+        return self.step[0] * 111_320 * 2 ** level
+
+    def level_for(self, metres):
+        """Level whose cell width is nearest to `metres` (widths double per level, so compared on a log scale)."""
+        gaps = [abs(np.log(self.cell_size(k) / metres)) for k in range(len(self.levels))]
+        return int(np.argmin(gaps))
+
+    def counts(self, level):
+        return self.levels[level]
+
+    def zscores(self, level):
+        """(count - mean of the 8 neighbours) / sqrt(neighbour mean + 1) per cell."""
+        c = self.levels[level].astype(np.float64)
+        padded = np.pad(c, 1)
+        box = sum(padded[1 + dr:1 + dr + c.shape[0], 1 + dc:1 + dc + c.shape[1]]
+                  for dr in (-1, 0, 1) for dc in (-1, 0, 1))
+        neighbours = (box - c) / 8
+        return (c - neighbours) / np.sqrt(neighbours + 1)
+
+    def centers(self, level, rows, cols):
+        size = 2 ** level
+        lat = self.origin[0] + (np.asarray(rows) + 0.5) * size * self.step[0]
+        lon = self.origin[1] + (np.asarray(cols) + 0.5) * size * self.step[1]
+        return lat, lon
+
+    def top_cells(self, level, k=30, rank="count", min_count=MIN_COUNT):
+        """The `k` highest cells at `level` by count or z-score, with centre and bounds."""
+        counts = self.levels[level]
+        z = self.zscores(level)
+        score = counts if rank == "count" else z
+        flat = np.flatnonzero(counts.ravel() >= min_count)
+        order = flat[np.argsort(-score.ravel()[flat], kind="stable")][:k]
+        rows, cols = np.divmod(order, counts.shape[1])
+        lat, lon = self.centers(level, rows, cols)
+        half_lat, half_lon = 2 ** level * self.step[0] / 2, 2 ** level * self.step[1] / 2
+        return pd.DataFrame({
+            "cell_id": order, "level": level, "row": rows, "col": cols,
+            "count": counts.ravel()[order], "zscore": z.ravel()[order].round(2),
+            "latitude": lat, "longitude": lon,
+            "lat_min": lat - half_lat, "lat_max": lat + half_lat,
+            "lon_min": lon - half_lon, "lon_max": lon + half_lon,
+        })
+
+    def nonzero_cells(self, level):
+        """(latitude, longitude, count) of every non-empty cell, e.g. for a weighted heatmap."""
+        counts = self.levels[level]
+        rows, cols = np.nonzero(counts)
+        lat, lon = self.centers(level, rows, cols)
+        return pd.DataFrame({"latitude": lat, "longitude": lon, "count": counts[rows, cols]})
+
+
+def _store_mtime(base_dir):
+    files = glob.glob(os.path.join(store_path(base_dir), "year=*", "*.parquet"))
+    return max((os.path.getmtime(f) for f in files), default=0)
+
+
+def load_pyramid(base_dir=None):
+    """The pyramid (cached per file), rebuilt first if missing or older than the cleaned store."""
+    base_dir = base_dir or BASE_DIR
+    path = pyramid_path(base_dir)
+    if not os.path.exists(path) or os.path.getmtime(path) < _store_mtime(base_dir):
+        build_pyramid(base_dir)
+    mtime = os.path.getmtime(path)
+    cached = _CACHE.get(path)
+    if cached is None or cached[0] != mtime:
+        _CACHE[path] = (mtime, GridPyramid.load(path))
+    return _CACHE[path][1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--metres", type=float, default=500, help="cell size to report")
+    parser.add_argument("--rank", choices=["count", "zscore"], default="count")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    pyr = build_pyramid()
+    level = pyr.level_for(args.metres)
+    print(f"Level {level} (~{pyr.cell_size(level):.0f} m cells), top {args.top} by {args.rank}:")
+    print(pyr.top_cells(level, args.top, args.rank).to_string(index=False))
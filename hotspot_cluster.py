@@ -1,55 +1,209 @@
-import pandas as pd
+# hotspot_cluster.py
+# KMeans hotspots fitted on a 300k-row sample of the coordinates. Every row's
+# cluster is written to a small sidecar next to the store instead of a copy of
+# the dataset: hotspots/assignments/year=YYYY/part-N.parquet holds (id,
+# cluster) in the same row order as cleaned_crimes/year=YYYY/part-N.parquet.
+# Partitions are assigned in a process pool and each returns per-cluster
+# counts and coordinate sums, so the report needs no second pass.
+# method="grid" skips KMeans and ranks cells of the grid pyramid
+# (grid_hotspots.py) instead, over the full history at any cell size.
+import os
+import glob
+import time
+import shutil
+import argparse
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from sklearn.cluster import KMeans
-import os
+from dataset import columns, has_store, iter_batches, sample_crimes, store_path
+from spatial_clusters import nearest_center as _nearest
 
 BASE_DIR = r"D:\crime_project2"
-DATA_PATH = os.path.join(BASE_DIR, "cleaned_crimes.csv")
 HOT_DIR = os.path.join(BASE_DIR, "hotspots")
 os.makedirs(HOT_DIR, exist_ok=True)
 
+ASSIGN_NAME = "assignments"     # sidecar directory under hotspots/
+SAMPLE_SIZE = 300000
+UNASSIGNED = -1                 # no coordinates
+
+
+def assignments_path(base_dir=None):
+    return os.path.join(base_dir or BASE_DIR, "hotspots", ASSIGN_NAME)
+
+
+# ---------------------------
+# ASSIGNMENT
+# ---------------------------
+def nearest_center(coords, centers):
+    """spatial_clusters.nearest_center (chunked, origin-shifted) with -1 where coords are NaN."""
+    coords = np.asarray(coords, dtype=np.float64)
+    ok = ~np.isnan(coords).any(axis=1)
+    labels = np.full(len(coords), UNASSIGNED, dtype=np.int16)
+    if ok.any():
+        labels[ok] = _nearest(coords[ok], centers)
+    return labels
+
+
+def _tally(labels, coords, k):
+    ok = labels >= 0
+    lab = labels[ok]
+    return (np.bincount(lab, minlength=k),
+            np.bincount(lab, weights=coords[ok, 0], minlength=k),
+            np.bincount(lab, weights=coords[ok, 1], minlength=k))
+
+
+def _write_sidecar(labels, ids, out):
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    cols = {"cluster": pa.array(labels)}
+    if ids is not None:
+        cols = {"id": pa.array(ids), **cols}
+    pq.write_table(pa.table(cols), out)
+
+
+def assign_partition(src, out, centers):
+    """Assign one store file and write its sidecar; returns (rows, counts, lat sums, lon sums)."""
+    want = [c for c in ["id", "latitude", "longitude"] if c in pq.read_schema(src).names]
+    table = pq.read_table(src, columns=want, memory_map=True)
+    coords = np.column_stack([table["latitude"].to_numpy(zero_copy_only=False),
+                              table["longitude"].to_numpy(zero_copy_only=False)]).astype(np.float64)
+    labels = nearest_center(coords, centers)
+    _write_sidecar(labels, table["id"].to_numpy(zero_copy_only=False) if "id" in want else None, out)
+    return (len(labels),) + _tally(labels, coords, len(centers))
 
-def find_hotspots(n_clusters=30):
-    print("📌 Loading cleaned_crimes.csv ...")
-    df = pd.read_csv(DATA_PATH)
-    df.columns = [c.lower() for c in df.columns]
 
+def _init_worker(threads):
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(threads)
+    except ImportError:
+        pass
+
+
+def assign_all(centers, base_dir=None, workers=None):
+    """Write the sidecar for the whole store; returns per-cluster counts and mean coordinates."""
+    base_dir = base_dir or BASE_DIR
+    k = len(centers)
+    out_dir = assignments_path(base_dir)
+    tmp_dir = out_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    counts, lat, lon, rows = np.zeros(k), np.zeros(k), np.zeros(k), 0
+    if has_store(base_dir):
+        root = store_path(base_dir)
+        files = sorted(glob.glob(os.path.join(root, "year=*", "*.parquet")))
+        targets = [os.path.join(tmp_dir, os.path.relpath(f, root)) for f in files]
+        workers = max(1, min(workers or os.cpu_count() or 1, len(files)))
+        if workers == 1:
+            results = [assign_partition(f, t, centers) for f, t in zip(files, targets)]
+        else:
+            threads = max(1, (os.cpu_count() or 1) // workers)
+            ctx = mp.get_context("spawn")
+            with ProcessPoolExecutor(workers, mp_context=ctx, initializer=_init_worker,
+                                     initargs=(threads,)) as pool:
+                results = list(pool.map(assign_partition, files, targets, [centers] * len(files)))
+    else:
+        # CSV fallback: one sidecar file per batch, in file order
+        results = []
+        want = [c for c in ["id", "latitude", "longitude"] if c in columns(base_dir)]
+        for i, batch in enumerate(iter_batches(want, base_dir=base_dir)):
+            coords = batch[["latitude", "longitude"]].to_numpy(dtype=np.float64)
+            labels = nearest_center(coords, centers)
+            _write_sidecar(labels, batch["id"].to_numpy() if "id" in want else None,
+                           os.path.join(tmp_dir, f"batch-{i:05d}.parquet"))
+            results.append((len(labels),) + _tally(labels, coords, k))
+
+    for n, c, la, lo in results:
+        rows += n
+        counts += c
+        lat += la
+        lon += lo
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.makedirs(tmp_dir, exist_ok=True)
+    os.replace(tmp_dir, out_dir)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        report = pd.DataFrame({"cluster_id": np.arange(k), "count": counts.astype(np.int64),
+                               "latitude": lat / counts, "longitude": lon / counts})
+    return report, rows
+
+
+def load_assignments(base_dir=None):
+    """The sidecar as one DataFrame (id, cluster, year) in store order."""
+    path = assignments_path(base_dir)
+    if not os.path.isdir(path):
+        raise FileNotFoundError(f"No hotspot assignments in {path}. Run hotspot_cluster.py")
+    files = sorted(glob.glob(os.path.join(path, "year=*", "*.parquet"))) or \
+        sorted(glob.glob(os.path.join(path, "*.parquet")))
+    parts = []
+    for f in files:
+        part = pq.read_table(f).to_pandas()
+        year = os.path.basename(os.path.dirname(f))
+        if year.startswith("year="):
+            part["year"] = np.int16(year[5:])
+        parts.append(part)
+    return pd.concat(parts, ignore_index=True)
+
+
+# ---------------------------
+# HOTSPOTS
+# ---------------------------
+def grid_report(n=30, base_dir=None, metres=500, rank="count"):
+    """Top `n` grid cells (~`metres` wide) in the hotspot report's columns, cluster_id = cell id."""
+    from grid_hotspots import load_pyramid
+
+    pyramid = load_pyramid(base_dir)
+    cells = pyramid.top_cells(pyramid.level_for(metres), n, rank)
+    return cells.rename(columns={"cell_id": "cluster_id"})
+
+
+def find_hotspots(n_clusters=30, base_dir=None, workers=None, method="kmeans", metres=500, rank="count"):
+    base_dir = base_dir or BASE_DIR
     # Latitude & longitude required
-    if "latitude" not in df.columns or "longitude" not in df.columns:
-        raise ValueError("❌ Missing latitude/longitude in cleaned_crimes.csv")
+    if "latitude" not in columns(base_dir) or "longitude" not in columns(base_dir):
+        raise ValueError("❌ Missing latitude/longitude in cleaned dataset")
 
-    print("📌 Sampling 300k rows to speed up clustering...")
-    df_sample = df.sample(min(300000, len(df)), random_state=42)
+    if method == "grid":
+        start = time.time()
+        report = grid_report(n_clusters, base_dir, metres, rank)
+        hot_dir = os.path.join(base_dir, "hotspots")
+        os.makedirs(hot_dir, exist_ok=True)
+        report_path = os.path.join(hot_dir, "hotspot_report.csv")
+        report.to_csv(report_path, index=False)
+        print(f"✔ Top {len(report)} grid cells by {rank} in {(time.time() - start) * 1000:.0f} ms → {report_path}")
+        return report
 
-    coords = df_sample[["latitude", "longitude"]].values
+    print(f"📌 Sampling {SAMPLE_SIZE:,} rows to speed up clustering...")
+    sample = sample_crimes(SAMPLE_SIZE, ["latitude", "longitude"], base_dir=base_dir, random_state=42)
+    coords = sample[["latitude", "longitude"]].dropna().to_numpy(dtype=np.float64)
 
     print(f"📌 Running K-Means with {n_clusters} clusters...")
     kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-    df_sample["cluster"] = kmeans.fit_predict(coords)
-
-    print("📌 Saving cluster labels back to full dataset ...")
-    # Predict for entire dataset
-    full_coords = df[["latitude", "longitude"]].values
-    df["cluster"] = kmeans.predict(full_coords)
+    kmeans.fit(coords)
+    centers = kmeans.cluster_centers_
 
-    # Save updated dataset
-    updated_path = os.path.join(BASE_DIR, "cleaned_crimes_with_clusters.csv")
-    df.to_csv(updated_path, index=False)
-    print(f"✔ Saved updated dataset with clusters → {updated_path}")
+    print("📌 Assigning every row to its cluster (sidecar, in parallel) ...")
+    start = time.time()
+    report, rows = assign_all(centers, base_dir, workers)
+    print(f"✔ {rows:,} rows assigned in {time.time() - start:.1f}s → {assignments_path(base_dir)}")
 
     # Save cluster centers for REGION MAPPING
-    centers = pd.DataFrame(kmeans.cluster_centers_, columns=["latitude", "longitude"])
-    centers["cluster_id"] = centers.index
-    centers_path = os.path.join(HOT_DIR, "cluster_centers.csv")
-    centers.to_csv(centers_path, index=False)
+    hot_dir = os.path.join(base_dir, "hotspots")
+    os.makedirs(hot_dir, exist_ok=True)
+    centers_df = pd.DataFrame(centers, columns=["latitude", "longitude"])
+    centers_df["cluster_id"] = centers_df.index
+    centers_path = os.path.join(hot_dir, "cluster_centers.csv")
+    centers_df.to_csv(centers_path, index=False)
     print(f"✔ Saved cluster centers → {centers_path}")
 
-    # Hotspot summary
+    # Hotspot summary straight from the per-partition counts
     print("📌 Generating hotspot summary...")
-    report = df["cluster"].value_counts().reset_index()
-    report.columns = ["cluster_id", "count"]
-    report = report.sort_values("count", ascending=False)
-    report_path = os.path.join(HOT_DIR, "hotspot_report.csv")
+    report = report.sort_values("count", ascending=False).reset_index(drop=True)
+    report_path = os.path.join(hot_dir, "hotspot_report.csv")
     report.to_csv(report_path, index=False)
 
     print(f"✔ Saved hotspot_report.csv → {report_path}")
@@ -59,4 +213,12 @@ def find_hotspots(n_clusters=30):
 
 
 if __name__ == "__main__":
-    find_hotspots(n_clusters=30)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clusters", type=int, default=30)
+    parser.add_argument("--workers", type=int, help="assignment processes (default: cores)")
+    parser.add_argument("--method", choices=["kmeans", "grid"], default="kmeans")
+    parser.add_argument("--metres", type=float, default=500, help="grid cell size (--method grid)")
+    parser.add_argument("--rank", choices=["count", "zscore"], default="count", help="grid ranking (--method grid)")
+    args = parser.parse_args()
+    find_hotspots(n_clusters=args.clusters, workers=args.workers, method=args.method,
+                  metres=args.metres, rank=args.rank)
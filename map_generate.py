@@ -3,6 +3,7 @@ import os
 import pandas as pd
 import folium
 from folium.plugins import HeatMap
+from grid_hotspots import load_pyramid
 
 BASE_DIR = r"D:\crime_project2"
 OUT_DIR = os.path.join(BASE_DIR, "maps")
@@ -75,14 +76,16 @@ def load_cluster_centers():
     return df
 
 
-def create_heatmap(n=50000, out="heatmap_color_clusters.html"):
+def create_heatmap(n=50000, out="heatmap_color_clusters.html", base_dir=BASE_DIR, metres=220, top=10):
     """Generate heatmap + color-coded cluster markers"""
 
-    # Load crime data for heatmap
-    df = pd.read_csv(os.path.join(BASE_DIR, "cleaned_crimes.csv"))
-    df = df.dropna(subset=["latitude", "longitude"])
-
-    coords = df[["latitude", "longitude"]].head(n).values.tolist()
+    # Heat from the grid pyramid: every incident in the history, one weighted point per cell
+    # (the `n` busiest cells of about `metres` width)
+    pyramid = load_pyramid(base_dir)
+    level = pyramid.level_for(metres)
+    cells = pyramid.nonzero_cells(level).nlargest(n, "count")
+    cells["weight"] = cells["count"] / cells["count"].max()
+    coords = cells[["latitude", "longitude", "weight"]].values.tolist()
 
     # Base Map
     m = folium.Map(
@@ -94,6 +97,14 @@ def create_heatmap(n=50000, out="heatmap_color_clusters.html"):
     # Heatmap Layer
     HeatMap(coords, radius=8, blur=4, min_opacity=0.3).add_to(m)
 
+    # Top grid cells as outlined squares
+    for _, cell in pyramid.top_cells(level, top, rank="zscore").iterrows():
+        folium.Rectangle(
+            bounds=[[cell["lat_min"], cell["lon_min"]], [cell["lat_max"], cell["lon_max"]]],
+            color="#000000", weight=2, fill=False,
+            popup=f"<b>{int(cell['count'])}</b> incidents, z = {cell['zscore']:.1f}",
+        ).add_to(m)
+
     # Load cluster centers
     centers = load_cluster_centers()
     if centers is not None:
@@ -126,7 +137,9 @@ def create_heatmap(n=50000, out="heatmap_color_clusters.html"):
             ).add_to(m)
 
     # Save output
-    out_path = os.path.join(OUT_DIR, out)
+    out_dir = os.path.join(base_dir, "maps")
+    os.makedirs(out_dir, exist_ok=True)
+    out_path = os.path.join(out_dir, out)
     m.save(out_path)
     print(f"✔ Saved color-coded heatmap to: {out_path}")
 
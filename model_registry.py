@@ -0,0 +1,235 @@
+# model_registry.py
+# Lazy, thread-safe access to the saved models. Each artifact is loaded on
+# first use, shared by every thread of the process, and swapped atomically
+# when its file changes on disk. LightGBM is stored in its native text
+# format and Prophet as JSON; the older joblib pickles are still readable.
+import os
+import json
+import time
+import argparse
+import threading
+import joblib
+import numpy as np
+
+BASE_DIR = r"D:\crime_project2"
+MODEL_DIR = os.path.join(BASE_DIR, "models")
+PROPHET_DIR = os.path.join(BASE_DIR, "prophet_models")
+
+LGBM_FILE = "lgbm_3groups_model.txt"
+LGBM_LEGACY = "lgbm_3groups_model.joblib"
+LABELS_FILE = "label_classes.json"
+LABELS_LEGACY = "label_encoder.joblib"
+RESOLVER_FILE = "spatial_resolver.npz"
+KMEANS_FILE = "kmeans_spatial.joblib"
+RISK_GRID_FILE = "risk_grid.npy"
+PERIODS = ["M", "Q", "A"]
+
+
+# ---------------------------
+# NATIVE FORMATS (written to .tmp then renamed, so readers never see half a file)
+# ---------------------------
+def _atomic_write(path, write):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    write(tmp)
+    os.replace(tmp, path)
+    return path
+
+
+def save_lgbm(booster, model_dir=MODEL_DIR):
+    return _atomic_write(os.path.join(model_dir, LGBM_FILE), lambda p: booster.save_model(p))
+
+
+def save_labels(classes, model_dir=MODEL_DIR):
+    def write(p):
+        with open(p, "w") as f:
+            json.dump([str(c) for c in classes], f)
+    return _atomic_write(os.path.join(model_dir, LABELS_FILE), write)
+
+
+def save_prophet(model, period, prophet_dir=PROPHET_DIR):
+    from prophet.serialize import model_to_json
+
+    def write(p):
+        with open(p, "w") as f:
+            f.write(model_to_json(model))
+    return _atomic_write(os.path.join(prophet_dir, f"prophet_{period}.json"), write)
+
+
+def load_lgbm(path):
+    if path.endswith(".joblib"):
+        return joblib.load(path)
+    import lightgbm as lgb
+    return lgb.Booster(model_file=path)
+
+
+def load_labels(path):
+    # A fitted LabelEncoder either way, so inverse_transform keeps working
+    if path.endswith(".joblib"):
+        return joblib.load(path)
+    from sklearn.preprocessing import LabelEncoder
+    with open(path) as f:
+        le = LabelEncoder()
+        le.classes_ = np.array(json.load(f), dtype=object)
+    return le
+
+
+def load_prophet(path):
+    if path.endswith(".joblib"):
+        return joblib.load(path)
+    from prophet.serialize import model_from_json
+    with open(path) as f:
+        return model_from_json(f.read())
+
+
+def load_resolver(path):
+    from spatial_clusters import ClusterResolver
+    if path.endswith(".npz"):
+        return ClusterResolver.load(path)
+    return ClusterResolver.from_kmeans(path)
+
+
+def load_risk_grid(path):
+    from risk_grid import RiskGrid
+    return RiskGrid.load(path)
+
+
+# ---------------------------
+# REGISTRY
+# ---------------------------
+class _Entry:
+    def __init__(self, candidates, loader):
+        self.candidates = candidates     # preferred file first, legacy formats after
+        self.loader = loader
+        self.lock = threading.Lock()
+        self.obj = None
+        self.path = None
+        self.stamp = None
+        self.checked = 0.0
+        self.loads = 0
+        self.load_seconds = None
+        self.loaded_at = None
+        self.error = None
+
+
+def _stamp(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+class ModelRegistry:
+    def __init__(self, check_interval=2.0):
+        self.check_interval = check_interval
+        self.entries = {}
+
+    def register(self, name, candidates, loader):
+        self.entries[name] = _Entry(list(candidates), loader)
+
+    def path(self, name):
+        """File the artifact would be loaded from (first candidate that exists)."""
+        for p in self.entries[name].candidates:
+            if os.path.exists(p):
+                return p
+        return None
+
+    def get(self, name):
+        e = self.entries[name]
+        now = time.monotonic()
+        if e.obj is not None and now - e.checked < self.check_interval:
+            return e.obj
+
+        with e.lock:
+            e.checked = time.monotonic()
+            path = self.path(name)
+            if path is None:
+                if e.obj is not None:
+                    return e.obj
+                raise FileNotFoundError(f"No artifact for '{name}': tried {e.candidates}")
+
+            stamp = _stamp(path)
+            if e.obj is not None and (path, stamp) == (e.path, e.stamp):
+                return e.obj
+
+            start = time.perf_counter()
+            try:
+                obj = e.loader(path)
+            except Exception as exc:
+                # Half-written or broken file: keep serving the previous model
+                e.error = f"{type(exc).__name__}: {exc}"
+                if e.obj is not None:
+                    return e.obj
+                raise
+
+            # Swap in only once fully loaded
+            e.obj, e.path, e.stamp = obj, path, stamp
+            e.load_seconds = round(time.perf_counter() - start, 4)
+            e.loaded_at = time.strftime("%Y-%m-%d %H:%M:%S")
+            e.loads += 1
+            e.error = None
+            print(f"✔ Loaded {name} from {os.path.basename(path)} in {e.load_seconds * 1000:.0f} ms")
+            return obj
+
+    def stats(self):
+        return {
+            name: {"path": e.path, "loads": e.loads, "load_seconds": e.load_seconds,
+                   "loaded_at": e.loaded_at, "error": e.error}
+            for name, e in self.entries.items()
+        }
+
+
+def default_registry(model_dir=MODEL_DIR, prophet_dir=PROPHET_DIR):
+    reg = ModelRegistry()
+    reg.register("crime_model", [os.path.join(model_dir, LGBM_FILE), os.path.join(model_dir, LGBM_LEGACY)], load_lgbm)
+    reg.register("label_encoder", [os.path.join(model_dir, LABELS_FILE), os.path.join(model_dir, LABELS_LEGACY)],
+                 load_labels)
+    reg.register("spatial_resolver", [os.path.join(model_dir, RESOLVER_FILE), os.path.join(model_dir, KMEANS_FILE)],
+                 load_resolver)
+    reg.register("risk_grid", [os.path.join(model_dir, RISK_GRID_FILE)], load_risk_grid)
+    for p in PERIODS:
+        reg.register(f"prophet_{p}", [os.path.join(prophet_dir, f"prophet_{p}.json"),
+                                      os.path.join(prophet_dir, f"prophet_{p}.joblib")], load_prophet)
+    return reg
+
+
+_REGISTRIES = {}
+_REGISTRIES_LOCK = threading.Lock()
+
+
+def get_registry(model_dir=MODEL_DIR, prophet_dir=PROPHET_DIR):
+    """One registry per (model_dir, prophet_dir) per process."""
+    key = (os.path.abspath(model_dir), os.path.abspath(prophet_dir))
+    with _REGISTRIES_LOCK:
+        if key not in _REGISTRIES:
+            _REGISTRIES[key] = default_registry(model_dir, prophet_dir)
+        return _REGISTRIES[key]
+
+
+# ---------------------------
+# ONE-OFF MIGRATION OF EXISTING PICKLES
+# ---------------------------
+def convert_legacy(model_dir=MODEL_DIR, prophet_dir=PROPHET_DIR):
+    legacy = os.path.join(model_dir, LGBM_LEGACY)
+    if os.path.exists(legacy):
+        print("✔", save_lgbm(joblib.load(legacy), model_dir))
+    legacy = os.path.join(model_dir, LABELS_LEGACY)
+    if os.path.exists(legacy):
+        print("✔", save_labels(joblib.load(legacy).classes_, model_dir))
+    for p in PERIODS:
+        legacy = os.path.join(prophet_dir, f"prophet_{p}.joblib")
+        if os.path.exists(legacy):
+            print("✔", save_prophet(joblib.load(legacy), p, prophet_dir))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--convert", action="store_true", help="write native/JSON copies of existing joblib models")
+    args = parser.parse_args()
+
+    if args.convert:
+        convert_legacy()
+
+    reg = get_registry()
+    for name in reg.entries:
+        if reg.path(name):
+            reg.get(name)
+    print(json.dumps(reg.stats(), indent=2))
@@ -0,0 +1,214 @@
+# pipeline.py
+# Runs every stage in order through the stage cache; stages whose inputs,
+# parameters and code are unchanged are skipped and their artifacts reused.
+import os
+import argparse
+from stage_cache import StageCache
+
+BASE_DIR = r"D:\crime_project2"
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+RAW_FILE = os.path.join(BASE_DIR, "ijzp-q8t2 (4).csv")
+RAW_STORE = os.path.join(BASE_DIR, "raw_store")          # data_download.py --mode ingest
+CLEAN_DIR = os.path.join(BASE_DIR, "cleaned_crimes")     # Parquet by year (dataset.py)
+CUBE_FILE = os.path.join(BASE_DIR, "daily_counts.parquet")  # count_cube.py
+MODEL_DIR = os.path.join(BASE_DIR, "models")
+PROPHET_DIR = os.path.join(BASE_DIR, "prophet_models")
+HOT_DIR = os.path.join(BASE_DIR, "hotspots")
+MAP_DIR = os.path.join(BASE_DIR, "maps")
+
+
+def code(*files):
+    return [os.path.join(CODE_DIR, f) for f in files]
+
+
+# ---------------------------
+# STAGES (modules imported lazily so a skipped stage costs nothing)
+# ---------------------------
+def run_preprocess(raw, cache, stage):
+    import preprocess
+
+    # Same code + params, new/changed ingest partitions only:
+    # re-clean just those years with the saved KMeans
+    incremental = (
+        os.path.isdir(raw)
+        and stage is not None
+        and cache.same_code("preprocess", stage["params"], stage["code"])
+        and os.path.isdir(CLEAN_DIR)
+        and os.path.exists(os.path.join(MODEL_DIR, "kmeans_spatial.joblib"))
+    )
+    if incremental:
+        changed = [os.path.join(raw, rel) for rel in cache.changed_inputs("preprocess", raw) if rel.endswith(".csv")]
+        print(f"  incremental: {len(changed)} changed partition(s)")
+        preprocess.preprocess_streaming(raw, CLEAN_DIR, only_files=changed)
+    else:
+        preprocess.preprocess_streaming(raw, CLEAN_DIR)
+
+
+def run_train():
+    import train_models
+    train_models.train()
+
+
+def run_risk_grid():
+    import risk_grid
+    risk_grid.build_risk_grid()
+
+
+def run_location():
+    import train_location
+    train_location.build_resolver()
+
+
+def run_prophet():
+    import forecast_prophet
+    # Only series with a newly completed period are refitted (all of them on the first run)
+    forecast_prophet.refresh(["M", "Q", "A"], ["city", "district", "cluster"])
+
+
+def run_forecast_store():
+    import forecast_store
+    forecast_store.precompute()
+
+
+def run_backtest():
+    import backtest
+    backtest.run_backtests()
+
+
+def run_fast_forecast():
+    import fast_forecast
+    fast_forecast.forecast_many(["city", "district", "cluster", "beat_group"])
+
+
+def run_grid_pyramid():
+    import grid_hotspots
+    grid_hotspots.build_pyramid()
+
+
+def run_hotspots():
+    import hotspot_cluster
+    hotspot_cluster.find_hotspots(n_clusters=30)
+
+
+def run_map():
+    import map_generate
+    map_generate.create_heatmap()
+
+
+def build_stages(raw, cache, force=False):
+    pre = {
+        "name": "preprocess",
+        "inputs": [raw],
+        "outputs": [CLEAN_DIR, CUBE_FILE, os.path.join(MODEL_DIR, "kmeans_spatial.joblib")],
+        "params": {"n_clusters": 30},
+        "code": code("preprocess.py", "category_map.py", "spatial_clusters.py", "dataset.py", "features.py",
+                     "count_cube.py"),
+    }
+    pre["func"] = lambda: run_preprocess(raw, cache, None if force else pre)
+
+    return [
+        pre,
+        {
+            "name": "train_models", "func": run_train,
+            "inputs": [CLEAN_DIR],
+            "outputs": [os.path.join(MODEL_DIR, "lgbm_3groups_model.txt"),
+                        os.path.join(MODEL_DIR, "label_classes.json")],
+            "code": code("train_models.py", "category_map.py", "dataset.py", "features.py", "model_registry.py"),
+        },
+        {
+            "name": "risk_grid", "func": run_risk_grid,
+            "inputs": [os.path.join(MODEL_DIR, "lgbm_3groups_model.txt"),
+                       os.path.join(MODEL_DIR, "label_classes.json"), CLEAN_DIR],
+            "outputs": [os.path.join(MODEL_DIR, "risk_grid.npy"), os.path.join(MODEL_DIR, "risk_grid.json")],
+            "code": code("risk_grid.py", "features.py", "dataset.py", "model_registry.py"),
+        },
+        {
+            "name": "train_location", "func": run_location,
+            "inputs": [os.path.join(MODEL_DIR, "kmeans_spatial.joblib")],
+            "outputs": [os.path.join(MODEL_DIR, "spatial_resolver.npz")],
+            "params": {"grid_step": 0.001},
+            "code": code("train_location.py", "spatial_clusters.py"),
+        },
+        {
+            "name": "forecast_prophet", "func": run_prophet,
+            "inputs": [CUBE_FILE],
+            "outputs": [os.path.join(PROPHET_DIR, f"prophet_{p}.json") for p in ["M", "Q", "A"]]
+                       + [os.path.join(PROPHET_DIR, "fit_log.csv"), os.path.join(PROPHET_DIR, "watermarks.json")],
+            "params": {"periods": ["M", "Q", "A"], "levels": ["city", "district", "cluster"]},
+            "code": code("forecast_prophet.py", "count_cube.py", "model_registry.py"),
+        },
+        {
+            "name": "forecast_store", "func": run_forecast_store,
+            "inputs": [os.path.join(PROPHET_DIR, f"prophet_{p}.json") for p in ["M", "Q", "A"]],
+            "outputs": [os.path.join(PROPHET_DIR, "forecast_store.parquet")],
+            "params": {"max_horizon": {"M": 60, "Q": 20, "A": 10}},
+            "code": code("forecast_store.py", "model_registry.py"),
+        },
+        {
+            "name": "backtest", "func": run_backtest,
+            "inputs": [CUBE_FILE],
+            "outputs": [os.path.join(PROPHET_DIR, "forecast_metrics.csv")],
+            "params": {"periods": ["M", "Q", "A"], "mode": "expanding"},
+            "code": code("backtest.py", "count_cube.py", "forecast_prophet.py"),
+        },
+        {
+            "name": "fast_forecast", "func": run_fast_forecast,
+            "inputs": [CUBE_FILE, CLEAN_DIR],
+            "outputs": [os.path.join(PROPHET_DIR, "fast_forecasts.parquet")],
+            "params": {"levels": ["city", "district", "cluster", "beat_group"], "engine": "holt_winters",
+                       "horizon": {"M": 12, "Q": 8, "A": 3}},
+            "code": code("fast_forecast.py", "count_cube.py", "dataset.py", "category_map.py"),
+        },
+        {
+            "name": "grid_pyramid", "func": run_grid_pyramid,
+            "inputs": [CLEAN_DIR],
+            "outputs": [os.path.join(HOT_DIR, "grid_pyramid.npz")],
+            "params": {"levels": 7, "fine_lat": 0.001},
+            "code": code("grid_hotspots.py", "dataset.py", "spatial_clusters.py"),
+        },
+        {
+            "name": "hotspots", "func": run_hotspots,
+            "inputs": [CLEAN_DIR],
+            "outputs": [os.path.join(HOT_DIR, "cluster_centers.csv"),
+                        os.path.join(HOT_DIR, "hotspot_report.csv"), os.path.join(HOT_DIR, "assignments")],
+            "params": {"n_clusters": 30},
+            "code": code("hotspot_cluster.py", "dataset.py"),
+        },
+        {
+            "name": "map", "func": run_map,
+            "inputs": [os.path.join(HOT_DIR, "grid_pyramid.npz"), "/mnt/data/cluster_centers.csv"],
+            "outputs": [os.path.join(MAP_DIR, "heatmap_color_clusters.html")],
+            "params": {"n": 50000, "metres": 220, "top": 10},
+            "code": code("map_generate.py", "grid_hotspots.py"),
+        },
+    ]
+
+
+def default_raw():
+    return RAW_STORE if os.path.isdir(RAW_STORE) else RAW_FILE
+
+
+def run_pipeline(only=None, force=False, cache=None, raw=None):
+    cache = cache or StageCache()
+    ran = []
+    for stage in build_stages(raw or default_raw(), cache, force):
+        if only and stage["name"] not in only:
+            continue
+        if cache.run(
+            stage["name"], stage["func"],
+            inputs=stage["inputs"], outputs=stage["outputs"],
+            params=stage.get("params"), code=stage["code"], force=force
+        ):
+            ran.append(stage["name"])
+    print("Stages re-run:", ran or "none")
+    return ran
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--only", nargs="*", help="run just these stages")
+    parser.add_argument("--force", action="store_true", help="ignore the cache")
+    parser.add_argument("--raw", help="raw CSV or ingest store directory (default: store if present)")
+    args = parser.parse_args()
+    run_pipeline(only=args.only, force=args.force, raw=args.raw)
@@ -1,89 +1,257 @@
 # Updated predict.py for LightGBM 3-class model
-import joblib
+import numpy as np
 import pandas as pd
 import os
+import time
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing as mp
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from features import FEATURES, build_feature_frame, feature_matrix, feature_vector
+from prediction_cache import shared_cache, feature_key
+from model_registry import get_registry
+from risk_grid import grid_predict, live_grid
 
 BASE_DIR = r"D:\crime_project2"
 MODEL_DIR = os.path.join(BASE_DIR, "models")
+PROPHET_DIR = os.path.join(BASE_DIR, "prophet_models")
+CACHE_DB = None     # optional sqlite file behind crime_cache() (the Streamlit app keeps one)
 
-# Load LightGBM model + label encoder
-model = joblib.load(os.path.join(MODEL_DIR, "lgbm_3groups_model.joblib"))
-label_encoder = joblib.load(os.path.join(MODEL_DIR, "label_encoder.joblib"))
+
+# -----------------------------
+# Models (loaded lazily on first use, reloaded when the files change)
+# -----------------------------
+def registry():
+    return get_registry(MODEL_DIR, PROPHET_DIR)
+
+
+def crime_cache():
+    # Repeated feature vectors (dashboards, scenario grids) are answered from here;
+    # entries are dropped automatically when the model or label files change on disk
+    reg = registry()
+    artifacts = reg.entries["crime_model"].candidates + reg.entries["label_encoder"].candidates
+    return shared_cache(f"crime_group:{MODEL_DIR}", artifacts, maxsize=200_000, ttl=24 * 3600, disk_path=CACHE_DB)
 
 
 # -----------------------------
-# Feature engineering (MUST MATCH preprocess.py)
+# Feature engineering (shared with preprocess/training via features.py)
 # -----------------------------
 def build_features(year, month, day, hour, beat, district, ward, community_area):
-
-    ts = pd.Timestamp(year=year, month=month, day=day)
-
-    day_of_week = ts.dayofweek
-    is_weekend = 1 if day_of_week >= 5 else 0
-
-    # Season mapping
-    if month in [3, 4, 5]:
-        season = 1
-    elif month in [6, 7, 8]:
-        season = 2
-    elif month in [9, 10, 11]:
-        season = 3
-    else:
-        season = 4
-
-    # Hour category
-    if hour < 6:
-        hour_group = 0
-    elif hour < 12:
-        hour_group = 1
-    elif hour < 18:
-        hour_group = 2
-    else:
-        hour_group = 3
-
-    # HOTSPOT flag (same as preprocess.py)
-    TOP_BEATS = [332, 2523, 1933, 224, 1022, 1113, 414, 2023, 1221, 925]
-    hotspot_area = 1 if beat in TOP_BEATS else 0
-
-    row = pd.DataFrame([{
-        "year": year,
-        "month": month,
-        "day": day,
-        "hour": hour,
-        "day_of_week": day_of_week,
-        "is_weekend": is_weekend,
-        "season": season,
-        "hour_group": hour_group,
-        "beat": beat,
-        "district": district,
-        "ward": ward,
-        "community_area": community_area,
-        "hotspot_area": hotspot_area
-    }])
-
-    return row
+    # Scalars give one row; equal-length arrays give one row each
+    return build_feature_frame(year, month, day, hour, beat, district, ward, community_area)
 
 
 # -----------------------------
 # Prediction function
 # -----------------------------
+def _score_features(X):
+    proba = registry().get("crime_model").predict(np.asarray(X, dtype=np.float32))
+    classes = [str(c) for c in registry().get("label_encoder").classes_]
+    return [
+        {"predicted": classes[i], "probabilities": dict(zip(classes, map(float, p)))}
+        for i, p in zip(proba.argmax(axis=1), proba)
+    ]
+
+
+def predict_scores(df, use_cache=True, use_grid=True):
+    """
+    [{"predicted", "probabilities"}] per row of df, in the same order as
+    predict_crime: on-grid rows from the risk grid, the rest from the
+    cache (keyed on the derived feature vector) or the model.
+    """
+    grid = live_grid(registry()) if use_grid else None
+    if grid is not None:
+        out = []
+        for query in df[INPUT_COLUMNS].itertuples(index=False, name=None):
+            proba = grid.probabilities(*query)
+            out.append(None if proba is None else {"predicted": max(proba, key=proba.get), "probabilities": proba})
+        miss = [i for i, v in enumerate(out) if v is None]
+        if miss:
+            for i, v in zip(miss, predict_scores(df.iloc[miss], use_cache, use_grid=False)):
+                out[i] = v
+        return out
+
+    X = feature_matrix(df)
+    if not use_cache:
+        return _score_features(X)
+    # The key is the feature vector itself, so misses are scored straight from their keys
+    return crime_cache().get_many([feature_key(r) for r in X], _score_features)
+
+
+def predict_crime_source(year, month, day, hour, beat, district, ward, community_area):
+    """(crime group, "risk grid" | "cache" | "model") for one row."""
+    # Beat/month/weekday/hour on the precomputed grid (risk_grid.py): one array lookup
+    label = grid_predict(registry(), year, month, day, hour, beat, district, ward, community_area)
+    if label is not None:
+        return label, "risk grid"
+
+    # Build feature row (as a tuple: it doubles as the cache key)
+    key = feature_key(feature_vector(year, month, day, hour, beat, district, ward, community_area))
+
+    # Predict (LightGBM probabilities -> crime group), served from the cache when seen before
+    scored = []
+
+    def score(keys):
+        scored.append(len(keys))
+        return _score_features(keys)
+
+    label = crime_cache().get_many([key], score)[0]["predicted"]
+    return label, "model" if scored else "cache"
+
+
 def predict_crime(year, month, day, hour, beat, district, ward, community_area):
-    # Build feature row
-    X = build_features(year, month, day, hour, beat, district, ward, community_area)
+    return predict_crime_source(year, month, day, hour, beat, district, ward, community_area)[0]
+
+
+# -----------------------------
+# Batch scoring (DataFrame, arrays or Parquet/CSV path; chunked)
+# -----------------------------
+INPUT_COLUMNS = ["year", "month", "day", "hour", "beat", "district", "ward", "community_area"]
+CHUNK_ROWS = 250_000
+_THREADS = None
+
 
-    # Predict (LightGBM returns probabilities)
-    pred_class = model.predict(X).argmax(axis=1)
+def iter_input_chunks(source, chunk_rows=CHUNK_ROWS):
+    """
+    DataFrames of at most chunk_rows rows from:
+      - a DataFrame
+      - a dict of equal-length arrays (INPUT_COLUMNS or FEATURES)
+      - a 2-D array with INPUT_COLUMNS or FEATURES as its columns
+      - a .csv file, or a Parquet file/directory (hive partitions allowed)
+    """
+    if isinstance(source, np.ndarray):
+        names = FEATURES if source.shape[1] == len(FEATURES) else INPUT_COLUMNS
+        source = pd.DataFrame(source, columns=names)
+    elif isinstance(source, dict):
+        source = pd.DataFrame(source)
 
-    # Convert encoded label to crime group
-    output = label_encoder.inverse_transform(pred_class)[0]
+    if isinstance(source, pd.DataFrame):
+        for start in range(0, len(source), chunk_rows):
+            yield source.iloc[start:start + chunk_rows]
+        return
 
-    return output
+    path = str(source)
+    if path.lower().endswith(".csv"):
+        for chunk in pd.read_csv(path, chunksize=chunk_rows, low_memory=False):
+            chunk.columns = [c.lower() for c in chunk.columns]
+            yield chunk
+        return
 
+    for batch in ds.dataset(path, format="parquet", partitioning="hive").to_batches(batch_size=chunk_rows):
+        if batch.num_rows:
+            yield batch.to_pandas()
 
+
+def score_chunk(df):
+    """Class probabilities + predicted label for every row of df (id kept if present)."""
+    missing = [c for c in INPUT_COLUMNS if c not in df.columns]
+    if missing:
+        raise ValueError(f"Input is missing model columns: {missing}")
+    params = {"num_threads": _THREADS} if _THREADS else {}
+    proba = np.asarray(registry().get("crime_model").predict(feature_matrix(df), **params), dtype=np.float32)
+    classes = np.asarray(registry().get("label_encoder").classes_)
+
+    out = pd.DataFrame(proba, columns=[f"prob_{c}" for c in classes], index=df.index)
+    out.insert(0, "predicted", classes[proba.argmax(axis=1)])
+    if "id" in df.columns:
+        out.insert(0, "id", df["id"].to_numpy())
+    return out.reset_index(drop=True)
+
+
+def _init_worker(model_dir, threads):
+    # Spawned workers load their own copy of the model on first use; threads split the cores
+    global MODEL_DIR, _THREADS
+    MODEL_DIR = model_dir
+    _THREADS = threads
+
+
+def _scored_chunks(chunks, workers):
+    if workers <= 1:
+        for chunk in chunks:
+            yield score_chunk(chunk)
+        return
+
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    ctx = mp.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=ctx, initializer=_init_worker,
+                             initargs=(MODEL_DIR, threads)) as pool:
+        # At most 2 chunks per worker in flight; results come back in input order
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(score_chunk, chunk))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def predict_batch(source, out=None, chunk_rows=CHUNK_ROWS, workers=1):
+    """
+    Score `source` (see iter_input_chunks) in vectorized chunks.
+
+    With out=None the scores are returned as one DataFrame (id, predicted,
+    prob_<class>...). With out=*.parquet or *.csv each chunk is appended to
+    the file as soon as it is scored and the row count is returned, so
+    memory stays bounded by chunk_rows. workers > 1 scores chunks in a
+    process pool.
+    """
+    start = time.time()
+    results, writer, total = [], None, 0
+
+    try:
+        for scored in _scored_chunks(iter_input_chunks(source, chunk_rows), workers):
+            total += len(scored)
+            if out is None:
+                results.append(scored)
+            elif out.lower().endswith(".csv"):
+                scored.to_csv(out, mode="w" if writer is None else "a", header=writer is None, index=False)
+                writer = True
+            else:
+                table = pa.Table.from_pandas(scored, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(out, table.schema)
+                writer.write_table(table)
+    finally:
+        if isinstance(writer, pq.ParquetWriter):
+            writer.close()
+
+    elapsed = time.time() - start
+    print(f"✔ Scored {total:,} rows in {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f} rows/s)")
+
+    if out is None:
+        return pd.concat(results, ignore_index=True) if results else pd.DataFrame()
+    print(f"✔ Scores → {out}")
+    return total
+
+
+# -----------------------------
+# Spatial cluster (exact lookup from the KMeans centers)
 # -----------------------------
-# Manual test (optional)
+def predict_location(latitude, longitude):
+    # Scalars give an int; arrays give one cluster id per row
+    labels = registry().get("spatial_resolver").predict(latitude, longitude)
+    return int(labels[0]) if pd.api.types.is_scalar(latitude) else labels
+
+
+# -----------------------------
+# CLI (batch scoring) + manual test
 # -----------------------------
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", help="Parquet file/directory or CSV to score (omit for a single test row)")
+    parser.add_argument("--output", help="scores file (.parquet or .csv)")
+    parser.add_argument("--chunk-rows", default=CHUNK_ROWS, type=int)
+    parser.add_argument("--workers", default=1, type=int)
+    args = parser.parse_args()
+
+    if args.input:
+        output = args.output or os.path.splitext(args.input.rstrip("/\\"))[0] + "_scores.parquet"
+        predict_batch(args.input, output, args.chunk_rows, args.workers)
+        raise SystemExit(0)
+
     print("\nTesting predict.py...\n")
     result = predict_crime(
         year=2025,
@@ -96,3 +264,4 @@ if __name__ == "__main__":
         community_area=35
     )
     print("Predicted Crime Group =", result)
+    print("Spatial Cluster =", predict_location(41.8781, -87.6298))
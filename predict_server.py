@@ -0,0 +1,310 @@
+# predict_server.py
+# Local HTTP prediction service (stdlib asyncio, no web framework).
+# Concurrent /predict requests are collected for a few milliseconds and
+# answered like predict_crime: risk grid, then cache, then one model.predict
+# batch for the rest, in a worker thread; /location answers
+# from the spatial cluster resolver. /metrics reports latency + batch sizes.
+#
+#   python predict_server.py                      # serve on 127.0.0.1:8600
+#   python predict_server.py --load-test 20000    # serve + hammer it locally
+import json
+import time
+import asyncio
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+import predict
+
+HOST = "127.0.0.1"
+PORT = 8600
+MAX_BATCH = 1024
+MAX_WAIT_MS = 5
+MAX_BODY = 1 << 20
+WINDOW = 20_000      # latencies / batch sizes kept for the percentiles
+
+
+# ---------------------------
+# MICRO-BATCHING
+# ---------------------------
+class MicroBatcher:
+    def __init__(self, score, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS):
+        self.score = score
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix="scorer")
+        self.batch_sizes = deque(maxlen=WINDOW)
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, row):
+        fut = asyncio.get_running_loop().create_future()
+        await self.queue.put((row, fut))
+        return await fut
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            rows = [row for row, _ in batch]
+            self.batch_sizes.append(len(rows))
+            try:
+                results = await loop.run_in_executor(self.executor, self.score, rows)
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            for (_, fut), res in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(res)
+
+
+def score_rows(rows):
+    """Grid hits, then one model.predict for the cache misses among a list of request dicts."""
+    return predict.predict_scores(pd.DataFrame(rows, columns=predict.INPUT_COLUMNS))
+
+
+def parse_row(req):
+    if not isinstance(req, dict):
+        raise ValueError("expected a JSON object")
+    missing = [c for c in predict.INPUT_COLUMNS if c not in req]
+    if missing:
+        raise KeyError(f"missing fields {missing}")
+    return {c: float(req[c]) for c in predict.INPUT_COLUMNS}
+
+
+# ---------------------------
+# METRICS
+# ---------------------------
+class Metrics:
+    def __init__(self):
+        self.started = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.latency_ms = {"predict": deque(maxlen=WINDOW), "location": deque(maxlen=WINDOW)}
+
+    def record(self, route, ms):
+        self.requests += 1
+        if route in self.latency_ms:
+            self.latency_ms[route].append(ms)
+
+    def snapshot(self, batch_sizes):
+        out = {
+            "uptime_s": round(time.time() - self.started, 1),
+            "requests": self.requests,
+            "errors": self.errors,
+        }
+        for route, values in self.latency_ms.items():
+            if values:
+                v = np.fromiter(values, dtype=np.float64)
+                out[route] = {"p50_ms": round(float(np.percentile(v, 50)), 3),
+                              "p99_ms": round(float(np.percentile(v, 99)), 3),
+                              "count": len(v)}
+        if batch_sizes:
+            b = np.fromiter(batch_sizes, dtype=np.int64)
+            out["batch_size"] = {"mean": round(float(b.mean()), 1), "p50": int(np.percentile(b, 50)),
+                                 "max": int(b.max()), "batches": len(b)}
+        out["cache"] = predict.crime_cache().stats()
+        out["models"] = predict.registry().stats()
+        return out
+
+
+# ---------------------------
+# HTTP
+# ---------------------------
+STATUS = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+def _response(status, payload, keep_alive=True):
+    body = json.dumps(payload).encode()
+    head = (f"HTTP/1.1 {status} {STATUS[status]}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode() + body
+
+
+class PredictServer:
+    def __init__(self, host=HOST, port=PORT, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS):
+        self.host, self.port = host, port
+        self.batcher = MicroBatcher(score_rows, max_batch, max_wait_ms)
+        self.metrics = Metrics()
+        self.server = None
+
+    def warm_up(self):
+        """Load the models before the first request instead of inside its batch."""
+        reg = predict.registry()
+        for name in ["crime_model", "label_encoder", "risk_grid", "spatial_resolver"]:
+            if reg.path(name) is None:
+                if name in ("crime_model", "label_encoder"):
+                    raise FileNotFoundError(f"No artifact for '{name}'. Run train_models.py")
+                print(f"⚠ {name} not found, its route falls back or fails on use")
+                continue
+            reg.get(name)
+
+    async def start(self):
+        self.warm_up()
+        self.batcher.start()
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        print(f"✔ Serving on http://{self.host}:{self.port} (batch ≤ {self.batcher.max_batch}, "
+              f"wait ≤ {self.batcher.max_wait * 1000:.0f} ms)")
+        return self
+
+    async def route(self, method, path, body):
+        if method == "GET" and path == "/metrics":
+            return 200, self.metrics.snapshot(self.batcher.batch_sizes)
+        if method == "GET" and path == "/health":
+            return 200, {"status": "ok"}
+        if method == "POST" and path == "/predict":
+            req = json.loads(body)
+            if isinstance(req, list):
+                rows = [parse_row(r) for r in req]
+                return 200, await asyncio.gather(*(self.batcher.submit(r) for r in rows))
+            return 200, await self.batcher.submit(parse_row(req))
+        if method == "POST" and path == "/location":
+            req = json.loads(body)
+            return 200, {"spatial_cluster": predict.predict_location(float(req["latitude"]),
+                                                                     float(req["longitude"]))}
+        return 404, {"error": f"no route {method} {path}"}
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                start = time.perf_counter()
+                method, path, _ = line.decode("latin-1").split(" ", 2)
+
+                headers = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    k, _, v = h.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+                keep_alive = headers.get("connection", "").lower() != "close"
+
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY:
+                    writer.write(_response(413, {"error": "body too large"}, False))
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                try:
+                    status, payload = await self.route(method, path.split("?", 1)[0], body)
+                except (ValueError, KeyError, TypeError) as e:
+                    status, payload = 400, {"error": f"{type(e).__name__}: {e}"}
+                except Exception as e:
+                    status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+                if status >= 400:
+                    self.metrics.errors += 1
+
+                writer.write(_response(status, payload, keep_alive))
+                await writer.drain()
+                self.metrics.record(path.strip("/"), (time.perf_counter() - start) * 1000)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+# ---------------------------
+# LOAD TEST (localhost, keep-alive connections)
+# ---------------------------
+def sample_request(rng):
+    return {
+        "year": 2025, "month": int(rng.integers(1, 13)), "day": int(rng.integers(1, 29)),
+        "hour": int(rng.integers(0, 24)), "beat": int(rng.choice([111, 332, 1113, 2523, 1933])),
+        "district": int(rng.integers(1, 26)), "ward": int(rng.integers(1, 51)),
+        "community_area": int(rng.integers(1, 78)),
+    }
+
+
+async def _client(host, port, n, latencies, seed, pool=None):
+    rng = np.random.default_rng(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for _ in range(n):
+            req = pool[rng.integers(len(pool))] if pool else sample_request(rng)
+            body = json.dumps(req).encode()
+            start = time.perf_counter()
+            writer.write(f"POST /predict HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                         f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+            await writer.drain()
+
+            length = 0
+            while True:
+                h = await reader.readline()
+                if h in (b"\r\n", b""):
+                    break
+                if h.lower().startswith(b"content-length:"):
+                    length = int(h.split(b":")[1])
+            await reader.readexactly(length)
+            latencies.append((time.perf_counter() - start) * 1000)
+    finally:
+        writer.close()
+
+
+async def load_test(host=HOST, port=PORT, requests=10_000, concurrency=200, distinct=None):
+    # distinct=N draws every request from N fixed scenarios (repeat-heavy dashboard traffic)
+    rng = np.random.default_rng(0)
+    pool = [sample_request(rng) for _ in range(distinct)] if distinct else None
+    latencies = []
+    per_client = max(1, requests // concurrency)
+    start = time.perf_counter()
+    await asyncio.gather(*(_client(host, port, per_client, latencies, i, pool) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    v = np.array(latencies)
+    report = {
+        "requests": len(v),
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 2),
+        "requests_per_s": round(len(v) / elapsed, 1),
+        "client_p50_ms": round(float(np.percentile(v, 50)), 2),
+        "client_p99_ms": round(float(np.percentile(v, 99)), 2),
+    }
+    print("Load test:", json.dumps(report))
+    return report
+
+
+async def main(args):
+    server = await PredictServer(args.host, args.port, args.max_batch, args.max_wait_ms).start()
+    if args.load_test:
+        await load_test(args.host, server.port, args.load_test, args.concurrency, args.distinct)
+        print("Server metrics:", json.dumps(server.metrics.snapshot(server.batcher.batch_sizes)))
+        return
+    async with server.server:
+        await server.server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", default=PORT, type=int)
+    parser.add_argument("--max-batch", default=MAX_BATCH, type=int)
+    parser.add_argument("--max-wait-ms", default=MAX_WAIT_MS, type=float)
+    parser.add_argument("--load-test", type=int, metavar="N", help="serve, send N requests, print metrics, exit")
+    parser.add_argument("--concurrency", default=200, type=int)
+    parser.add_argument("--distinct", type=int, help="load test: draw requests from this many fixed scenarios")
+    args = parser.parse_args()
+    asyncio.run(main(args))
@@ -0,0 +1,165 @@
+# prediction_cache.py
+# Bounded LRU + TTL cache for model outputs, keyed on the derived feature
+# tuple and the model artifact's fingerprint (size + mtime), so a retrained
+# model never serves stale answers. Optional sqlite tier survives restarts.
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+class PredictionCache:
+    def __init__(self, artifacts, maxsize=100_000, ttl=3600, disk_path=None, check_interval=1.0):
+        self.artifacts = list(artifacts)
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()         # key -> (expires_at, value)
+        self.counts = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+        self.fp = self._fingerprint()
+        self._checked = time.monotonic()
+
+        self.db = None
+        if disk_path:
+            os.makedirs(os.path.dirname(disk_path) or ".", exist_ok=True)
+            self.db = sqlite3.connect(disk_path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS cache (fp TEXT, key TEXT, expires REAL, value TEXT, "
+                            "PRIMARY KEY (fp, key))")
+            self.db.execute("DELETE FROM cache WHERE fp != ? OR expires < ?", (self.fp, time.time()))
+            self.db.commit()
+
+    # ---------------------------
+    # INVALIDATION
+    # ---------------------------
+    def _fingerprint(self):
+        parts = []
+        for path in self.artifacts:
+            try:
+                st = os.stat(path)
+                parts.append(f"{os.path.basename(path)}:{st.st_size}:{st.st_mtime_ns}")
+            except OSError:
+                parts.append(f"{os.path.basename(path)}:missing")
+        return "|".join(parts)
+
+    def _check_artifacts(self):
+        # stat() at most once per check_interval; a changed model drops everything
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return
+        self._checked = now
+        fp = self._fingerprint()
+        if fp != self.fp:
+            self.fp = fp
+            self.entries.clear()
+            self.counts["invalidations"] += 1
+            if self.db is not None:
+                self.db.execute("DELETE FROM cache WHERE fp != ?", (fp,))
+                self.db.commit()
+
+    # ---------------------------
+    # LOOKUP
+    # ---------------------------
+    def get(self, key, default=None):
+        with self.lock:
+            self._check_artifacts()
+            hit = self.entries.get(key)
+            now = time.time()
+            if hit is not None and hit[0] > now:
+                self.entries.move_to_end(key)
+                self.counts["hits"] += 1
+                return hit[1]
+            if hit is not None:
+                del self.entries[key]
+
+            if self.db is not None:
+                row = self.db.execute("SELECT expires, value FROM cache WHERE fp = ? AND key = ?",
+                                      (self.fp, json.dumps(key))).fetchone()
+                if row and row[0] > now:
+                    value = json.loads(row[1])
+                    self._store(key, value, row[0])
+                    self.counts["disk_hits"] += 1
+                    return value
+
+            self.counts["misses"] += 1
+            return default
+
+    def put(self, key, value):
+        self.put_many([(key, value)])
+
+    def put_many(self, items):
+        expires = time.time() + self.ttl
+        with self.lock:
+            for key, value in items:
+                self._store(key, value, expires)
+            if self.db is not None:
+                # One transaction for the whole batch
+                self.db.executemany("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                                    [(self.fp, json.dumps(k), expires, json.dumps(v)) for k, v in items])
+                self.db.commit()
+
+    def _store(self, key, value, expires):
+        self.entries[key] = (expires, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.counts["evictions"] += 1
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def get_many(self, keys, compute_many):
+        """Values for `keys`; the misses are computed in one compute_many(miss_keys) call."""
+        values = [self.get(k) for k in keys]
+        miss = [i for i, v in enumerate(values) if v is None]
+        if miss:
+            computed = compute_many([keys[i] for i in miss])
+            for i, v in zip(miss, computed):
+                values[i] = v
+            self.put_many([(keys[i], v) for i, v in zip(miss, computed)])
+        return values
+
+    # ---------------------------
+    # STATS
+    # ---------------------------
+    def stats(self):
+        with self.lock:
+            c = dict(self.counts)
+            lookups = c["hits"] + c["disk_hits"] + c["misses"]
+            c["size"] = len(self.entries)
+            c["hit_rate"] = round((c["hits"] + c["disk_hits"]) / lookups, 4) if lookups else None
+            return c
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            if self.db is not None:
+                self.db.execute("DELETE FROM cache")
+                self.db.commit()
+
+
+# ---------------------------
+# SHARED INSTANCES (one per process, e.g. across Streamlit reruns)
+# ---------------------------
+_SHARED = {}
+_SHARED_LOCK = threading.Lock()
+
+
+def shared_cache(name, artifacts, **kwargs):
+    with _SHARED_LOCK:
+        if name not in _SHARED:
+            _SHARED[name] = PredictionCache(artifacts, **kwargs)
+        return _SHARED[name]
+
+
+def feature_key(row):
+    """Hashable key from one derived feature row (floats that are whole become ints)."""
+    return tuple(int(v) if float(v).is_integer() else round(float(v), 6) for v in row)
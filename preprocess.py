@@ -1,8 +1,16 @@
 import pandas as pd
 import numpy as np
 import os
+import glob
+import shutil
+import argparse
 import joblib
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from spatial_clusters import fit_spatial_kmeans, load_previous_centers, nearest_center, stabilize
+from dataset import store_path, save_crimes, write_year_partitions, memory_report
+from features import add_derived_features
+from count_cube import build_cube, update_cube
+from category_map import LOCATION_MAPPER, map_location_group, save_lookups
 
 # ---------------------------
 # PATHS
@@ -10,6 +18,7 @@ from sklearn.cluster import KMeans
 BASE_DIR = r"D:\crime_project2"
 RAW_FILE = os.path.join(BASE_DIR, "ijzp-q8t2 (4).csv")   # your main dataset
 OUT_FILE = os.path.join(BASE_DIR, "cleaned_crimes.csv")
+CLEAN_DIR = store_path(BASE_DIR)   # Parquet, partitioned by year
 MODEL_DIR = os.path.join(BASE_DIR, "models")
 os.makedirs(MODEL_DIR, exist_ok=True)
 
@@ -18,94 +27,264 @@ os.makedirs(MODEL_DIR, exist_ok=True)
 # LOCATION GROUP FUNCTION
 # ---------------------------
 def location_group_func(loc):
-    if pd.isna(loc):
-        return "UNKNOWN"
-
-    loc = str(loc).upper()
-
-    if any(k in loc for k in ["STREET", "SIDEWALK", "PARKING", "DRIVE"]):
-        return "STREET"
-
-    if any(k in loc for k in ["RESIDENCE", "APARTMENT", "HOME", "HOUSE"]):
-        return "RESIDENCE"
-
-    if any(k in loc for k in ["BUSINESS", "STORE", "SHOP", "RESTAURANT", "COMMERCIAL"]):
-        return "BUSINESS"
-
-    if any(k in loc for k in ["PUBLIC", "SCHOOL", "GOVERNMENT", "HOSPITAL"]):
-        return "PUBLIC"
-
-    return "OTHER"
+    # Scalar helper; whole columns go through category_map.map_location_group
+    return LOCATION_MAPPER.map_value(loc)
 
 
 # ---------------------------
 # ADD SPATIAL CLUSTERS USING KMEANS
 # ---------------------------
-def add_spatial_clusters(df, n_clusters=30):
-    print(f"Clustering {len(df)} rows into {n_clusters} spatial clusters...")
+def add_spatial_clusters(df, n_clusters=30, mode="full", sample_size=300_000, warm_start=False, chunk_size=1_000_000):
+    """
+    mode="full" fits KMeans on every coordinate; "sample" and "minibatch" bound
+    the fit (see spatial_clusters.fit_spatial_kmeans). warm_start seeds the fit
+    from the saved kmeans_spatial.joblib and keeps its cluster ids stable.
+    """
+    print(f"Clustering {len(df)} rows into {n_clusters} spatial clusters ({mode})...")
 
     coords = df[["latitude", "longitude"]].values
+    kmeans_path = os.path.join(MODEL_DIR, "kmeans_spatial.joblib")
+    prev_centers = load_previous_centers(kmeans_path)
+
+    if mode == "full" and not warm_start:
+        kmeans = KMeans(
+            n_clusters=n_clusters,
+            random_state=42,
+            n_init=10
+        )
+        kmeans.fit(coords)
+    else:
+        kmeans = fit_spatial_kmeans(
+            coords, n_clusters=n_clusters, mode=mode, sample_size=sample_size,
+            init_centers=prev_centers if warm_start else None
+        )
 
-    kmeans = KMeans(
-        n_clusters=n_clusters,
-        random_state=42,
-        n_init=10
-    )
+    # Keep ids aligned with the previous model and record drift
+    stabilize(kmeans, prev_centers, os.path.join(MODEL_DIR, "kmeans_drift.csv"))
 
-    df["spatial_cluster"] = kmeans.fit_predict(coords)
+    df["spatial_cluster"] = nearest_center(coords, kmeans.cluster_centers_, chunk_size)
 
     # Save KMeans model for later use
-    joblib.dump(kmeans, os.path.join(MODEL_DIR, "kmeans_spatial.joblib"))
+    joblib.dump(kmeans, kmeans_path)
     print("Saved KMeans spatial model.")
 
     return df
 
 
 # ---------------------------
-# MAIN PREPROCESS FUNCTION
+# CHUNK CLEANING (shared by in-memory + streaming)
 # ---------------------------
-def preprocess():
-    print("Loading raw dataset...")
-    df = pd.read_csv(RAW_FILE)
-    print("Rows loaded:", len(df))
+NUMERIC_COLS = [
+    "id", "beat", "district", "ward", "community_area",
+    "x_coordinate", "y_coordinate", "latitude", "longitude"
+]
+BOOL_COLS = ["arrest", "domestic"]
+
+
+def normalize_types(df):
+    # CSV chunks infer dtypes independently; pin them so every
+    # partition file shares one schema
+    for c in df.columns:
+        if c in NUMERIC_COLS:
+            df[c] = pd.to_numeric(df[c], errors="coerce").astype("float64")
+        elif c in BOOL_COLS:
+            df[c] = df[c].astype("string").str.lower().map({"true": True, "false": False}).astype("boolean")
+        elif c != "date":
+            df[c] = df[c].astype("string")
+    return df
 
-    # Standardize column names
-    df.columns = [c.lower() for c in df.columns]
 
-    # Fix date
-    print("Fixing date column...")
-    df["date"] = pd.to_datetime(df["date"], errors="coerce")
+# Format of the portal's CSV export; API pulls come back as ISO-8601
+PORTAL_DATE_FORMAT = "%m/%d/%Y %I:%M:%S %p"
 
-    # Remove rows with no date
+
+def parse_dates(col):
+    if col.dtype.kind == "M":
+        return col
+    parsed = pd.to_datetime(col, format=PORTAL_DATE_FORMAT, errors="coerce")
+    if parsed.isna().all() and col.notna().any():
+        parsed = pd.to_datetime(col, format="ISO8601", errors="coerce")
+    return parsed
+
+
+def add_date_features(df):
+    df["date"] = parse_dates(df["date"])
     df = df.dropna(subset=["date"])
 
-    # Extract datetime components
-    print("Extracting features...")
     df["year"] = df["date"].dt.year
     df["month"] = df["date"].dt.month
     df["day"] = df["date"].dt.day
     df["hour"] = df["date"].dt.hour
+    return df
 
-    # Location group
-    print("Adding location_group...")
-    df["location_group"] = df["location_description"].apply(location_group_func)
 
-    # Remove rows without coordinates
-    print("Removing rows without latitude/longitude...")
+def clean_chunk(df):
+    df.columns = [c.lower() for c in df.columns]
+    df = add_date_features(df)
+    df["location_group"] = map_location_group(df["location_description"])
     df = df.dropna(subset=["latitude", "longitude"])
+    df = add_derived_features(df)
+    return df
+
+
+# ---------------------------
+# MAIN PREPROCESS FUNCTION
+# ---------------------------
+def preprocess(cluster_mode="full", warm_start=False, write_csv=False):
+    print("Loading raw dataset...")
+    df = normalize_types(pd.read_csv(RAW_FILE, low_memory=False))
+    print("Rows loaded:", len(df))
+
+    # Date fix, datetime components, location_group, drop rows without coordinates
+    print("Cleaning + extracting features...")
+    df = clean_chunk(df)
 
     # Add spatial clusters
     print("Adding spatial KMeans clusters...")
-    df = add_spatial_clusters(df, n_clusters=30)
+    df = add_spatial_clusters(df, n_clusters=30, mode=cluster_mode, warm_start=warm_start)
+
+    # Memory per column: inferred dtypes vs the compact schema
+    print(memory_report(df).to_string())
 
     # Save output
-    print("Saving cleaned file:", OUT_FILE)
-    df.to_csv(OUT_FILE, index=False)
+    print("Saving cleaned dataset:", CLEAN_DIR)
+    save_crimes(df, BASE_DIR)
+    build_cube(BASE_DIR, df=df)
+    if write_csv:
+        print("Saving cleaned file:", OUT_FILE)
+        df.to_csv(OUT_FILE, index=False)
+    save_lookups(os.path.join(MODEL_DIR, "category_lookups.json"))
     print("Preprocessing complete!")
 
 
+# ---------------------------
+# STREAMING PREPROCESS (bounded memory, Parquet by year)
+# ---------------------------
+def raw_files(raw_path=RAW_FILE):
+    # raw_path may be one CSV or the per-year store written by data_download.ingest
+    if os.path.isdir(raw_path):
+        return sorted(glob.glob(os.path.join(raw_path, "*.csv")))
+    return [raw_path]
+
+
+def iter_raw_chunks(raw_path=RAW_FILE, chunksize=500_000, files=None):
+    files = files if files is not None else raw_files(raw_path)
+
+    for f in files:
+        for chunk in pd.read_csv(f, chunksize=chunksize, low_memory=False):
+            yield chunk
+
+
+def clear_raw_partition_outputs(files, out_dir):
+    # year=YYYY.csv in the ingest store only ever feeds year=YYYY in the clean store
+    for f in files:
+        name = os.path.splitext(os.path.basename(f))[0]
+        if name.startswith("year="):
+            shutil.rmtree(os.path.join(out_dir, name), ignore_errors=True)
+
+
+def cleared_years(files):
+    # year=unknown.csv (ingested rows without a date) maps to no year of the clean store
+    names = [os.path.splitext(os.path.basename(f))[0] for f in files]
+    return {int(n[5:]) for n in names if n.startswith("year=") and n[5:].isdigit()}
+
+
+def assign_partition_clusters(out_dir, kmeans):
+    # Second pass: one partition file in memory at a time
+    files = sorted(glob.glob(os.path.join(out_dir, "year=*", "*.parquet")))
+    for i, path in enumerate(files, 1):
+        part = pd.read_parquet(path)
+        part["spatial_cluster"] = nearest_center(part[["latitude", "longitude"]].values, kmeans.cluster_centers_)
+        part.to_parquet(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+        print(f"  clustered {i}/{len(files)} partition files")
+
+
+def preprocess_streaming(raw_path=RAW_FILE, out_dir=CLEAN_DIR, chunksize=500_000, n_clusters=30,
+                         refit=True, warm_start=False, only_files=None):
+    """
+    Chunked preprocess writing Parquet partitioned by year (year=YYYY/part-N.parquet).
+
+    Peak memory is bounded by `chunksize`. With refit=True a MiniBatchKMeans is
+    updated per chunk during the first pass and cluster ids are assigned in a
+    second pass; otherwise the saved kmeans_spatial.joblib labels chunks directly.
+    warm_start seeds the refit from the saved centers.
+
+    only_files re-processes just those ingest-store partitions (year=YYYY.csv)
+    in place, labelling with the saved KMeans; other years are left untouched.
+    """
+    if only_files is not None:
+        refit = False
+        clear_raw_partition_outputs(only_files, out_dir)
+        os.makedirs(out_dir, exist_ok=True)
+    else:
+        if os.path.exists(out_dir):
+            shutil.rmtree(out_dir)
+        os.makedirs(out_dir)
+
+    kmeans_path = os.path.join(MODEL_DIR, "kmeans_spatial.joblib")
+    prev_centers = load_previous_centers(kmeans_path)
+    kmeans = None if refit else joblib.load(kmeans_path)
+    if kmeans is None:
+        warm = warm_start and prev_centers is not None and len(prev_centers) == n_clusters
+        kmeans = MiniBatchKMeans(
+            n_clusters=n_clusters, random_state=42, batch_size=4096,
+            init=prev_centers if warm else "k-means++", n_init=1 if warm else 3
+        )
+
+    total, years = 0, set()
+    for part_id, chunk in enumerate(iter_raw_chunks(raw_path, chunksize, only_files)):
+        chunk = normalize_types(chunk)
+        chunk = clean_chunk(chunk)
+        if chunk.empty:
+            continue
+
+        coords = chunk[["latitude", "longitude"]].values
+        if refit:
+            if len(coords) >= n_clusters:
+                kmeans.partial_fit(coords)
+        else:
+            chunk["spatial_cluster"] = nearest_center(coords, kmeans.cluster_centers_)
+
+        write_year_partitions(chunk, out_dir, part_id)
+        years.update(chunk["year"].dropna().astype(int).unique().tolist())
+        total += len(chunk)
+        print(f"  chunk {part_id}: {len(chunk):,} rows (total {total:,})")
+
+    if refit:
+        stabilize(kmeans, prev_centers, os.path.join(MODEL_DIR, "kmeans_drift.csv"))
+        print("Assigning spatial clusters (second pass)...")
+        assign_partition_clusters(out_dir, kmeans)
+        joblib.dump(kmeans, kmeans_path)
+        print("Saved KMeans spatial model.")
+
+    # Daily counts next to the store: recount only the re-cleaned years on an incremental run
+    cube_dir = os.path.dirname(os.path.abspath(out_dir))
+    if only_files is not None:
+        update_cube(years | cleared_years(only_files), cube_dir)
+    else:
+        build_cube(cube_dir)
+
+    save_lookups(os.path.join(MODEL_DIR, "category_lookups.json"))
+    print(f"Streaming preprocess complete: {total:,} rows -> {out_dir}")
+    return total
+
+
 # ---------------------------
 # RUN SCRIPT
 # ---------------------------
 if __name__ == "__main__":
-    preprocess()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--streaming", action="store_true", help="chunked mode writing Parquet by year")
+    parser.add_argument("--raw", default=RAW_FILE, help="raw CSV file or ingest store directory")
+    parser.add_argument("--chunksize", default=500_000, type=int)
+    parser.add_argument("--reuse-kmeans", action="store_true", help="label with the saved KMeans instead of refitting")
+    parser.add_argument("--cluster-mode", choices=["full", "sample", "minibatch"], default="full")
+    parser.add_argument("--warm-start", action="store_true", help="seed KMeans from the saved centers")
+    parser.add_argument("--csv", action="store_true", help="also write cleaned_crimes.csv")
+    args = parser.parse_args()
+
+    if args.streaming:
+        preprocess_streaming(args.raw, chunksize=args.chunksize, refit=not args.reuse_kmeans, warm_start=args.warm_start)
+    else:
+        preprocess(cluster_mode=args.cluster_mode, warm_start=args.warm_start, write_csv=args.csv)
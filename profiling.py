@@ -0,0 +1,69 @@
+# profiling.py
+# Process memory figures for run reports. On Linux they come from
+# /proc/self/status (VmRSS, and VmHWM for the peak, which clear_refs can reset
+# so a timed section reports its own peak). Elsewhere psutil is used when
+# installed, else the stdlib resource module. ru_maxrss is a last resort: it
+# survives fork+exec, so a spawned child reports its parent's peak.
+import sys
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+PROC_STATUS = "/proc/self/status"
+PROC_CLEAR_REFS = "/proc/self/clear_refs"
+
+
+def _proc_status_mb(field):
+    # "VmHWM:    123456 kB"
+    try:
+        with open(PROC_STATUS) as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1e3
+    except OSError:
+        pass
+    return None
+
+
+def rss_mb():
+    """Current resident memory of this process in MB (None if unavailable)."""
+    current = _proc_status_mb("VmRSS")
+    if current is not None:
+        return current
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 1e6
+    return None
+
+
+def reset_peak_rss():
+    """Restart the peak (VmHWM) from the current RSS; False where the OS cannot do that."""
+    try:
+        with open(PROC_CLEAR_REFS, "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB (since the last reset_peak_rss, on Linux)."""
+    peak = _proc_status_mb("VmHWM")
+    if peak is not None:
+        return peak
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        peak = getattr(info, "peak_wset", None)      # Windows
+        if peak is not None:
+            return peak / 1e6
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is KB on Linux, bytes on macOS
+        return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+    return rss_mb()
@@ -0,0 +1,252 @@
+# risk_grid.py
+# Precomputed crime-group probabilities for every beat × month × weekday × hour,
+# scored once with the LightGBM model after each retrain and kept as a
+# memory-mapped .npy (plus a small JSON with the beat table and classes).
+# Queries that fall on the grid are answered by indexing the array; anything
+# else (unknown beat, other year, district/ward/area not the beat's usual
+# ones) goes to the model as before.
+import os
+import json
+import time
+import datetime
+import argparse
+import numpy as np
+import pandas as pd
+
+from dataset import load_crimes
+from features import FEATURES, SEASON_BY_MONTH, HOUR_GROUP_BY_HOUR, TOP_BEATS
+from model_registry import get_registry, RISK_GRID_FILE
+
+BASE_DIR = r"D:\crime_project2"
+MODEL_DIR = os.path.join(BASE_DIR, "models")
+
+META_FILE = "risk_grid.json"
+REFERENCE_DAY = 15          # each (month, weekday) cell is scored on that weekday nearest the 15th
+CHECK_INTERVAL = 2.0        # seconds between re-stats of the model file
+
+
+def _stamp(path):
+    st = os.stat(path)
+    return [os.path.basename(path), st.st_size, st.st_mtime_ns]
+
+
+def _as_int(value):
+    # 111 and 111.0 are on the grid, 111.5 is not
+    try:
+        f = float(value)
+    except (TypeError, ValueError):
+        return None
+    return int(f) if f.is_integer() else None
+
+
+def reference_dates(year):
+    """For every (month, weekday): the date in `year` with that weekday closest to the 15th."""
+    dates = np.empty((12, 7), dtype=object)
+    for month in range(1, 13):
+        mid = datetime.date(year, month, REFERENCE_DAY)
+        for offset in range(-3, 4):
+            d = mid + datetime.timedelta(days=offset)
+            dates[month - 1, d.weekday()] = d
+    return dates
+
+
+def beat_table(base_dir=BASE_DIR):
+    """Each beat with its most frequent district, ward and community area."""
+    df = load_crimes(["beat", "district", "ward", "community_area"], base_dir=base_dir).dropna()
+    counts = df.groupby(["beat", "district", "ward", "community_area"], observed=True).size().reset_index(name="n")
+    table = counts.sort_values("n", ascending=False).drop_duplicates("beat").sort_values("beat")
+    return table[["beat", "district", "ward", "community_area"]].astype(np.int64).reset_index(drop=True)
+
+
+# ---------------------------
+# BUILD
+# ---------------------------
+def _grid_features(beats, year):
+    """FEATURES for beats × 12 months × 7 weekdays × 24 hours, in that (C) order."""
+    dates = reference_dates(year).ravel()
+    n_cells = len(dates) * 24
+    month = np.repeat([d.month for d in dates], 24)
+    day = np.repeat([d.day for d in dates], 24)
+    dow = np.repeat([d.weekday() for d in dates], 24)
+    hour = np.tile(np.arange(24), len(dates))
+
+    b = np.repeat(beats["beat"].to_numpy(), n_cells)
+    cols = {
+        "year": np.full(len(b), year),
+        "month": np.tile(month, len(beats)),
+        "day": np.tile(day, len(beats)),
+        "hour": np.tile(hour, len(beats)),
+        "day_of_week": np.tile(dow, len(beats)),
+        "is_weekend": np.tile(dow >= 5, len(beats)),
+        "season": SEASON_BY_MONTH[np.tile(month, len(beats))],
+        "hour_group": HOUR_GROUP_BY_HOUR[np.tile(hour, len(beats))],
+        "beat": b,
+        "district": np.repeat(beats["district"].to_numpy(), n_cells),
+        "ward": np.repeat(beats["ward"].to_numpy(), n_cells),
+        "community_area": np.repeat(beats["community_area"].to_numpy(), n_cells),
+        "hotspot_area": np.isin(b, TOP_BEATS),
+    }
+    return np.column_stack([cols[c] for c in FEATURES]).astype(np.float32)
+
+
+def build_risk_grid(year=None, model_dir=None, base_dir=None, beats_per_chunk=32):
+    start = time.time()
+    model_dir, base_dir = model_dir or MODEL_DIR, base_dir or BASE_DIR
+    registry = get_registry(model_dir)
+    model = registry.get("crime_model")
+    classes = [str(c) for c in registry.get("label_encoder").classes_]
+    model_stamp = _stamp(registry.path("crime_model"))
+
+    beats = beat_table(base_dir)
+    if year is None:
+        year = int(load_crimes(["year"], base_dir=base_dir)["year"].max())
+    print(f"Scoring {len(beats)} beats × 12 months × 7 weekdays × 24 hours for {year}...")
+
+    # Written straight into the on-disk array, a chunk of beats at a time
+    os.makedirs(model_dir, exist_ok=True)
+    grid_path = os.path.join(model_dir, RISK_GRID_FILE)
+    tmp = grid_path + ".tmp.npy"
+    shape = (len(beats), 12, 7, 24, len(classes))
+    grid = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=shape)
+    for lo in range(0, len(beats), beats_per_chunk):
+        chunk = beats.iloc[lo:lo + beats_per_chunk]
+        proba = model.predict(_grid_features(chunk, year))
+        grid[lo:lo + len(chunk)] = proba.reshape((len(chunk),) + shape[1:])
+    grid.flush()
+    del grid
+
+    meta = {
+        "year": year,
+        "classes": classes,
+        "shape": list(shape),
+        "reference_day": REFERENCE_DAY,
+        "beats": beats.to_dict(orient="list"),
+        "model_stamp": model_stamp,
+        "built_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "build_seconds": round(time.time() - start, 1),
+    }
+    # Meta first, then the array: the loader rejects a pair whose shapes disagree
+    meta_path = os.path.join(model_dir, META_FILE)
+    with open(meta_path + ".tmp", "w") as f:
+        json.dump(meta, f)
+    os.replace(meta_path + ".tmp", meta_path)
+    os.replace(tmp, grid_path)
+
+    print(f"✔ Risk grid {shape} → {grid_path} ({os.path.getsize(grid_path) / 1e6:.1f} MB, "
+          f"{meta['build_seconds']}s)")
+    return grid_path
+
+
+# ---------------------------
+# LOOKUP
+# ---------------------------
+class RiskGrid:
+    def __init__(self, proba, meta):
+        self.proba = proba                          # (beat, month, weekday, hour, class)
+        self.meta = meta
+        self.year = meta["year"]
+        self.classes = meta["classes"]
+        beats = meta["beats"]
+        self.beats = {b: (i, (d, w, c)) for i, (b, d, w, c) in
+                      enumerate(zip(beats["beat"], beats["district"], beats["ward"], beats["community_area"]))}
+        self.model_stamp = meta["model_stamp"]
+        self._checked = (None, 0.0, False)
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(os.path.dirname(path), META_FILE)) as f:
+            meta = json.load(f)
+        proba = np.load(path, mmap_mode="r")
+        if list(proba.shape) != meta["shape"]:
+            raise ValueError(f"{path} has shape {proba.shape}, {META_FILE} says {meta['shape']}")
+        return cls(proba, meta)
+
+    def built_for(self, model_path):
+        """True when the grid was scored with the model file currently at model_path."""
+        path, checked, ok = self._checked
+        now = time.monotonic()
+        if path != model_path or now - checked > CHECK_INTERVAL:
+            try:
+                ok = model_path is not None and _stamp(model_path) == self.model_stamp
+            except OSError:
+                ok = False
+            self._checked = (model_path, now, ok)
+        return ok
+
+    def index(self, year, month, day, hour, beat, district, ward, community_area):
+        """(beat_idx, month-1, weekday, hour) for an on-grid query, else None."""
+        year, month, day, hour = _as_int(year), _as_int(month), _as_int(day), _as_int(hour)
+        if year != self.year or hour is None or not 0 <= hour <= 23:
+            return None
+        hit = self.beats.get(_as_int(beat))
+        if hit is None or hit[1] != (_as_int(district), _as_int(ward), _as_int(community_area)):
+            return None
+        try:
+            dow = datetime.date(year, month, day).weekday()
+        except (TypeError, ValueError):
+            return None
+        return hit[0], month - 1, dow, hour
+
+    def probabilities(self, *query):
+        idx = self.index(*query)
+        if idx is None:
+            return None
+        return dict(zip(self.classes, map(float, self.proba[idx])))
+
+    def predict(self, *query):
+        idx = self.index(*query)
+        if idx is None:
+            return None
+        return self.classes[int(self.proba[idx].argmax())]
+
+
+def live_grid(registry):
+    """The registry's risk grid if it was built for the current crime model, else None."""
+    try:
+        grid = registry.get("risk_grid")
+    except FileNotFoundError:
+        return None
+    return grid if grid.built_for(registry.path("crime_model")) else None
+
+
+def grid_predict(registry, year, month, day, hour, beat, district, ward, community_area):
+    """Crime group from the registry's risk grid, or None when the query is off-grid or the grid is stale/missing."""
+    grid = live_grid(registry)
+    if grid is None:
+        return None
+    return grid.predict(year, month, day, hour, beat, district, ward, community_area)
+
+
+def benchmark(n=2000, model_dir=None):
+    """Per-query time of the grid lookup vs. the model on random on-grid queries."""
+    registry = get_registry(model_dir or MODEL_DIR)
+    grid = registry.get("risk_grid")
+    model = registry.get("crime_model")
+    rng = np.random.default_rng(0)
+    beats = pd.DataFrame(grid.meta["beats"])
+    rows = beats.iloc[rng.integers(len(beats), size=n)]
+    queries = [(grid.year, int(m), int(d), int(h), b, dist, w, c) for m, d, h, (b, dist, w, c) in
+               zip(rng.integers(1, 13, n), rng.integers(1, 29, n), rng.integers(0, 24, n),
+                   rows.itertuples(index=False))]
+
+    from features import feature_vector
+    start = time.perf_counter()
+    for q in queries:
+        grid_predict(registry, *q)
+    grid_us = (time.perf_counter() - start) / n * 1e6
+    start = time.perf_counter()
+    for q in queries[:200]:
+        model.predict(np.array([feature_vector(*q)], dtype=np.float32))
+    model_us = (time.perf_counter() - start) / min(n, 200) * 1e6
+    print(f"Grid lookup {grid_us:.1f} µs/query vs model {model_us:.0f} µs/query")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--year", type=int, help="year the grid is scored for (default: latest in the data)")
+    parser.add_argument("--benchmark", action="store_true", help="time grid lookups against the model")
+    args = parser.parse_args()
+
+    build_risk_grid(args.year)
+    if args.benchmark:
+        benchmark()
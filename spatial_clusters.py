@@ -0,0 +1,207 @@
+# spatial_clusters.py
+# Bounded KMeans fitting, warm starts, chunked nearest-center assignment and
+# center drift tracking for the spatial_cluster column.
+import os
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from scipy.optimize import linear_sum_assignment
+
+METERS_PER_DEG_LAT = 111_320.0
+
+
+# ---------------------------
+# FAST ASSIGNMENT
+# ---------------------------
+def nearest_center(coords, centers, chunk_size=1_000_000):
+    """Index of the closest center for every (lat, lon) row, computed in chunks."""
+    coords = np.asarray(coords, dtype=np.float64)
+    centers = np.asarray(centers, dtype=np.float64)
+
+    # Shift to the centers' mean so the expanded distance keeps its precision
+    origin = centers.mean(axis=0)
+    c = centers - origin
+    c_sq = (c ** 2).sum(axis=1)
+
+    labels = np.empty(len(coords), dtype=np.int32)
+    for start in range(0, len(coords), chunk_size):
+        block = coords[start:start + chunk_size] - origin
+        # |x - c|^2 = |x|^2 - 2 x.c + |c|^2; |x|^2 does not change the argmin
+        dist = c_sq[None, :] - 2.0 * block @ c.T
+        labels[start:start + chunk_size] = dist.argmin(axis=1)
+    return labels
+
+
+# ---------------------------
+# FITTING
+# ---------------------------
+def load_previous_centers(model_path):
+    if not os.path.exists(model_path):
+        return None
+    return joblib.load(model_path).cluster_centers_
+
+
+def fit_spatial_kmeans(coords, n_clusters=30, mode="sample", sample_size=300_000,
+                       init_centers=None, batch_size=8192, random_state=42):
+    """
+    mode="full"      : KMeans on every row (original behaviour)
+    mode="sample"    : KMeans on a bounded random sample
+    mode="minibatch" : MiniBatchKMeans streamed over all rows in batches
+
+    init_centers (e.g. the previous run's centers) warm-starts the fit with
+    a single initialisation instead of n_init restarts.
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    warm = init_centers is not None and len(init_centers) == n_clusters
+    init = np.asarray(init_centers, dtype=np.float64) if warm else "k-means++"
+
+    if mode == "minibatch":
+        kmeans = MiniBatchKMeans(
+            n_clusters=n_clusters, init=init, n_init=1 if warm else 3,
+            batch_size=batch_size, random_state=random_state
+        )
+        rng = np.random.default_rng(random_state)
+        order = rng.permutation(len(coords))
+        for start in range(0, len(order), batch_size * 16):
+            block = coords[np.sort(order[start:start + batch_size * 16])]
+            if len(block) >= n_clusters:
+                kmeans.partial_fit(block)
+        return kmeans
+
+    if mode == "sample" and len(coords) > sample_size:
+        rng = np.random.default_rng(random_state)
+        coords = coords[rng.choice(len(coords), sample_size, replace=False)]
+
+    kmeans = KMeans(n_clusters=n_clusters, init=init, n_init=1 if warm else 10, random_state=random_state)
+    kmeans.fit(coords)
+    return kmeans
+
+
+# ---------------------------
+# STABLE IDS + DRIFT
+# ---------------------------
+def align_centers(new_centers, old_centers):
+    """Permutation of new_centers that best matches old_centers (Hungarian on distance)."""
+    cost = np.linalg.norm(new_centers[:, None, :] - old_centers[None, :, :], axis=2)
+    new_idx, old_idx = linear_sum_assignment(cost)
+    perm = np.empty(len(old_centers), dtype=int)
+    perm[old_idx] = new_idx
+    return perm
+
+
+def center_drift(old_centers, new_centers):
+    """Per-cluster distance moved, in metres (equirectangular approximation)."""
+    d_lat = (new_centers[:, 0] - old_centers[:, 0]) * METERS_PER_DEG_LAT
+    d_lon = (new_centers[:, 1] - old_centers[:, 1]) * METERS_PER_DEG_LAT * np.cos(np.radians(old_centers[:, 0]))
+    return pd.DataFrame({
+        "cluster_id": np.arange(len(old_centers)),
+        "drift_m": np.sqrt(d_lat ** 2 + d_lon ** 2)
+    })
+
+
+def stabilize(kmeans, old_centers, report_path=None):
+    """Re-number clusters to match the previous run and report how far centers moved."""
+    if old_centers is None or len(old_centers) != len(kmeans.cluster_centers_):
+        return None
+
+    perm = align_centers(kmeans.cluster_centers_, old_centers)
+    kmeans.cluster_centers_ = kmeans.cluster_centers_[perm]
+
+    drift = center_drift(old_centers, kmeans.cluster_centers_)
+    print(f"Center drift vs previous run: mean {drift['drift_m'].mean():.0f} m, "
+          f"max {drift['drift_m'].max():.0f} m (cluster {int(drift['drift_m'].idxmax())})")
+
+    if report_path:
+        drift.to_csv(report_path, index=False)
+    return drift
+
+
+# ---------------------------
+# CLUSTER RESOLVER (replaces the RandomForest location model)
+# ---------------------------
+# Chicago bounding box, with margin
+CHICAGO_BBOX = (41.60, 42.05, -87.97, -87.50)
+
+
+class ClusterResolver:
+    """
+    Exact spatial_cluster lookup from the KMeans centers.
+
+    The optional grid stores, per cell, the cluster shared by all four of
+    its corners. Voronoi regions are convex, so such a cell lies entirely in
+    that cluster and the lookup is exact; cells straddling a boundary hold
+    -1 and fall back to the nearest-center search.
+    """
+
+    def __init__(self, centers, grid=None, origin=None, step=None, method="brute"):
+        self.centers = np.asarray(centers, dtype=np.float64)
+        self.grid = grid
+        self.origin = origin
+        self.step = step
+        self.method = method
+        self._tree = None
+
+    @classmethod
+    def from_kmeans(cls, model_path, **kwargs):
+        return cls(joblib.load(model_path).cluster_centers_, **kwargs)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path, allow_pickle=False)
+        if "grid" in data:
+            return cls(data["centers"], data["grid"], tuple(data["origin"]), float(data["step"]))
+        return cls(data["centers"])
+
+    def save(self, path):
+        if self.grid is None:
+            np.savez_compressed(path, centers=self.centers)
+        else:
+            np.savez_compressed(path, centers=self.centers, grid=self.grid,
+                                origin=np.array(self.origin), step=np.array(self.step))
+
+    def build_grid(self, bbox=CHICAGO_BBOX, step=0.001):
+        lat_min, lat_max, lon_min, lon_max = bbox
+        n_lat = int(np.ceil((lat_max - lat_min) / step))
+        n_lon = int(np.ceil((lon_max - lon_min) / step))
+
+        # Labels at the (n_lat+1) x (n_lon+1) cell corners
+        lat_c = lat_min + step * np.arange(n_lat + 1)
+        lon_c = lon_min + step * np.arange(n_lon + 1)
+        corners = np.column_stack([np.repeat(lat_c, len(lon_c)), np.tile(lon_c, len(lat_c))])
+        c = self._exact(corners).reshape(n_lat + 1, n_lon + 1).astype(np.int16)
+
+        same = (c[:-1, :-1] == c[1:, :-1]) & (c[:-1, :-1] == c[:-1, 1:]) & (c[:-1, :-1] == c[1:, 1:])
+        self.grid = np.where(same, c[:-1, :-1], -1).astype(np.int16)
+        self.origin = (lat_min, lon_min)
+        self.step = step
+        return self
+
+    def _exact(self, coords):
+        if self.method == "kdtree":
+            if self._tree is None:
+                from scipy.spatial import cKDTree
+                self._tree = cKDTree(self.centers)
+            return self._tree.query(coords)[1].astype(np.int32)
+        return nearest_center(coords, self.centers)
+
+    def predict(self, lat, lon):
+        lat = np.atleast_1d(np.asarray(lat, dtype=np.float64))
+        lon = np.atleast_1d(np.asarray(lon, dtype=np.float64))
+        if self.grid is None:
+            return self._exact(np.column_stack([lat, lon]))
+
+        i = np.floor((lat - self.origin[0]) / self.step).astype(np.int64)
+        j = np.floor((lon - self.origin[1]) / self.step).astype(np.int64)
+        inside = (i >= 0) & (i < self.grid.shape[0]) & (j >= 0) & (j < self.grid.shape[1])
+
+        labels = np.full(len(lat), -1, dtype=np.int32)
+        labels[inside] = self.grid[i[inside], j[inside]]
+
+        miss = labels < 0
+        if miss.any():
+            labels[miss] = self._exact(np.column_stack([lat[miss], lon[miss]]))
+        return labels
+
+    def predict_one(self, lat, lon):
+        return int(self.predict(lat, lon)[0])
@@ -0,0 +1,124 @@
+# stage_cache.py
+# Fingerprint-based stage cache: a stage is skipped when the hash of its
+# inputs, parameters and code matches the last successful run and its
+# recorded outputs are still on disk, unchanged.
+import os
+import json
+import time
+import hashlib
+
+BASE_DIR = r"D:\crime_project2"
+MANIFEST_FILE = os.path.join(BASE_DIR, "stage_manifest.json")
+
+HASH_BLOCK = 4 * 1024 * 1024
+
+
+class StageCache:
+    def __init__(self, manifest_path=MANIFEST_FILE):
+        self.manifest_path = manifest_path
+        self.manifest = {"stages": {}, "files": {}}
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                self.manifest = json.load(f)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.manifest_path) or ".", exist_ok=True)
+        with open(self.manifest_path + ".tmp", "w") as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        os.replace(self.manifest_path + ".tmp", self.manifest_path)
+
+    # ---------------------------
+    # CONTENT HASHING
+    # ---------------------------
+    def file_digest(self, path):
+        # Content hash, memoized on (size, mtime) so untouched files are never re-read
+        st = os.stat(path)
+        key = os.path.abspath(path)
+        memo = self.manifest["files"].get(key)
+        if memo and memo["size"] == st.st_size and memo["mtime_ns"] == st.st_mtime_ns:
+            return memo["digest"]
+
+        h = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(HASH_BLOCK), b""):
+                h.update(block)
+
+        digest = h.hexdigest()
+        self.manifest["files"][key] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "digest": digest}
+        return digest
+
+    def path_digests(self, path):
+        """{relative file: digest} for a file or every file under a directory (partitions)."""
+        if os.path.isfile(path):
+            return {os.path.basename(path): self.file_digest(path)}
+        if not os.path.isdir(path):
+            return {}
+
+        digests = {}
+        for root, _, files in os.walk(path):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                full = os.path.join(root, name)
+                digests[os.path.relpath(full, path)] = self.file_digest(full)
+        return dict(sorted(digests.items()))
+
+    def fingerprint(self, inputs=(), params=None, code=()):
+        h = hashlib.blake2b(digest_size=16)
+        for path in inputs:
+            h.update(f"in:{path}".encode())
+            for rel, digest in self.path_digests(path).items():
+                h.update(f"{rel}={digest}".encode())
+        h.update(json.dumps(params or {}, sort_keys=True, default=str).encode())
+        for path in code:
+            h.update(f"code:{os.path.basename(path)}={self.file_digest(path)}".encode())
+        return h.hexdigest()
+
+    # ---------------------------
+    # STAGE EXECUTION
+    # ---------------------------
+    def is_fresh(self, name, fp, outputs):
+        rec = self.manifest["stages"].get(name)
+        if not rec or rec["fingerprint"] != fp:
+            return False
+        for path in outputs:
+            if rec["outputs"].get(path) != self.path_digests(path) or not os.path.exists(path):
+                return False
+        return True
+
+    def same_code(self, name, params=None, code=()):
+        """True if the stage last ran with these parameters and this code."""
+        rec = self.manifest["stages"].get(name)
+        return bool(rec) and rec.get("code_fingerprint") == self.fingerprint((), params, code)
+
+    def changed_inputs(self, name, path):
+        """Partitions (files) under `path` that are new or changed since the stage last ran."""
+        rec = self.manifest["stages"].get(name)
+        before = rec["inputs"].get(path, {}) if rec else {}
+        return [rel for rel, digest in self.path_digests(path).items() if before.get(rel) != digest]
+
+    def run(self, name, func, inputs=(), outputs=(), params=None, code=(), force=False):
+        fp = self.fingerprint(inputs, params, code)
+
+        if not force and self.is_fresh(name, fp, outputs):
+            print(f"⏭ {name}: unchanged, reusing cached outputs")
+            self.save()
+            return False
+
+        print(f"▶ {name}: running...")
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+
+        self.manifest["stages"][name] = {
+            "fingerprint": fp,
+            "code_fingerprint": self.fingerprint((), params, code),
+            "inputs": {p: self.path_digests(p) for p in inputs},
+            "outputs": {p: self.path_digests(p) for p in outputs},
+            "params": params or {},
+            "seconds": round(elapsed, 2),
+            "finished_at": time.strftime("%Y-%m-%d %H:%M:%S")
+        }
+        self.save()
+        print(f"✔ {name}: done in {elapsed:.1f}s")
+        return True
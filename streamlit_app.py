@@ -1,5 +1,13 @@
 # full streamlit_app.py replacement (includes previous features + EDA + hotspots)
-import streamlit as st, pandas as pd, os, joblib
+import streamlit as st, pandas as pd, os, time
+import dataset
+import predict
+from category_map import load_lookups, map_crime_group
+from forecast_store import get_forecast, fast_predict
+from grid_hotspots import load_pyramid
+from fast_forecast import forecast_series
+from forecast_prophet import completed
+from count_cube import load_cube, series as cube_series
 # ======= CLUSTER REGION NAME & DESCRIPTION =======
 
 REGION_MAP = {
@@ -65,6 +73,12 @@ HOT_DIR = os.path.join(BASE_DIR, "hotspots")
 for d in [MODEL_DIR, PROPHET_DIR, MAP_DIR, HOT_DIR]:
     os.makedirs(d, exist_ok=True)
 
+# Models load once per process on first use and reload when retrained; predict.py
+# shares the same registry and prediction cache with the app
+predict.MODEL_DIR, predict.PROPHET_DIR = MODEL_DIR, PROPHET_DIR
+predict.CACHE_DB = os.path.join(MODEL_DIR, "prediction_cache.sqlite")
+registry = predict.registry()
+
 
 
 st.title("Machine Learning-Based Crime Prediction and Hotspot Analysis")
@@ -86,55 +100,18 @@ with tabs[0]:
     CommArea = st.number_input("Community Area", value=35, key="pct_commarea")
 
     if st.button("Predict Crime Category", key="pct_button"):
+        # Risk grid -> prediction cache -> LightGBM, same path as predict.predict_crime
         try:
-            model = joblib.load(os.path.join(MODEL_DIR, "lgbm_3groups_model.joblib"))
-            le = joblib.load(os.path.join(MODEL_DIR, "label_encoder.joblib"))
+            label, source = predict.predict_crime_source(Year, Month, Day, Hour, Beat, District, Ward, CommArea)
         except Exception as e:
             st.error("LightGBM model missing. Run train_models.py. " + str(e))
         else:
-
-            # ----- Feature engineering (SAME as preprocess.py) -----
-            import pandas as pd
-            ts = pd.Timestamp(year=Year, month=Month, day=Day)
-            day_of_week = ts.dayofweek
-            is_weekend = 1 if day_of_week >= 5 else 0
-
-            # season
-            if Month in [3,4,5]: season = 1
-            elif Month in [6,7,8]: season = 2
-            elif Month in [9,10,11]: season = 3
-            else: season = 4
-
-            # hour grouping
-            if Hour < 6: hour_group = 0
-            elif Hour < 12: hour_group = 1
-            elif Hour < 18: hour_group = 2
-            else: hour_group = 3
-
-            # hotspot (top beats)
-            TOP_BEATS = [332, 2523, 1933, 224, 1022, 1113, 414, 2023, 1221, 925]
-            hotspot_area = 1 if Beat in TOP_BEATS else 0
-
-            row = pd.DataFrame([{
-                "year": Year,
-                "month": Month,
-                "day": Day,
-                "hour": Hour,
-                "day_of_week": day_of_week,
-                "is_weekend": is_weekend,
-                "season": season,
-                "hour_group": hour_group,
-                "beat": Beat,
-                "district": District,
-                "ward": Ward,
-                "community_area": CommArea,
-                "hotspot_area": hotspot_area
-            }])
-
-            pred = model.predict(row).argmax(axis=1)
-            label = le.inverse_transform(pred)[0]
-
             st.success(f"### 🟦 Predicted Crime Category: **{label}**")
+            stats = predict.crime_cache().stats()
+            load = registry.stats()["crime_model"]["load_seconds"]
+            st.caption(f"Answered from {source} · prediction cache: {stats['size']} entries"
+                       + (f", hit rate {stats['hit_rate']:.0%}" if stats["hit_rate"] is not None else "")
+                       + (f" · model loaded in {load * 1000:.0f} ms" if load else ""))
 
 
 # Tab 1: Predict Location (Spatial Cluster)
@@ -147,27 +124,15 @@ with tabs[1]:
 
     Latitude = st.number_input("Latitude", value=41.8781, format="%.6f", key="loc_lat")
     Longitude = st.number_input("Longitude", value=-87.6298, format="%.6f", key="loc_lon")
-    Beat = st.number_input("Beat", value=111, key="loc_beat")
-    District = st.number_input("District", value=11, key="loc_district")
-    Ward = st.number_input("Ward", value=29, key="loc_ward")
-    CommArea = st.number_input("Community Area", value=35, key="loc_commarea")
 
     if st.button("🔍 Predict Location Cluster", key="loc_predict_btn"):
         try:
-            model = joblib.load(os.path.join(MODEL_DIR, "rf_spatial_location.joblib"))
+            # Exact nearest-center lookup from the KMeans centers (train_location.py)
+            resolver = registry.get("spatial_resolver")
         except Exception as e:
-            st.error("Train the location model first. " + str(e))
+            st.error("Run preprocess.py / train_location.py first. " + str(e))
         else:
-            df = pd.DataFrame([{
-                "latitude": Latitude,
-                "longitude": Longitude,
-                "beat": Beat,
-                "district": District,
-                "ward": Ward,
-                "community_area": CommArea
-            }])
-
-            pred_cluster = int(model.predict(df)[0])
+            pred_cluster = resolver.predict_one(Latitude, Longitude)
 
             # ---- Retrieve Region Name ----
             region_name, region_desc = REGION_MAP.get(pred_cluster, ("Unknown", "No data"))
@@ -200,18 +165,39 @@ with tabs[2]:
     st.header("🔮 Advanced Forecasting (Prophet + Insights)")
 
     # ================================
-    # ACCURACY CARDS (STATIC FROM YOUR RESULTS)
+    # ACCURACY CARDS (FROM THE LATEST BACKTEST, backtest.py)
     # ================================
-    st.subheader("📊 Forecasting Accuracy (Based on Evaluation)")
-
-    col1, col2, col3 = st.columns(3)
-
-    with col1:
-        st.success("**Yearly Accuracy**\n\n⭐ 80.4%")
-    with col2:
-        st.info("**Quarterly Accuracy**\n\n⭐ 66.8%")
-    with col3:
-        st.warning("**Monthly Accuracy**\n\n⭐ 65.0%")
+    st.subheader("📊 Forecasting Accuracy (Rolling-Origin Backtest)")
+
+    metrics_path = os.path.join(PROPHET_DIR, "forecast_metrics.csv")
+    if os.path.exists(metrics_path):
+        metrics = pd.read_csv(metrics_path)
+        if "engine" not in metrics.columns:
+            metrics["engine"] = "prophet"
+
+        def accuracy_text(period):
+            # 100 - mean MAPE over the horizon steps (Prophet)
+            rows = metrics[(metrics["period"] == period) & (metrics["engine"] == "prophet")]
+            if rows.empty:
+                return "not backtested"
+            return f"⭐ {100 - rows['mape'].mean():.1f}% ({int(rows['folds'].max())} folds)"
+
+        col1, col2, col3 = st.columns(3)
+
+        with col1:
+            st.success(f"**Yearly Accuracy**\n\n{accuracy_text('A')}")
+        with col2:
+            st.info(f"**Quarterly Accuracy**\n\n{accuracy_text('Q')}")
+        with col3:
+            st.warning(f"**Monthly Accuracy**\n\n{accuracy_text('M')}")
+
+        with st.expander("Error by forecast horizon"):
+            st.markdown("**Mean MAPE (%) by engine**")
+            st.dataframe(metrics.pivot_table(index="engine", columns="period", values="mape", aggfunc="mean").round(2))
+            st.dataframe(metrics)
+            st.caption(f"Backtest run at {metrics['generated_at'].iloc[0]}")
+    else:
+        st.info("No backtest results yet. Run backtest.py to compute accuracy.")
 
     st.markdown("---")
 
@@ -241,22 +227,45 @@ with tabs[2]:
         key="steps2"
     )
 
+    ENGINE_MAP = {"Prophet": "prophet", "Holt-Winters (fast)": "holt_winters", "Seasonal naive (fast)": "snaive"}
+    engine = ENGINE_MAP[st.selectbox("Forecast engine", list(ENGINE_MAP), key="fc_engine")]
+
+    # Horizons past the precomputed range (or a retrained model) run Prophet here
+    ucol1, ucol2 = st.columns(2)
+    with ucol1:
+        uncertainty = st.selectbox("Interval method (when not precomputed)", ["samples", "analytic", "none"],
+                                   key="fc_uncertainty")
+    with ucol2:
+        n_samples = st.number_input("Uncertainty samples", min_value=10, max_value=1000, value=200, step=10,
+                                    key="fc_samples")
+    compare_full = st.checkbox("Also time a full Prophet predict (1000 samples) for comparison", key="fc_compare")
+
     st.markdown("---")
 
     # =====================================================
     # LOAD AND RUN PROPHET MODEL
     # =====================================================
     if st.button("🔮 Generate Unified Forecast", key="fp_all"):
-        model_path = os.path.join(PROPHET_DIR, f"prophet_{model_key}.joblib")
-
-        if not os.path.exists(model_path):
+        if engine == "prophet" and registry.path(f"prophet_{model_key}") is None:
             st.error(f"Model for {resolution} not found! Run forecast_prophet.py")
         else:
-            model = joblib.load(model_path)
-            future = model.make_future_dataframe(periods=future_steps, freq=freq)
-            forecast = model.predict(future)
+            if engine == "prophet":
+                # Stored forecast for this exact model file if it covers the horizon, else a fast predict
+                forecast, source, seconds = get_forecast(lambda: registry.get(f"prophet_{model_key}"), model_key,
+                                                         int(future_steps), uncertainty, int(n_samples), PROPHET_DIR)
+            else:
+                # Fitted on the spot from the count cube's completed periods; no saved model needed
+                cube = load_cube(BASE_DIR)
+                forecast, seconds = forecast_series(completed(cube_series(freq, cube=cube), cube["day"].max()),
+                                                    int(future_steps), model_key, engine)
+                source = engine
 
             st.success(f"{resolution} Forecast Generated Successfully!")
+            st.caption(f"Served from {source} in {seconds * 1000:.1f} ms")
+            if compare_full and engine == "prophet":
+                _, full_seconds = fast_predict(registry.get(f"prophet_{model_key}"), int(future_steps), freq,
+                                               samples=1000)
+                st.caption(f"Full Prophet predict (1000 samples): {full_seconds * 1000:.1f} ms")
 
             # ================================================
             # INTERACTIVE PLOTLY FORECAST CHART
@@ -320,9 +329,10 @@ with tabs[2]:
             st.subheader("📊 Trend & Seasonal Components")
 
             with st.expander("Show Components"):
-                import matplotlib.pyplot as plt
-                fig2 = model.plot_components(forecast)
-                st.pyplot(fig2)
+                # Straight from the forecast columns (no plot_components re-render)
+                for comp in [c for c in ["trend", "yearly", "weekly"] if c in forecast.columns]:
+                    st.markdown(f"**{comp.title()}**")
+                    st.line_chart(forecast.set_index("ds")[comp])
 
             st.markdown("---")
 
@@ -351,12 +361,35 @@ with tabs[2]:
 # Tab 3: Hotspots & Map
 with tabs[3]:
     st.header("Hotspots & Map")
+
+    # Grid pyramid (grid_hotspots.py): full history, any cell size, answered from the stored counts
+    st.subheader("Grid Hotspots")
+    try:
+        pyramid = load_pyramid(BASE_DIR)
+        # One option per pyramid level, labelled with its actual cell width
+        sizes = [round(pyramid.cell_size(k)) for k in range(len(pyramid.levels))]
+        gcol1, gcol2, gcol3 = st.columns(3)
+        with gcol1:
+            cell_m = st.select_slider("Cell size (m)", sizes, value=sizes[pyramid.level_for(450)], key="grid_m")
+        with gcol2:
+            grid_rank = st.radio("Rank by", ["count", "zscore"], horizontal=True, key="grid_rank")
+        with gcol3:
+            grid_top = st.number_input("Top cells", min_value=5, max_value=200, value=20, key="grid_top")
+        level = sizes.index(cell_m)
+        t0 = time.perf_counter()
+        cells = pyramid.top_cells(level, int(grid_top), grid_rank)
+        st.caption(f"~{cell_m} m cells, ranked in {(time.perf_counter() - t0) * 1000:.1f} ms")
+        st.map(cells, latitude="latitude", longitude="longitude", size="count")
+        st.write(cells[["cell_id", "count", "zscore", "latitude", "longitude"]])
+    except Exception as e:
+        st.info("Grid hotspots unavailable: " + str(e))
+
     if st.button("Compute Hotspots (KMeans) / Generate Map", key="hot_button"):
         try:
             from hotspot_cluster import find_hotspots
             from map_generate import create_heatmap
-            report = find_hotspots(n_clusters=12)
-            create_heatmap()
+            report = find_hotspots(n_clusters=12, base_dir=BASE_DIR)
+            create_heatmap(base_dir=BASE_DIR)
             st.success("Hotspots computed and heatmap generated.")
             st.write(report.head(10))
         except Exception as e:
@@ -372,11 +405,11 @@ with tabs[3]:
 with tabs[4]:
     st.header("Exploratory Data Analysis (Paper-style)")
     if st.button("Load EDA visuals", key="eda_button"):
-        path = os.path.join(BASE_DIR, "cleaned_crimes.csv")
-        if not os.path.exists(path):
-            st.error("cleaned_crimes.csv not found. Run preprocess.py")
+        if not dataset.exists(BASE_DIR):
+            st.error("cleaned dataset not found. Run preprocess.py")
         else:
-            df = pd.read_csv(path)
+            cols = [c for c in ["date", "primary_type", "arrest", "location_group"] if c in dataset.columns(BASE_DIR)]
+            df = dataset.load_crimes(cols, base_dir=BASE_DIR)
             df["date"] = pd.to_datetime(df["date"], errors="coerce")
             st.subheader("Crime by Year")
             fig1 = df.groupby(df["date"].dt.year)["primary_type"].count().sort_index()
@@ -390,6 +423,9 @@ with tabs[4]:
             st.subheader("Top Crime Types")
             top = df["primary_type"].value_counts().head(20)
             st.bar_chart(top)
+            st.subheader("Crime Groups (3 classes)")
+            load_lookups(os.path.join(MODEL_DIR, "category_lookups.json"))
+            st.bar_chart(map_crime_group(df["primary_type"]).value_counts())
             st.subheader("Arrest vs Non-Arrest")
             if "arrest" in df.columns:
                 st.write(df["arrest"].value_counts())
@@ -401,9 +437,8 @@ with tabs[4]:
 with tabs[5]:
     st.header("Data Explorer")
     if st.button("Show sample", key="data_sample"):
-        path = os.path.join(BASE_DIR, "cleaned_crimes.csv")
-        if os.path.exists(path):
-            df = pd.read_csv(path)
-            st.write(df.sample(min(1000, len(df))).reset_index(drop=True))
+        if dataset.exists(BASE_DIR):
+            df = dataset.sample_crimes(1000, base_dir=BASE_DIR)
+            st.write(df.reset_index(drop=True))
         else:
-            st.error("cleaned_crimes.csv not found. Run preprocess.py")
+            st.error("cleaned dataset not found. Run preprocess.py")
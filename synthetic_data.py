@@ -0,0 +1,199 @@
+# synthetic_data.py
+# Offline generator of Chicago-shaped crime records for benchmarks: raw rows
+# in the portal export layout (same columns/date format preprocess.py reads)
+# or a ready cleaned store, at any size, generated chunk by chunk.
+import os
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+BASE_DIR = r"D:\crime_project2"
+
+SIZES = {"100k": 100_000, "1m": 1_000_000, "10m": 10_000_000, "50m": 50_000_000}
+CHUNK_ROWS = 1_000_000
+DATE_FORMAT = "%m/%d/%Y %I:%M:%S %p"      # preprocess.PORTAL_DATE_FORMAT
+
+# ---------------------------
+# DISTRIBUTIONS
+# ---------------------------
+PRIMARY_TYPES = {
+    "THEFT": 0.22, "BATTERY": 0.18, "CRIMINAL DAMAGE": 0.11, "NARCOTICS": 0.08,
+    "ASSAULT": 0.07, "OTHER OFFENSE": 0.06, "BURGLARY": 0.05, "MOTOR VEHICLE THEFT": 0.05,
+    "DECEPTIVE PRACTICE": 0.05, "ROBBERY": 0.04, "CRIMINAL TRESPASS": 0.03,
+    "WEAPONS VIOLATION": 0.02, "OFFENSE INVOLVING CHILDREN": 0.01, "PUBLIC PEACE VIOLATION": 0.01,
+    "CRIM SEXUAL ASSAULT": 0.005, "SEX OFFENSE": 0.005, "HOMICIDE": 0.002,
+    "PROSTITUTION": 0.004, "INTERFERENCE WITH PUBLIC OFFICER": 0.004, "ARSON": 0.002,
+    "KIDNAPPING": 0.001, "STALKING": 0.001, "INTIMIDATION": 0.001,
+}
+LOCATIONS = {
+    "STREET": 0.26, "RESIDENCE": 0.17, "APARTMENT": 0.12, "SIDEWALK": 0.09, "OTHER": 0.04,
+    "PARKING LOT/GARAGE(NON.RESID.)": 0.03, "ALLEY": 0.02, "SMALL RETAIL STORE": 0.02,
+    "RESTAURANT": 0.02, "SCHOOL, PUBLIC, BUILDING": 0.02, "RESIDENCE-GARAGE": 0.02,
+    "VEHICLE NON-COMMERCIAL": 0.02, "RESIDENTIAL YARD (FRONT/BACK)": 0.02,
+    "DEPARTMENT STORE": 0.015, "GROCERY FOOD STORE": 0.015, "GAS STATION": 0.01,
+    "COMMERCIAL / BUSINESS OFFICE": 0.01, "CTA TRAIN": 0.01, "CTA PLATFORM": 0.01,
+    "PARK PROPERTY": 0.01, "BAR OR TAVERN": 0.01, "HOSPITAL BUILDING/GROUNDS": 0.005,
+    "CHA APARTMENT": 0.01, "BANK": 0.005, "": 0.01,
+}
+# Arrest rates differ a lot by type (narcotics arrests are almost always on view)
+ARREST_RATE = {"NARCOTICS": 0.95, "PROSTITUTION": 0.95, "WEAPONS VIOLATION": 0.75,
+               "CRIMINAL TRESPASS": 0.6, "PUBLIC PEACE VIOLATION": 0.6,
+               "INTERFERENCE WITH PUBLIC OFFICER": 0.9}
+
+DISTRICTS = np.array([1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 14, 15, 16, 17, 18, 19, 20, 22, 24, 25])
+YEARS = np.arange(2001, 2026)
+# Volume declined from ~480k/year (2001) to ~240k/year
+YEAR_WEIGHTS = np.linspace(2.0, 1.0, len(YEARS))
+# Summer peak, February low
+MONTH_WEIGHTS = np.array([0.9, 0.8, 0.95, 0.95, 1.05, 1.08, 1.12, 1.12, 1.05, 1.03, 0.95, 0.9])
+# Quiet 4-6am, peaks at noon and early evening
+HOUR_WEIGHTS = np.array([
+    4.5, 3.0, 2.6, 2.1, 1.6, 1.4, 1.8, 2.6, 3.6, 4.2, 4.3, 4.4,
+    5.6, 4.8, 4.9, 5.1, 5.0, 5.2, 5.4, 5.2, 5.1, 4.8, 4.5, 3.9
+])
+
+# City footprint (lat/lon box the blobs are drawn inside)
+CITY_BOX = (41.66, 42.01, -87.82, -87.53)
+N_BLOBS = 80
+
+
+def _p(weights):
+    w = np.asarray(list(weights), dtype=np.float64)
+    return w / w.sum()
+
+
+def make_city(seed=0):
+    """Fixed spatial layout: Gaussian blobs with Zipf-like weights, each tied to a district/ward/community area."""
+    rng = np.random.default_rng(seed)
+    lat_min, lat_max, lon_min, lon_max = CITY_BOX
+    lat = rng.uniform(lat_min, lat_max, N_BLOBS)
+    lon = rng.uniform(lon_min, lon_max, N_BLOBS)
+    # Neighbouring blobs (by latitude) share a district
+    order = np.argsort(np.argsort(-lat + rng.normal(0, 0.03, N_BLOBS)))
+    district = DISTRICTS[(order * len(DISTRICTS)) // N_BLOBS]
+    return pd.DataFrame({
+        "lat": lat,
+        "lon": lon,
+        "spread": rng.uniform(0.004, 0.02, N_BLOBS),
+        "weight": 1.0 / np.arange(1, N_BLOBS + 1) ** 0.8,
+        "district": district,
+        "ward": rng.integers(1, 51, N_BLOBS),
+        "community_area": rng.integers(1, 78, N_BLOBS),
+    })
+
+
+# ---------------------------
+# RAW ROWS
+# ---------------------------
+def generate_raw(n, seed=0, start_id=0, city=None):
+    """n raw rows with the portal's column names and date format."""
+    rng = np.random.default_rng(seed)
+    city = city if city is not None else make_city()
+
+    blob = rng.choice(len(city), n, p=_p(city["weight"]))
+    spread = city["spread"].to_numpy()[blob]
+    lat = city["lat"].to_numpy()[blob] + rng.normal(0, 1, n) * spread
+    lon = city["lon"].to_numpy()[blob] + rng.normal(0, 1, n) * spread * 1.3
+    district = city["district"].to_numpy()[blob]
+    # Beat = district, sector (1-3), beat within sector (1-5): e.g. 1113, 332
+    beat = district * 100 + rng.integers(1, 4, n) * 10 + rng.integers(1, 6, n)
+
+    year = rng.choice(YEARS, n, p=_p(YEAR_WEIGHTS))
+    month = rng.choice(12, n, p=_p(MONTH_WEIGHTS)) + 1
+    days_in_month = pd.DatetimeIndex(pd.to_datetime({"year": year, "month": month, "day": 1})).days_in_month
+    day = (rng.random(n) * days_in_month.to_numpy()).astype(int) + 1
+    hour = rng.choice(24, n, p=_p(HOUR_WEIGHTS))
+    minute = rng.integers(0, 12, n) * 5
+    date = pd.to_datetime({"year": year, "month": month, "day": day, "hour": hour, "minute": minute})
+    # Arrow's strftime is several times faster than pandas' for millions of rows
+    date_text = pc.strftime(pa.array(date.to_numpy().astype("datetime64[s]")), format=DATE_FORMAT)
+
+    types = np.array(list(PRIMARY_TYPES))
+    primary = types[rng.choice(len(types), n, p=_p(PRIMARY_TYPES.values()))]
+    arrest_p = pd.Series(primary).map(ARREST_RATE).fillna(0.12).to_numpy()
+    locations = np.array(list(LOCATIONS))
+
+    df = pd.DataFrame({
+        "id": np.arange(start_id, start_id + n),
+        "date": date_text.to_numpy(zero_copy_only=False),
+        "primary_type": primary,
+        "location_description": locations[rng.choice(len(locations), n, p=_p(LOCATIONS.values()))],
+        "arrest": rng.random(n) < arrest_p,
+        "domestic": rng.random(n) < 0.15,
+        "beat": beat,
+        "district": district,
+        "ward": city["ward"].to_numpy()[blob],
+        "community_area": city["community_area"].to_numpy()[blob],
+        "latitude": lat,
+        "longitude": lon,
+    })
+    # ~1% of records have no geocode, as in the real export
+    missing = rng.random(n) < 0.01
+    df.loc[missing, ["latitude", "longitude"]] = np.nan
+    return df
+
+
+def iter_raw(n, seed=0, chunk_rows=CHUNK_ROWS):
+    city = make_city(seed)
+    for i, start in enumerate(range(0, n, chunk_rows)):
+        yield generate_raw(min(chunk_rows, n - start), seed=seed * 100_003 + i, start_id=start, city=city)
+
+
+def write_raw_csv(n, path, seed=0, chunk_rows=CHUNK_ROWS):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    for i, chunk in enumerate(iter_raw(n, seed, chunk_rows)):
+        chunk.to_csv(path, mode="w" if i == 0 else "a", header=i == 0, index=False)
+    print(f"✔ {n:,} raw rows → {path}")
+    return path
+
+
+# ---------------------------
+# CLEANED STORE (skips preprocess)
+# ---------------------------
+def write_clean_store(n, base_dir, seed=0, chunk_rows=CHUNK_ROWS, n_clusters=30):
+    """Cleaned Parquet store labelled with KMeans fitted on the first chunk (saved like preprocess does)."""
+    import joblib
+    from sklearn.cluster import KMeans
+    from preprocess import normalize_types, clean_chunk
+    from spatial_clusters import nearest_center
+    from dataset import store_path, write_year_partitions
+    from count_cube import build_cube
+
+    out_dir = store_path(base_dir)
+    model_dir = os.path.join(base_dir, "models")
+    os.makedirs(out_dir, exist_ok=True)
+    os.makedirs(model_dir, exist_ok=True)
+
+    kmeans = None
+    for i, chunk in enumerate(iter_raw(n, seed, chunk_rows)):
+        chunk = clean_chunk(normalize_types(chunk))
+        coords = chunk[["latitude", "longitude"]].values
+        if kmeans is None:
+            kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=3).fit(coords[:300_000])
+            joblib.dump(kmeans, os.path.join(model_dir, "kmeans_spatial.joblib"))
+        chunk["spatial_cluster"] = nearest_center(coords, kmeans.cluster_centers_)
+        write_year_partitions(chunk, out_dir, i)
+    print(f"✔ {n:,} cleaned rows → {out_dir}")
+    build_cube(base_dir)
+    return out_dir
+
+
+def parse_size(size):
+    return SIZES.get(str(size).lower()) or int(size)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", default="100k", help="100k, 1m, 10m, 50m or a number")
+    parser.add_argument("--out", default=os.path.join(BASE_DIR, "synthetic"))
+    parser.add_argument("--clean", action="store_true", help="write a cleaned store instead of raw CSV")
+    parser.add_argument("--seed", default=0, type=int)
+    args = parser.parse_args()
+
+    rows = parse_size(args.rows)
+    if args.clean:
+        write_clean_store(rows, args.out, seed=args.seed)
+    else:
+        write_raw_csv(rows, os.path.join(args.out, f"raw_{args.rows}.csv"), seed=args.seed)
@@ -0,0 +1,134 @@
+# data_download.ingest against a local stand-in for the Socrata CSV endpoint
+# that implements the $where/$order/$limit subset ingest uses.
+import io
+import re
+import glob
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pandas as pd
+import pytest
+
+import data_download
+
+WHERE = re.compile(r"updated_on > '([^']*)' OR \(updated_on = '([^']*)' AND id > (\d+)\)")
+
+
+class StandIn:
+    """Paged CSV over HTTP; `records` can be edited between requests."""
+
+    def __init__(self, records):
+        self.records = records
+        self.requests = 0
+        self.on_request = None
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+                body = stand_in.page(params).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/csv")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/resource/crimes.csv"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def page(self, params):
+        self.requests += 1
+        if self.on_request:
+            self.on_request(self)
+        assert params["$order"] == "updated_on, id"
+        df = self.records.assign(_id=self.records["id"].astype(int))
+        if "$where" in params:
+            updated, same, rid = WHERE.fullmatch(params["$where"]).groups()
+            df = df[(df["updated_on"] > updated) | ((df["updated_on"] == same) & (df["_id"] > int(rid)))]
+        df = df.sort_values(["updated_on", "_id"]).head(int(params["$limit"]))
+        buf = io.StringIO()
+        df.drop(columns="_id").to_csv(buf, index=False)
+        return buf.getvalue()
+
+    def close(self):
+        self.server.shutdown()
+
+
+def make_records(n):
+    return pd.DataFrame({
+        "id": [str(i) for i in range(1, n + 1)],
+        "date": [f"{2015 + i % 3}-01-01T00:00:00.000" for i in range(n)],
+        "updated_on": [f"2024-01-01T00:00:{i % 7:02d}.000" for i in range(n)],
+        "primary_type": ["THEFT"] * n,
+    })
+
+
+def stored(store_dir):
+    parts = [data_download.read_partition(p) for p in sorted(glob.glob(os.path.join(store_dir, "year=*.csv")))]
+    return pd.concat(parts, ignore_index=True)
+
+
+@pytest.fixture
+def stand_in():
+    server = StandIn(make_records(103))
+    yield server
+    server.close()
+
+
+def test_full_then_incremental(stand_in, tmp_path):
+    new, changed = data_download.ingest(stand_in.url, str(tmp_path), page_size=10)
+    df = stored(tmp_path)
+    assert (new, changed) == (103, 0)
+    assert sorted(df["id"].astype(int)) == list(range(1, 104))
+
+    # Only records updated after the watermark come back
+    stand_in.records.loc[stand_in.records["id"] == "5", ["updated_on", "primary_type"]] = \
+        ["2024-02-01T00:00:00.000", "BATTERY"]
+    before = stand_in.requests
+    assert data_download.ingest(stand_in.url, str(tmp_path), page_size=10) == (0, 1)
+    assert stand_in.requests - before == 1
+    df = stored(tmp_path)
+    assert len(df) == 103
+    assert df.loc[df["id"] == "5", "primary_type"].item() == "BATTERY"
+
+
+def test_update_during_pass_is_not_skipped(stand_in, tmp_path):
+    # After the first page, a record not yet read is updated: it moves to the
+    # end of the (updated_on, id) order. Offset paging would skip a row here.
+    def bump(server):
+        if server.requests == 2:
+            server.records.loc[server.records["id"] == "50", ["updated_on", "primary_type"]] = \
+                ["2024-03-01T00:00:00.000", "ROBBERY"]
+    stand_in.on_request = bump
+
+    data_download.ingest(stand_in.url, str(tmp_path), page_size=10)
+    df = stored(tmp_path)
+    assert sorted(df["id"].astype(int)) == list(range(1, 104))
+    assert df.loc[df["id"] == "50", "primary_type"].item() == "ROBBERY"
+
+
+def test_crash_between_append_and_index_leaves_no_duplicates(stand_in, tmp_path, monkeypatch):
+    real_save_index = data_download.save_index
+    calls = {"n": 0}
+
+    def dying_save_index(store_dir, index):
+        calls["n"] += 1
+        if calls["n"] == 3:
+            raise KeyboardInterrupt("killed after appending page 3")
+        real_save_index(store_dir, index)
+
+    monkeypatch.setattr(data_download, "save_index", dying_save_index)
+    with pytest.raises(KeyboardInterrupt):
+        data_download.ingest(stand_in.url, str(tmp_path), page_size=10)
+    monkeypatch.setattr(data_download, "save_index", real_save_index)
+
+    data_download.ingest(stand_in.url, str(tmp_path), page_size=10)
+    df = stored(tmp_path)
+    assert not df["id"].duplicated().any()
+    assert sorted(df["id"].astype(int)) == list(range(1, 104))
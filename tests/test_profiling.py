@@ -0,0 +1,39 @@
+# Peak memory per benchmark stage: each stage runs in a spawned process and
+# must report its own peak, not the parent's or a previous stage's.
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from profiling import peak_rss_mb, reset_peak_rss
+
+
+def allocate_and_measure(mb):
+    # Same order as benchmark.run_stage: reset, run the work, read the peak
+    reset_peak_rss()
+    block = np.ones(int(mb * 1e6) // 8)
+    del block
+    return peak_rss_mb()
+
+
+def run_isolated(mb):
+    with ProcessPoolExecutor(1, mp_context=mp.get_context("spawn")) as pool:
+        return pool.submit(allocate_and_measure, mb).result()
+
+
+def test_stages_report_their_own_peak():
+    # The parent's own peak is large, so an inherited figure would show up
+    parent = np.ones(int(400e6) // 8)
+    small, large = run_isolated(10), run_isolated(300)
+    del parent
+
+    assert large - small > 200
+    assert small < 250
+
+
+def test_reset_restarts_the_peak():
+    block = np.ones(int(200e6) // 8)
+    del block
+    high = peak_rss_mb()
+    if reset_peak_rss():
+        assert peak_rss_mb() < high - 100
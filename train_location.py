@@ -1,22 +1,52 @@
 import pandas as pd
-import os, joblib
+import numpy as np
+import os, time, joblib, argparse
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report, accuracy_score
+from dataset import load_crimes, sample_crimes, columns
+from spatial_clusters import ClusterResolver
 
 BASE_DIR = r"D:\crime_project2"
-DATAFILE = os.path.join(BASE_DIR, "cleaned_crimes.csv")
 MODEL_DIR = os.path.join(BASE_DIR, "models")
 os.makedirs(MODEL_DIR, exist_ok=True)
 
-def train_location_model():
-    df = pd.read_csv(DATAFILE)
+KMEANS_FILE = os.path.join(MODEL_DIR, "kmeans_spatial.joblib")
+RESOLVER_FILE = os.path.join(MODEL_DIR, "spatial_resolver.npz")
+RF_FILE = os.path.join(MODEL_DIR, "rf_spatial_location.joblib")
+RF_FEATURES = ["latitude", "longitude", "beat", "district", "ward", "community_area"]
+
+
+# -----------------------------
+# Cluster resolver (default): the KMeans centers + an exact lookup grid
+# -----------------------------
+def build_resolver(grid_step=0.001):
+    if not os.path.exists(KMEANS_FILE):
+        raise ValueError("kmeans_spatial.joblib missing. Run preprocess.py first.")
+
+    resolver = ClusterResolver.from_kmeans(KMEANS_FILE).build_grid(step=grid_step)
+    resolver.save(RESOLVER_FILE)
+    print(f"Saved cluster resolver to {RESOLVER_FILE} "
+          f"({os.path.getsize(RESOLVER_FILE) / 1024:.0f} KB, "
+          f"{(resolver.grid < 0).mean():.1%} boundary cells)")
+    return resolver
+
 
-    if "spatial_cluster" not in df.columns:
+def load_resolver():
+    if os.path.exists(RESOLVER_FILE):
+        return ClusterResolver.load(RESOLVER_FILE)
+    return ClusterResolver.from_kmeans(KMEANS_FILE)
+
+
+# -----------------------------
+# RandomForest (kept for comparison, --rf)
+# -----------------------------
+def train_location_model():
+    if "spatial_cluster" not in columns(BASE_DIR):
         raise ValueError("spatial_cluster missing. Run preprocess.py again with updated version.")
 
-    features = ["latitude", "longitude", "beat", "district", "ward", "community_area"]
-    X = df[features]
+    df = load_crimes(RF_FEATURES + ["spatial_cluster"], base_dir=BASE_DIR)
+    X = df[RF_FEATURES]
     y = df["spatial_cluster"]
 
     X_train, X_test, y_train, y_test = train_test_split(
@@ -37,8 +67,70 @@ def train_location_model():
     print("Spatial Cluster Accuracy:", acc)
     print(classification_report(y_test, preds))
 
-    joblib.dump(model, os.path.join(MODEL_DIR, "rf_spatial_location.joblib"))
+    joblib.dump(model, RF_FILE)
     print("Saved model to", MODEL_DIR)
 
+
+# -----------------------------
+# Benchmark: resolver vs RandomForest
+# -----------------------------
+def _single_latency_ms(func, n=200):
+    times = []
+    for _ in range(n):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times) * 1000)
+
+
+def benchmark(n=200_000):
+    resolver = load_resolver()
+    df = sample_crimes(n, RF_FEATURES + ["spatial_cluster"], base_dir=BASE_DIR)
+    lat = df["latitude"].to_numpy(dtype=np.float64)
+    lon = df["longitude"].to_numpy(dtype=np.float64)
+    truth = df["spatial_cluster"].to_numpy()
+
+    start = time.perf_counter()
+    labels = resolver.predict(lat, lon)
+    batch_s = time.perf_counter() - start
+
+    rows = [{
+        "model": "resolver",
+        "artifact_kb": os.path.getsize(RESOLVER_FILE) / 1024 if os.path.exists(RESOLVER_FILE) else None,
+        "single_ms": _single_latency_ms(lambda: resolver.predict_one(lat[0], lon[0])),
+        "batch_rows_per_s": len(df) / batch_s,
+        "agreement": float((labels == truth).mean()),
+    }]
+
+    if os.path.exists(RF_FILE):
+        model = joblib.load(RF_FILE)
+        X = df[RF_FEATURES]
+        start = time.perf_counter()
+        preds = model.predict(X)
+        batch_s = time.perf_counter() - start
+        rows.append({
+            "model": "random_forest",
+            "artifact_kb": os.path.getsize(RF_FILE) / 1024,
+            "single_ms": _single_latency_ms(lambda: model.predict(X.iloc[:1]), n=20),
+            "batch_rows_per_s": len(df) / batch_s,
+            "agreement": float((preds == truth).mean()),
+        })
+
+    report = pd.DataFrame(rows)
+    report.to_csv(os.path.join(MODEL_DIR, "location_benchmark.csv"), index=False)
+    print(report.to_string(index=False))
+    return report
+
+
 if __name__ == "__main__":
-    train_location_model()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rf", action="store_true", help="also train the RandomForest model")
+    parser.add_argument("--benchmark", action="store_true", help="compare resolver and RandomForest")
+    parser.add_argument("--grid-step", default=0.001, type=float, help="lookup grid cell size in degrees")
+    args = parser.parse_args()
+
+    build_resolver(args.grid_step)
+    if args.rf:
+        train_location_model()
+    if args.benchmark:
+        benchmark()
@@ -1,40 +1,51 @@
 import os
-import joblib
-import pandas as pd
+import json
+import time
+import shutil
+import argparse
+import numpy as np
 import lightgbm as lgb
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder
+from category_map import CRIME_MAPPER, CRIME_GROUPS, map_crime_group, save_lookups
+from dataset import load_crimes, iter_batches, count_rows, store_path
+from features import FEATURES, DERIVED, add_derived_features, feature_matrix
+from stage_cache import StageCache
+from profiling import peak_rss_mb
+from model_registry import save_lgbm, save_labels
 
 BASE_DIR = r"D:\crime_project2"
 MODEL_DIR = os.path.join(BASE_DIR, "models")
 os.makedirs(MODEL_DIR, exist_ok=True)
 
+# Cached LightGBM binary Datasets for full-history training
+LGB_DATA_DIR = os.path.join(MODEL_DIR, "lgb_datasets")
+TRAIN_BIN = os.path.join(LGB_DATA_DIR, "train.bin")
+VALID_BIN = os.path.join(LGB_DATA_DIR, "valid.bin")
+DATASET_META = os.path.join(LGB_DATA_DIR, "meta.json")
+RUN_LOG = os.path.join(MODEL_DIR, "train_runs.jsonl")
+
+PARAMS = {
+    "objective": "multiclass",
+    "num_class": len(CRIME_GROUPS),
+    "learning_rate": 0.05,
+    "num_leaves": 50,
+    "max_depth": -1,
+    "min_data_in_leaf": 40,
+    "feature_fraction": 0.8,
+    "bagging_fraction": 0.8,
+    "bagging_freq": 5,
+    "boosting": "gbdt",
+    "metric": "multi_logloss",
+    "verbosity": -1
+}
+
 # -----------------------------
 # Map crime types into 3 groups
 # -----------------------------
 def map_crime(c):
-    c = str(c).upper()
-
-    violent = [
-        "ASSAULT", "BATTERY", "HOMICIDE", "KIDNAPPING",
-        "CRIMINAL SEXUAL ASSAULT", "SEX OFFENSE",
-        "OFFENSE INVOLVING CHILDREN", "WEAPONS VIOLATION",
-        "DOMESTIC", "PUBLIC PEACE"
-    ]
-
-    property_c = [
-        "THEFT", "BURGLARY", "MOTOR VEHICLE THEFT",
-        "CRIMINAL DAMAGE", "CRIMINAL TRESPASS",
-        "ARSON", "DECEPTIVE PRACTICE", "ROBBERY",
-        "SHOPLIFTING", "VANDALISM"
-    ]
-
-    if any(x in c for x in violent):
-        return "VIOLENT_CRIME"
-    if any(x in c for x in property_c):
-        return "PROPERTY_CRIME"
-    
-    return "OTHER_CRIME"
+    # Scalar helper; whole columns go through category_map.map_crime_group
+    return CRIME_MAPPER.map_value(c)
 
 
 # -----------------------------
@@ -43,14 +54,11 @@ def map_crime(c):
 def prepare_features(df):
     df = df.copy()
 
-    features = [
-        "year","month","day","hour",
-        "day_of_week","is_weekend","season","hour_group",
-        "beat","district","ward","community_area",
-        "hotspot_area"
-    ]
+    # Older cleaned data may predate the derived columns
+    if any(c not in df.columns for c in DERIVED):
+        df = add_derived_features(df)
 
-    X = df[features].fillna(0)
+    X = df[FEATURES].fillna(0)
     y = df["crime_group"].astype(str)
 
     le = LabelEncoder()
@@ -62,16 +70,21 @@ def prepare_features(df):
 # -----------------------------
 # Training
 # -----------------------------
+TRAIN_COLUMNS = [
+    "date", "year", "month", "day", "hour",
+    "beat", "district", "ward", "community_area", "primary_type"
+]
+
+
 def train():
     print("Loading cleaned dataset...")
-    df = pd.read_csv(os.path.join(BASE_DIR, "cleaned_crimes.csv"))
-    df.columns = [c.lower() for c in df.columns]
+    df = load_crimes(TRAIN_COLUMNS, base_dir=BASE_DIR)
 
     print("Mapping crimes into 3 super-groups...")
-    df["crime_group"] = df["primary_type"].apply(map_crime)
+    df["crime_group"] = map_crime_group(df["primary_type"])
 
     print("Sampling 700k rows for training...")
-    df = df.sample(700000, random_state=42)
+    df = df.sample(min(700000, len(df)), random_state=42)
 
     print("Preparing features...")
     X, y, le = prepare_features(df)
@@ -82,28 +95,17 @@ def train():
 
     print("Training LightGBM model...")
 
-    params = {
-        "objective": "multiclass",
-        "num_class": len(set(y)),
-        "learning_rate": 0.05,
-        "num_leaves": 50,
-        "max_depth": -1,
-        "min_data_in_leaf": 40,
-        "feature_fraction": 0.8,
-        "bagging_fraction": 0.8,
-        "bagging_freq": 5,
-        "boosting": "gbdt",
-        "metric": "multi_logloss",
-        "verbosity": -1
-    }
+    params = dict(PARAMS, num_class=len(set(y)))
 
     train_data = lgb.Dataset(X_train, label=y_train)
     test_data = lgb.Dataset(X_test, label=y_test)
 
     model = lgb.train(params, train_data, valid_sets=[test_data], num_boost_round=300)
 
-    joblib.dump(model, os.path.join(MODEL_DIR, "lgbm_3groups_model.joblib"))
-    joblib.dump(le, os.path.join(MODEL_DIR, "label_encoder.joblib"))
+    # Native LightGBM text + JSON classes (see model_registry.py)
+    save_lgbm(model, MODEL_DIR)
+    save_labels(le.classes_, MODEL_DIR)
+    save_lookups(os.path.join(MODEL_DIR, "category_lookups.json"))
 
     print("\n✔ Model Training Complete!")
     print("Classes:", list(le.classes_))
@@ -115,5 +117,160 @@ def train():
     print("Test Accuracy :", (test_pred == y_test).mean())
 
 
+# -----------------------------
+# Full-history training from cached binary Datasets
+# -----------------------------
+SOURCE_COLUMNS = TRAIN_COLUMNS[1:]   # date not needed, derived from year/month/day
+
+
+def source_fingerprint(base_dir=BASE_DIR):
+    # Content hash of the cleaned store; the memo is persisted so unchanged
+    # partitions are not re-read next time
+    cache = StageCache()
+    fp = cache.fingerprint([store_path(base_dir)])
+    cache.save()
+    return fp
+
+
+def build_binary_datasets(base_dir=BASE_DIR, valid_fraction=0.2, batch_size=1_000_000, max_bin=255):
+    """
+    Stream the cleaned store in batches into disk-backed float32 feature
+    matrices, then construct LightGBM Datasets from them and save both in
+    LightGBM's binary format. Only one raw batch is in memory at a time.
+    """
+    os.makedirs(LGB_DATA_DIR, exist_ok=True)
+    start = time.time()
+
+    n = count_rows(base_dir)
+    rng = np.random.default_rng(42)
+    is_valid = rng.random(n) < valid_fraction
+    n_valid = int(is_valid.sum())
+
+    tmp_dir = os.path.join(LGB_DATA_DIR, "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    mm = {
+        "X_train": np.lib.format.open_memmap(os.path.join(tmp_dir, "X_train.npy"), "w+", np.float32, (n - n_valid, len(FEATURES))),
+        "X_valid": np.lib.format.open_memmap(os.path.join(tmp_dir, "X_valid.npy"), "w+", np.float32, (n_valid, len(FEATURES))),
+    }
+    y_train = np.empty(n - n_valid, dtype=np.int8)
+    y_valid = np.empty(n_valid, dtype=np.int8)
+
+    pos, t_pos, v_pos = 0, 0, 0
+    for batch in iter_batches(SOURCE_COLUMNS, batch_size, base_dir):
+        X = feature_matrix(batch)
+        y = map_crime_group(batch["primary_type"]).cat.codes.to_numpy(dtype=np.int8)
+        mask = is_valid[pos:pos + len(batch)]
+
+        nt, nv = int((~mask).sum()), int(mask.sum())
+        mm["X_train"][t_pos:t_pos + nt] = X[~mask]
+        y_train[t_pos:t_pos + nt] = y[~mask]
+        mm["X_valid"][v_pos:v_pos + nv] = X[mask]
+        y_valid[v_pos:v_pos + nv] = y[mask]
+
+        pos, t_pos, v_pos = pos + len(batch), t_pos + nt, v_pos + nv
+        print(f"  featurized {pos:,}/{n:,} rows")
+
+    print("Constructing LightGBM Datasets...")
+    ds_params = {"max_bin": max_bin, "verbosity": -1}
+    train_ds = lgb.Dataset(mm["X_train"], label=y_train, feature_name=FEATURES, params=ds_params)
+    train_ds.save_binary(TRAIN_BIN)
+    valid_ds = lgb.Dataset(mm["X_valid"], label=y_valid, feature_name=FEATURES, reference=train_ds, params=ds_params)
+    valid_ds.save_binary(VALID_BIN)
+
+    del mm, train_ds, valid_ds
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    elapsed = time.time() - start
+    meta = {
+        "source_fingerprint": source_fingerprint(base_dir),
+        "rows": n, "train_rows": n - n_valid, "valid_rows": n_valid,
+        "classes": CRIME_GROUPS, "features": FEATURES, "max_bin": max_bin,
+        "build_seconds": round(elapsed, 2)
+    }
+    with open(DATASET_META, "w") as f:
+        json.dump(meta, f, indent=2)
+
+    print(f"✔ Binary Datasets saved ({n:,} rows, {meta['build_seconds']}s, "
+          f"{n / max(elapsed, 1e-9):,.0f} rows/s)")
+    return meta
+
+
+def load_binary_datasets(base_dir=BASE_DIR, rebuild=False):
+    """Reuse the cached binary Datasets unless the cleaned store has changed."""
+    meta = None
+    if os.path.exists(DATASET_META):
+        with open(DATASET_META) as f:
+            meta = json.load(f)
+
+    stale = meta is None or meta["source_fingerprint"] != source_fingerprint(base_dir)
+    if rebuild or stale or not os.path.exists(TRAIN_BIN):
+        meta = build_binary_datasets(base_dir)
+    else:
+        print(f"Reusing cached binary Datasets ({meta['rows']:,} rows)")
+
+    train_ds = lgb.Dataset(TRAIN_BIN, params={"verbosity": -1})
+    valid_ds = lgb.Dataset(VALID_BIN, reference=train_ds, params={"verbosity": -1})
+    return train_ds, valid_ds, meta
+
+
+def log_run(record):
+    with open(RUN_LOG, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def train_full(params=None, num_boost_round=300, rebuild=False, base_dir=BASE_DIR):
+    """Train on every row of the history from the cached binary Datasets."""
+    start = time.time()
+    train_ds, valid_ds, meta = load_binary_datasets(base_dir, rebuild)
+    load_seconds = time.time() - start
+
+    params = dict(PARAMS, **(params or {}))
+    params["metric"] = ["multi_logloss", "multi_error"]
+
+    print(f"Training LightGBM on {meta['train_rows']:,} rows...")
+    evals = {}
+    t0 = time.time()
+    model = lgb.train(
+        params, train_ds, valid_sets=[valid_ds], valid_names=["valid"],
+        num_boost_round=num_boost_round, callbacks=[lgb.record_evaluation(evals)]
+    )
+    train_seconds = time.time() - t0
+
+    le = LabelEncoder().fit(CRIME_GROUPS)
+    save_lgbm(model, MODEL_DIR)
+    save_labels(le.classes_, MODEL_DIR)
+    save_lookups(os.path.join(MODEL_DIR, "category_lookups.json"))
+
+    record = {
+        "finished_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "rows": meta["train_rows"],
+        "rounds": model.current_iteration(),
+        "dataset_load_seconds": round(load_seconds, 2),
+        "train_seconds": round(train_seconds, 2),
+        "rows_per_second": round(meta["train_rows"] * model.current_iteration() / train_seconds),
+        "peak_rss_mb": peak_rss_mb(),
+        "valid_logloss": evals["valid"]["multi_logloss"][-1],
+        "valid_accuracy": 1 - evals["valid"]["multi_error"][-1],
+        "params": {k: v for k, v in params.items() if k != "metric"}
+    }
+    log_run(record)
+
+    print("\n✔ Model Training Complete!")
+    print("Classes:", list(le.classes_))
+    print(f"Valid Accuracy : {record['valid_accuracy']:.4f}  (logloss {record['valid_logloss']:.4f})")
+    print(f"Throughput     : {record['rows_per_second']:,} row-iterations/s, "
+          f"dataset load {record['dataset_load_seconds']}s, peak RSS {record['peak_rss_mb']} MB")
+    return model, record
+
+
 if __name__ == "__main__":
-    train()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--full", action="store_true", help="train on all rows from cached binary Datasets")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild the binary Datasets")
+    parser.add_argument("--rounds", default=300, type=int)
+    args = parser.parse_args()
+
+    if args.full:
+        train_full(num_boost_round=args.rounds, rebuild=args.rebuild)
+    else:
+        train()
@@ -0,0 +1,197 @@
+# tune_models.py
+# Parallel hyperparameter search for the 3-group LightGBM model:
+# random configurations, successive halving on boosting rounds, early
+# stopping on multi_logloss, all trials reading the cached binary Datasets.
+# The winner goes to models/lgbm_3groups_tuned.txt; --promote also writes it
+# over the production model, which predict/the server/the app then reload.
+import os
+import json
+import time
+import argparse
+import multiprocessing as mp
+import numpy as np
+import pandas as pd
+import lightgbm as lgb
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from category_map import CRIME_GROUPS
+from train_models import PARAMS, MODEL_DIR, TRAIN_BIN, VALID_BIN, load_binary_datasets
+from model_registry import save_lgbm, save_labels
+
+LEADERBOARD_FILE = os.path.join(MODEL_DIR, "tuning_leaderboard.csv")
+BEST_PARAMS_FILE = os.path.join(MODEL_DIR, "best_params.json")
+TUNED_MODEL_FILE = os.path.join(MODEL_DIR, "lgbm_3groups_tuned.txt")
+
+
+# -----------------------------
+# Search space
+# -----------------------------
+def sample_configs(n_trials, seed=42):
+    rng = np.random.default_rng(seed)
+    configs = []
+    for _ in range(n_trials):
+        configs.append({
+            "learning_rate": float(np.exp(rng.uniform(np.log(0.02), np.log(0.3)))),
+            "num_leaves": int(rng.choice([15, 31, 50, 63, 127, 255])),
+            "min_data_in_leaf": int(rng.choice([20, 40, 80, 160, 320])),
+            "feature_fraction": round(float(rng.uniform(0.6, 1.0)), 3),
+            "bagging_fraction": round(float(rng.uniform(0.6, 1.0)), 3),
+            "lambda_l2": round(float(rng.choice([0.0, 0.1, 1.0, 10.0])), 3),
+        })
+    return configs
+
+
+# -----------------------------
+# Worker side (one Dataset load per process, reused by every trial)
+# -----------------------------
+_WORKER = {}
+
+
+def _init_worker(train_bin, valid_bin, threads):
+    _WORKER.update({"train_bin": train_bin, "valid_bin": valid_bin, "threads": threads})
+
+
+def _datasets():
+    if "train" not in _WORKER:
+        train = lgb.Dataset(_WORKER["train_bin"], params={"verbosity": -1}).construct()
+        valid = lgb.Dataset(_WORKER["valid_bin"], reference=train, params={"verbosity": -1}).construct()
+        _WORKER.update({"train": train, "valid": valid})
+    return _WORKER["train"], _WORKER["valid"]
+
+
+def _deadline(deadline):
+    # Stop a running trial once the search's wall-clock budget is spent
+    def callback(env):
+        if time.time() > deadline:
+            raise lgb.callback.EarlyStopException(env.iteration, env.evaluation_result_list)
+    callback.order = 40
+    return callback
+
+
+def run_trial(trial_id, config, rounds, early_stopping_rounds, deadline):
+    start = time.time()
+    train, valid = _datasets()
+
+    params = dict(PARAMS, **config)
+    params.update({"metric": "multi_logloss", "num_threads": _WORKER["threads"], "verbosity": -1})
+
+    evals = {}
+    model = lgb.train(
+        params, train, num_boost_round=rounds,
+        valid_sets=[valid], valid_names=["valid"],
+        callbacks=[
+            lgb.early_stopping(early_stopping_rounds, verbose=False),
+            lgb.record_evaluation(evals),
+            _deadline(deadline),
+        ]
+    )
+    scores = evals["valid"]["multi_logloss"]
+    best_iter = model.best_iteration or len(scores)
+    return {
+        "trial_id": trial_id,
+        "rounds_budget": rounds,
+        "best_iteration": best_iter,
+        "valid_logloss": scores[best_iter - 1],
+        "seconds": round(time.time() - start, 2),
+        "model_str": model.model_to_string(num_iteration=best_iter),
+    }
+
+
+# -----------------------------
+# Successive halving driver
+# -----------------------------
+def search(n_trials=24, workers=None, min_rounds=50, max_rounds=800, eta=3,
+           early_stopping_rounds=30, time_budget=1800, seed=42, rebuild=False, promote=False):
+    """
+    Rung k trains the surviving configs for min_rounds * eta**k rounds and
+    keeps the best 1/eta. Trials run in a process pool; each worker gets
+    cores // workers LightGBM threads so the pool does not oversubscribe.
+    The best model is saved to TUNED_MODEL_FILE; only promote=True replaces
+    the production model with it.
+    """
+    load_binary_datasets(rebuild=rebuild)      # make sure the cached binaries exist
+
+    cores = os.cpu_count() or 1
+    workers = workers or max(1, min(4, cores))
+    threads = max(1, cores // workers)
+    deadline = time.time() + time_budget
+    print(f"Search: {n_trials} trials, {workers} workers x {threads} threads, budget {time_budget}s")
+
+    configs = dict(enumerate(sample_configs(n_trials, seed)))
+    survivors = list(configs)
+    rows, best = [], None
+    rung, rounds = 0, min_rounds
+
+    # spawn: forking after LightGBM/OpenMP are initialised here can deadlock the workers
+    ctx = mp.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=ctx, initializer=_init_worker,
+                             initargs=(TRAIN_BIN, VALID_BIN, threads)) as pool:
+        while survivors and time.time() < deadline:
+            futures = {
+                pool.submit(run_trial, tid, configs[tid], rounds, early_stopping_rounds, deadline): tid
+                for tid in survivors
+            }
+            results = []
+            for fut in as_completed(futures):
+                tid = futures[fut]
+                try:
+                    res = fut.result()
+                except Exception as e:
+                    print(f"  trial {tid} failed: {e}")
+                    continue
+                results.append(res)
+                rows.append(dict(rung=rung, **configs[tid], **{k: v for k, v in res.items() if k != "model_str"}))
+                if best is None or res["valid_logloss"] < best["valid_logloss"]:
+                    best = dict(res, config=configs[tid])
+
+            results.sort(key=lambda r: r["valid_logloss"])
+            print(f"  rung {rung} ({rounds} rounds): best logloss {results[0]['valid_logloss']:.5f}"
+                  if results else f"  rung {rung}: no results")
+
+            # Early-stopped before the budget means more rounds will not help
+            promotable = [r for r in results if r["best_iteration"] >= rounds - early_stopping_rounds]
+            keep = max(1, len(results) // eta)
+            survivors = [r["trial_id"] for r in promotable[:keep]]
+
+            rung, rounds = rung + 1, rounds * eta
+            if rounds > max_rounds or len(results) <= 1:
+                break
+
+    leaderboard = pd.DataFrame(rows).sort_values("valid_logloss").reset_index(drop=True)
+    leaderboard.to_csv(LEADERBOARD_FILE, index=False)
+    print(f"✔ Leaderboard → {LEADERBOARD_FILE}")
+
+    if best is not None:
+        model = lgb.Booster(model_str=best["model_str"])
+        model.save_model(TUNED_MODEL_FILE + ".tmp")
+        os.replace(TUNED_MODEL_FILE + ".tmp", TUNED_MODEL_FILE)
+        with open(BEST_PARAMS_FILE, "w") as f:
+            json.dump(dict(best["config"], num_boost_round=best["best_iteration"]), f, indent=2)
+        print(f"✔ Best trial {best['trial_id']}: logloss {best['valid_logloss']:.5f} "
+              f"at {best['best_iteration']} rounds → {TUNED_MODEL_FILE} + {BEST_PARAMS_FILE}")
+        if promote:
+            # The registry hot-reloads this file into predict, the server and the risk grid
+            save_lgbm(model, MODEL_DIR)
+            save_labels(CRIME_GROUPS, MODEL_DIR)
+            print("✔ Promoted to the production model")
+        else:
+            print("📌 Production model unchanged (use --promote to replace it)")
+
+    return leaderboard
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trials", default=24, type=int)
+    parser.add_argument("--workers", default=None, type=int)
+    parser.add_argument("--min-rounds", default=50, type=int)
+    parser.add_argument("--max-rounds", default=800, type=int)
+    parser.add_argument("--eta", default=3, type=int)
+    parser.add_argument("--budget", default=1800, type=int, help="wall-clock seconds")
+    parser.add_argument("--rebuild", action="store_true")
+    parser.add_argument("--promote", action="store_true", help="write the best model over the production model")
+    args = parser.parse_args()
+
+    lb = search(args.trials, args.workers, args.min_rounds, args.max_rounds, args.eta,
+                time_budget=args.budget, rebuild=args.rebuild, promote=args.promote)
+    print(lb.head(10).to_string())